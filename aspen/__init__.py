@@ -1,5 +1,5 @@
 import sys
-import pkg_resources
+import types
 
 try:                # Python >= 2.6
     from collections import Callable
@@ -16,11 +16,9 @@ from aspen.logging import log, log_dammit
 # Shut up, PyFlakes. I know I'm addicted to you.
 Response, json, is_callable, log, log_dammit
 
-dist = pkg_resources.get_distribution('aspen')
-__version__ = dist.version
 WINDOWS = sys.platform[:3] == 'win'
-NETWORK_ENGINES = ['cheroot', 'cherrypy', 'diesel', 'eventlet', 'gevent',
-                   'pants', 'rocket', 'tornado', 'twisted']
+NETWORK_ENGINES = ['cheroot', 'asyncore', 'cherrypy', 'diesel', 'eventlet',
+                   'gevent', 'pants', 'rocket', 'tornado', 'twisted']
 RENDERERS = ['jinja2',
             'pystache',
             'tornado',
@@ -28,3 +26,32 @@ RENDERERS = ['jinja2',
             'stdlib_percent',
             'stdlib_template'
             ]
+SOCKET_BUFFER_POLICIES = ['block', 'drop_oldest', 'disconnect']
+LOGGING_BUFFER_POLICIES = ['drop_oldest', 'block']
+LOGGING_ACCESS_FORMATS = ['text', 'json']
+
+
+
+# Version
+# =======
+# Importing pkg_resources takes longer than all the rest of aspen put together,
+# so we wait until __version__ is asked for. Python 2 modules can't compute
+# attributes, so we put a module that can in our place in sys.modules.
+
+def get_version():
+    """Return the version of aspen that's installed.
+    """
+    global _version
+    if _version is None:
+        import pkg_resources
+        _version = pkg_resources.get_distribution('aspen').version
+    return _version
+_version = None
+
+class _Aspen(types.ModuleType):
+    __version__ = property(lambda self: get_version())
+
+_aspen = _Aspen(__name__, __doc__)
+_aspen.__dict__.update(globals())
+_aspen._module = sys.modules[__name__] # otherwise our globals become None
+sys.modules[__name__] = _aspen
@@ -0,0 +1,115 @@
+"""Limit how many requests we handle at once, and shed the rest quickly.
+
+When a backend slows down, the engine's worker threads fill up with requests
+waiting on it, and everything behind them waits in the kernel's accept queue,
+where we can't see it and nobody ever gives up. With admission_limit set, at
+most that many requests are handled at once. Past that, up to admission_queue
+more may wait their turn, for at most admission_wait_ms each. Anything beyond
+that, and anything still waiting when its time is up, gets a quick 503 with a
+Retry-After header.
+
+Requests for paths under one of the admission_exempt prefixes skip the line
+altogether, so that health checks and static files keep flowing when the rest
+of the site can't.
+
+Only threaded engines can wait. On evented engines waiting would block the
+event loop, so there a request that can't be admitted right away is shed.
+
+"""
+import math
+import threading
+import time
+
+from aspen.http.response import Response
+
+
+class Admission(object):
+    """Model a gate in front of Website.handle_safely.
+    """
+
+    def __init__(self, website, can_wait=True):
+        """Takes a Website and a boolean, whether requests may wait in line.
+
+        We read our limits off of website each time, so that configuration
+        scripts can change them.
+
+        """
+        self.website = website
+        self.can_wait = can_wait
+        self.lock = threading.Condition()
+        self.in_flight = 0      # requests admitted and not yet done [int]
+        self.queued = 0         # requests waiting to be admitted [int]
+        self.nadmitted = 0      # since we started [int]
+        self.nshed = 0          # since we started [int]
+
+    def enter(self, request):
+        """Given a Request, return a callable to call when it's done.
+
+        If we can't admit request we raise a 503 Response instead.
+
+        """
+        website = self.website
+        if website.admission_exempt:
+            path = request.line.uri.path.raw
+            for prefix in website.admission_exempt:
+                if prefix and path.startswith(prefix):
+                    return lambda: None
+        limit = website.admission_limit
+        self.lock.acquire()
+        try:
+            if limit and self.in_flight >= limit:
+                self.wait(limit)
+            self.in_flight += 1
+            self.nadmitted += 1
+        finally:
+            self.lock.release()
+        return self.leave
+
+    def wait(self, limit):
+        """Given our limit, wait in line for a slot, or shed the request.
+
+        This is called with self.lock held.
+
+        """
+        queue_size = self.can_wait and self.website.admission_queue or 0
+        if self.queued >= queue_size:
+            self.shed()
+        self.queued += 1
+        try:
+            end = time.time() + self.website.admission_wait_ms / 1000.0
+            while self.in_flight >= limit:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    self.shed()
+                self.lock.wait(remaining)
+        finally:
+            self.queued -= 1
+
+    def leave(self):
+        """Free up the slot of a request that's done.
+        """
+        self.lock.acquire()
+        try:
+            self.in_flight -= 1
+            self.lock.notify()
+        finally:
+            self.lock.release()
+
+    def shed(self):
+        """Raise a 503 Response, telling the client when to try again.
+        """
+        self.nshed += 1
+        seconds = math.ceil(self.website.admission_wait_ms / 1000.0)
+        response = Response(503)
+        response.headers['Retry-After'] = str(max(1, int(seconds)))
+        raise response
+
+    def metrics(self):
+        """Return a dictionary of statistics about this gate.
+        """
+        return { 'in_flight': self.in_flight
+               , 'queued': self.queued
+               , 'limit': self.website.admission_limit
+               , 'admitted': self.nadmitted
+               , 'shed': self.nshed
+                }
@@ -8,9 +8,31 @@ Currently:
 	* httpdigest - HTTP DIGEST Auth
 
 """
+from aspen.metrics import REGISTRY
 from aspen.utils import typecheck
 
 
+# Metrics
+# =======
+# See aspen.metrics. An outcome is ok, anonymous (cookie), or else named for
+# the status code of the Response we raise.
+
+ATTEMPTS = REGISTRY.counter( 'aspen_auth_total'
+                           , "Authentication attempts, by scheme and outcome."
+                           , ('scheme', 'outcome')
+                            )
+OUTCOMES = {400: 'bad_request', 401: 'denied', 403: 'forbidden'}
+
+def count(scheme, response):
+    """Given an auth scheme and a Response to raise or None, count it.
+    """
+    if response is None:
+        outcome = 'ok'
+    else:
+        outcome = OUTCOMES.get(response.code, str(response.code))
+    ATTEMPTS.inc((scheme, outcome))
+
+
 class BaseUser(object):
 
     def __init__(self, token):
@@ -38,6 +38,7 @@ def inbound_early(request):
             token = request.headers.cookie[NAME].value
             token = token.decode('US-ASCII')
         request.context['user'] = auth.User(token)
+        auth.ATTEMPTS.inc(('cookie', token is None and 'anonymous' or 'ok'))
 
 
 def outbound_late(response):
@@ -11,11 +11,43 @@ To use:
 
     # install it
     website.hooks.inbound_early.register(auth)
+
+If verify_password is slow, as it should be with a proper password hash
+(bcrypt, scrypt, PBKDF2), pass cache_ttl to remember successful checks for
+that many seconds:
+
+    auth = httpbasic.inbound_responder(my_password_verifier, cache_ttl=300)
+
+We remember an HMAC of each password, under a key that's made fresh each time
+the process starts and never leaves it, not the password itself. When a
+password changes, tell us, so that the old one stops working right away:
+
+    auth.auth.forget(username)      # or auth.auth.forget() for everyone
 """
 
 import base64
+import hmac
+import os
+import threading
+import time
+
+try:
+    from hashlib import sha256
+except ImportError:
+    from sha import new as sha256   # Python 2.4
 
 from aspen import Response
+from aspen.auth import count
+from aspen.metrics import REGISTRY
+from aspen.profiling import constant_time_compare
+from aspen.utils import LRU
+
+
+CACHE = REGISTRY.counter( 'aspen_basic_auth_cache_total'
+                        , "HTTP BASIC Auth verification cache lookups, by "
+                          "result (hit, miss, or expired)."
+                        , ('result',)
+                         )
 
 
 def inbound_responder(*args, **kwargs):
@@ -25,9 +57,11 @@ def inbound_responder(*args, **kwargs):
         """generated request-handling method"""
         request.auth = BAWrapper(auth, request)
         authed, response = auth.authorized(request)
+        count('basic', response)
         if not authed:
             raise response
         return request
+    _.auth = auth
     return _
 
 
@@ -54,7 +88,8 @@ class BAWrapper(object):
 class BasicAuth(object):
     """An HTTP BASIC AUTH handler for Aspen."""
 
-    def __init__(self, verify_password, html=None, realm='protected'):
+    def __init__(self, verify_password, html=None, realm='protected',
+                 cache_ttl=0, cache_maxsize=1000):
         """Constructor for an HTTP BASIC AUTH handler.
 
         :verify_password - a function that, when passed the args
@@ -63,6 +98,10 @@ class BasicAuth(object):
         :html - The HTML page to return along with a 401 'Not
             Authorized' response. Has a reasonable default
         :realm - the name of the auth realm
+        :cache_ttl - seconds to trust a successful verify_password for
+            the same user and password; 0, the default, means never
+        :cache_maxsize - the most users to remember, least recently
+            seen are forgotten first
         """
         failhtml = html or '''Not Authorized. <a href="#">Try again.</a>'''
         self.verify_password = verify_password
@@ -70,6 +109,13 @@ class BasicAuth(object):
         self.fail_401 = Response(401, failhtml, fail_header)
         self.fail_400 = Response(400, failhtml, fail_header)
         self.logging_out = set([])
+        self.cache_ttl = cache_ttl
+        self.cache = None
+        if cache_ttl > 0:
+            self.cache = LRU(cache_maxsize)   # user -> (expires, mac)
+            self.cache_key = os.urandom(32)
+            self.generation = 0     # bumped by forget
+            self.lock = threading.Lock()
 
     def authorized(self, request):
         """Returns whether this request passes BASIC auth or not, and
@@ -97,13 +143,65 @@ class BasicAuth(object):
             #print("logging out, so failing once.")
             self.logging_out.discard(user)
             return False, self.fail_401
+        if self.cache is not None:
+            if self.remembers(user, passwd):
+                return True, None
+            generation = self.generation
         if not self.verify_password(user, passwd):
             #print("wrong password.")
             # wrong password
             # TODO: add a max attempts per timespan to slow down bot attacks
             return False, self.fail_401
+        if self.cache is not None:
+            expires = time.time() + self.cache_ttl
+            mac = self.mac(user, passwd)
+            self.lock.acquire()
+            try:
+                # If forget ran while we were verifying, the password we
+                # checked against may be the old one, so don't remember it.
+                if self.generation == generation:
+                    self.cache[user] = (expires, mac)
+            finally:
+                self.lock.release()
         return True, None
 
+    def mac(self, user, passwd):
+        """Return a keyed hash of user and passwd, for the cache"""
+        message = '%d:%s:%s' % (len(user), user, passwd)
+        return hmac.new(self.cache_key, message, sha256).digest()
+
+    def remembers(self, user, passwd):
+        """Returns whether user and passwd checked out within cache_ttl"""
+        cached = self.cache.get(user)
+        if cached is None:
+            CACHE.inc(('miss',))
+            return False
+        expires, mac = cached
+        if expires < time.time():
+            CACHE.inc(('expired',))
+            self.cache.pop(user)
+            return False
+        if not constant_time_compare(mac, self.mac(user, passwd)):
+            CACHE.inc(('miss',))
+            return False
+        CACHE.inc(('hit',))
+        return True
+
+    def forget(self, user=None):
+        """Forget the cached check for user, or for everyone if user is
+           None. Call this when a password changes.
+        """
+        if self.cache is not None:
+            self.lock.acquire()
+            try:
+                self.generation += 1
+                if user is None:
+                    self.cache.clear()
+                else:
+                    self.cache.pop(user)
+            finally:
+                self.lock.release()
+
     def username(self, request):
         """Returns the username in the current Auth header"""
         header = request.headers.get('Authorization', '')
@@ -119,6 +217,9 @@ class BasicAuth(object):
         """Will force the next auth request (ie. HTTP request) to fail,
             thereby prompting the user for their username/password again
         """
-        self.logging_out.add(self.username(request))
+        user = self.username(request)
+        self.logging_out.add(user)
+        if user is not None:
+            self.forget(user)
         return request
 
@@ -4,12 +4,20 @@
 # from http://www.autopond.com/digestauth.py
 # modified by Paul Jimenez
 
-import random, time, re
+import collections, hmac, os, random, re, threading, time
+
+from aspen.auth import count
+from aspen.profiling import constant_time_compare
 
 try:
-    from hashlib import md5
+    from hashlib import md5, sha1
 except ImportError:
     from md5 import new as md5
+    from sha import new as sha1
+
+
+NONCE_MAXSIZE = 10000   # nonces to remember, at most; see NonceMemory
+BUCKET_SECONDS = 10     # how finely we file nonces by expiry
 
 
 class MalformedAuthenticationHeader(Exception): pass
@@ -73,6 +81,7 @@ def inbound_responder(*args, **kw):
         """generated hook function"""
         request.auth = AspenAuthWrapper(auth, request)
         authed, response = auth.authorized(request)
+        count('digest', response)
         if not authed:
             #print "Response: %s" % repr(response.headers)
             raise response
@@ -149,7 +158,7 @@ class Storage(dict):
 
 class Auth(object):
     """A decorator class implementing digest authentication (RFC 2617)"""
-    def __init__(self,  get_digest,  realm="Protected",  tolerate_ie = True, redirect_url = '/newuser',  unauth_html = None,  nonce_skip = 0,  lockout_time = 20,  nonce_life = 180,  tries=3,  domain=[], http_provider=None):
+    def __init__(self,  get_digest,  realm="Protected",  tolerate_ie = True, redirect_url = '/newuser',  unauth_html = None,  nonce_skip = 0,  lockout_time = 20,  nonce_life = 180,  tries=3,  domain=[], http_provider=None, nonce_secret=None, nonce_maxsize=NONCE_MAXSIZE):
         """Creates a decorator specific to a particular web application.
             get_digest: a function taking the arguments (username, realm), and returning digestauth.digest(username:realm:password), or
                             throwing KeyError if no such user
@@ -162,6 +171,8 @@ class Auth(object):
             nonce_life: number of seconds a nonce remains valid
             tries: number of tries a user gets to enter a correct password before the account is locked for lockout_time seconds
             http_provider: interface to HTTP protocol workings (see above code)
+            nonce_secret: if given, sign nonces with this instead of remembering them, so that several workers can check each other's (see SignedNonces)
+            nonce_maxsize: the most nonces to remember at once, if we're not signing them (see NonceMemory)
         """
         self.http_provider = http_provider
         if self.http_provider is None:
@@ -169,10 +180,14 @@ class Auth(object):
         self.get_digest,  self.realm,  self.tolerate_ie  = (get_digest,  realm,  tolerate_ie)
         self.lockout_time,  self.tries,  self.nonce_life,  self.domain = (lockout_time,  tries - 1,  nonce_life,  domain)
         self.unauth_html = unauth_html or self._default_401_html.replace("$redirecturl",  redirect_url)
-        self.outstanding_nonces = NonceMemory()
+        if nonce_secret is not None:
+            self.outstanding_nonces = SignedNonces(nonce_secret)
+            self.opaque = self.outstanding_nonces.sign("opaque", 32)
+        else:
+            self.outstanding_nonces = NonceMemory(nonce_maxsize)
+            self.opaque = "%032x" % random.getrandbits(128)
         self.outstanding_nonces.set_nonce_skip(nonce_skip)
         self.user_status = {}
-        self.opaque = "%032x" % random.getrandbits(128)
 
     _default_401_html = """
 <!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
@@ -367,46 +382,167 @@ def parse_auth_header(header):
             result[g['var']] = g['value']
     return result
 
-class NonceMemory(dict):
+class NonceMemory(object):
     """
-    A dict of in-use nonces, with a couple methods to create new nonces and get the state of a nonce
+    The nonces we've handed out, with a couple methods to create new nonces and get the state of a nonce
+
+    Nonces are filed in buckets by when they expire, BUCKET_SECONDS apart, so
+    forgetting the expired ones is a matter of dropping whole buckets off the
+    front of a queue, which we do each time we hand out a nonce. Past maxsize
+    we forget the oldest nonces early, so that a crawler collecting 401s can't
+    grow us without bound.
+
+    Each nonce starts with its expiry time in hex. A client that sends back a
+    nonce we don't remember but that hasn't expired (we forgot it early, or
+    we restarted) gets a fresh challenge rather than a 400.
     """
 
     NONCE_VALID = 1
     NONCE_INVALID = 2
     NONCE_OLD = 3
 
+    def __init__(self, maxsize=NONCE_MAXSIZE):
+        self.maxsize = maxsize
+        self.nonce_skip = 1
+        self.nonces = {}                    # nonce -> (expires, nonce count)
+        self.buckets = {}                   # bucket -> deque of nonces
+        self.queue = collections.deque()    # buckets, oldest first
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.nonces)
+
+    def __contains__(self, nonce):
+        return nonce in self.nonces
+
     def set_nonce_skip(self, nonce_skip):
         self.nonce_skip = nonce_skip
 
     def get_new_nonce(self,  lifespan = 180):
         """Generate a new, unused nonce, with a nonce-count set to 1.
             :lifespan - how long (in seconds) the nonce is good for before it's considered 'old'
+
+        The nonce is 34 lowercase hex digits: 8 of expiry time, and 26 from
+        os.urandom, so it's unused without our having to check.
         """
-        is_new = False
-        while not is_new:
-            nonce = "%034x" % random.getrandbits(136)  # a random 136-bit zero-padded lowercase hex string
-            is_new = not nonce in self
-        self[nonce] = (time.time() + lifespan, 1)
+        now = time.time()
+        expires = now + lifespan
+        nonce = "%08x" % int(expires) + os.urandom(13).encode('hex')
+        bucket = int(expires // BUCKET_SECONDS)
+        self.lock.acquire()
+        try:
+            self.sweep(now)
+            if self.queue and bucket < self.queue[-1]:
+                bucket = self.queue[-1]     # a shorter lifespan; keep order
+            if bucket not in self.buckets:
+                self.buckets[bucket] = collections.deque()
+                self.queue.append(bucket)
+            self.buckets[bucket].append(nonce)
+            self.nonces[nonce] = (expires, 1)
+            while len(self.nonces) > self.maxsize:
+                self.forget_oldest()
+        finally:
+            self.lock.release()
         return nonce
 
+    def sweep(self, now):
+        """Forget nonces in buckets that expired before now.
+        """
+        while self.queue and (self.queue[0] + 1) * BUCKET_SECONDS <= now:
+            for nonce in self.buckets.pop(self.queue.popleft()):
+                del self.nonces[nonce]
+
+    def forget_oldest(self):
+        """Forget the oldest nonce, ahead of its time.
+        """
+        oldest = self.buckets[self.queue[0]]
+        del self.nonces[oldest.popleft()]
+        if not oldest:
+            del self.buckets[self.queue.popleft()]
+
+    def nonce_state(self, req_header_dict):
+        """ 1 = nonce valid, proceed; 2 = nonce totally invalid;  3 = nonce requires refreshing """
+        nonce = req_header_dict.get('nonce', None)
+        self.lock.acquire()
+        try:
+            exp_time, nCount = self.nonces.get(nonce, (0, 0) )
+            if exp_time == 0:
+                if expires_of(nonce) > time.time():
+                    # Client sent a nonce we've forgotten, but it's not out of date; give them a new one
+                    return self.NONCE_OLD
+                # Client sent some totally unknown nonce -- reject
+                return self.NONCE_INVALID
+            try:
+                incoming_nc = int((req_header_dict['nc']), 16)
+            except ValueError:
+                return self.NONCE_INVALID # the "nc" field was deformed (not hexadecimal); reject
+            if exp_time == 1 or nCount > 1000 or exp_time < time.time() or incoming_nc - nCount > self.nonce_skip:
+                # Client sent good nonce, but it is too old, or the count has gotten screwed up; give them a new one
+                # (we mark it rather than delete it, so it's still in its bucket)
+                self.nonces[nonce] = (1, 0)
+                return self.NONCE_OLD
+            self.nonces[nonce] = (exp_time, incoming_nc + 1)
+            return self.NONCE_VALID
+        finally:
+            self.lock.release()
+
+
+class SignedNonces(object):
+    """
+    Nonces that carry their own expiry time, signed with a secret, so that we needn't remember them
+
+    Any worker with the same secret (another process from aspen.prefork,
+    another machine) can check a nonce that this one handed out. The price
+    is that we can't keep nonce counts, so a captured Authorization header
+    can be replayed, for the same method and URI, until its nonce expires.
+    Keep nonce_life short.
+    """
+
+    NONCE_VALID = NonceMemory.NONCE_VALID
+    NONCE_INVALID = NonceMemory.NONCE_INVALID
+    NONCE_OLD = NonceMemory.NONCE_OLD
+
+    def __init__(self, secret):
+        self.secret = secret
+
+    def set_nonce_skip(self, nonce_skip):
+        pass    # we don't keep counts
+
+    def sign(self, message, length=18):
+        """Return the first length hex digits of an HMAC of message."""
+        return hmac.new(self.secret, message, sha1).hexdigest()[:length]
+
+    def get_new_nonce(self, lifespan = 180):
+        """Generate a new nonce, good for lifespan seconds.
+
+        The nonce is 34 lowercase hex digits: 8 of expiry time, 8 of salt
+        from os.urandom, and 18 of signature.
+        """
+        unsigned = "%08x" % int(time.time() + lifespan) \
+                 + os.urandom(4).encode('hex')
+        return unsigned + self.sign(unsigned)
+
     def nonce_state(self, req_header_dict):
         """ 1 = nonce valid, proceed; 2 = nonce totally invalid;  3 = nonce requires refreshing """
         nonce = req_header_dict.get('nonce', None)
-        exp_time, nCount = self.get(nonce, (0, 0) )
-        if exp_time == 0:
-            # Client sent some totally unknown nonce -- reject
+        if nonce is None or not nonce_re.match(nonce):
+            return self.NONCE_INVALID
+        nonce = str(nonce)
+        if not constant_time_compare(nonce[16:], self.sign(nonce[:16])):
             return self.NONCE_INVALID
         try:
-            incoming_nc = int((req_header_dict['nc']), 16)
+            int((req_header_dict['nc']), 16)
         except ValueError:
             return self.NONCE_INVALID # the "nc" field was deformed (not hexadecimal); reject
-        # default nonce_skip value
-        nonce_skip = getattr(self, 'nonce_skip', 1)
-        if exp_time == 1 or nCount > 1000 or exp_time < time.time() or incoming_nc - nCount > nonce_skip:
-            # Client sent good nonce, but it is too old, or the count has gotten screwed up; give them a new one
-            del self[nonce]
+        if expires_of(nonce) < time.time():
             return self.NONCE_OLD
-        self[nonce] = (exp_time, incoming_nc + 1)
         return self.NONCE_VALID
 
+
+nonce_re = re.compile(r'^[0-9a-f]{34}$')
+
+def expires_of(nonce):
+    """Given a nonce, return the expiry time it starts with, or 0."""
+    if nonce is None or not nonce_re.match(nonce):
+        return 0
+    return int(nonce[:8], 16)
@@ -0,0 +1,245 @@
+"""Benchmark Aspen's request pipeline.
+
+    $ aspen-bench                           # run everything
+    $ aspen-bench dispatch resources.get    # run benchmarks matching these
+    $ aspen-bench --save=baseline.json      # run, and save the results
+    $ aspen-bench --compare=baseline.json   # run, and compare to a baseline
+
+Each benchmark builds a synthetic site under aspen.testing.fsfix.FSFIX and
+then times one step of handling a request over and over for a fixed number of
+seconds. We report operations per second and the 50th, 90th, and 99th
+percentile of the time one operation takes, in microseconds.
+
+Many of the steps take only a few microseconds, which is about what it costs
+to read the clock, so we time them in batches: we double the batch size until
+a batch takes at least MIN_SAMPLE seconds, and take the mean of each batch as
+one sample. The percentiles are therefore percentiles of batch means, which
+understate the tail for the fastest benchmarks. The end-to-end benchmarks are
+slow enough to be timed one call at a time.
+
+With --compare, a benchmark whose throughput dropped by more than --tolerance
+percent from the baseline is flagged as a regression, and we exit with status
+1. Baselines are only comparable on the same machine and Python.
+
+The benchmarks themselves are in aspen.bench.cases. To compare network engines
+under load end to end, see aspen.bench.engines (aspen-load).
+
+"""
+import optparse
+import platform
+import sys
+import time
+from timeit import default_timer as clock
+
+import aspen
+
+
+MIN_SAMPLE = 0.0005     # seconds a batch must take
+MAX_BATCH = 2 ** 16
+WARMUP = 0.1            # seconds to run a benchmark before timing it
+
+
+# Registry
+# ========
+
+BENCHMARKS = []         # (name, setup), in the order they were registered
+
+def benchmark(name):
+    """Given a name, return a decorator that registers a benchmark.
+
+    The decorated function sets up the benchmark and returns a callable that
+    takes no arguments: that callable is what we time.
+
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+# Timing
+# ======
+
+def percentile(samples, p):
+    """Given a sorted list and a number from 0 to 100, return a sample.
+    """
+    index = int(round(p / 100.0 * (len(samples) - 1)))
+    return samples[index]
+
+def measure(func, seconds):
+    """Given a callable and a number of seconds, return a dictionary.
+    """
+
+    # Warm up and calibrate.
+    # ======================
+
+    end = clock() + WARMUP
+    while clock() < end:
+        func()
+    batch = 1
+    while batch < MAX_BATCH:
+        start = clock()
+        for i in xrange(batch):
+            func()
+        if clock() - start >= MIN_SAMPLE:
+            break
+        batch *= 2
+
+
+    # Time it.
+    # ========
+
+    samples = []
+    total = 0.0
+    end = clock() + seconds
+    while not samples or clock() < end:
+        start = clock()
+        for i in xrange(batch):
+            func()
+        elapsed = clock() - start
+        total += elapsed
+        samples.append(elapsed / batch)
+    samples.sort()
+    return { 'ops': len(samples) * batch / total
+           , 'p50': percentile(samples, 50) * 1e6
+           , 'p90': percentile(samples, 90) * 1e6
+           , 'p99': percentile(samples, 99) * 1e6
+           , 'batch': batch
+           , 'samples': len(samples)
+            }
+
+def run(names=(), seconds=1.0, out=sys.stdout):
+    """Given a list of substrings and a number of seconds, run benchmarks.
+
+    We run the benchmarks whose names contain any of the substrings (or all of
+    them if there aren't any), and return a dictionary of results by name.
+    Benchmarks that can't run here (say, for a renderer whose library isn't
+    installed) are skipped.
+
+    """
+    from aspen.bench import cases
+    from aspen.testing import fsfix
+
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and not [n for n in names if n in name]:
+            continue
+        fsfix.teardown()
+        try:
+            try:
+                func = setup()
+            except Skip, skip:
+                print >> out, "%-40s skipped: %s" % (name, skip.args[0])
+                continue
+            results[name] = result = measure(func, seconds)
+        finally:
+            fsfix.teardown()
+        print >> out, format_result(name, result)
+        out.flush()
+    return results
+
+def format_result(name, result):
+    return ("%-40s %12.0f ops/s  p50 %9.1f  p90 %9.1f  p99 %9.1f us"
+            % ( name, result['ops']
+              , result['p50'], result['p90'], result['p99']
+               ))
+
+
+class Skip(Exception):
+    """Raise this from a benchmark's setup when it can't run here.
+    """
+
+
+# Baselines
+# =========
+
+def save(results, filepath):
+    """Given a dictionary of results and a filepath, write a baseline.
+    """
+    baseline = { 'aspen': aspen.__version__
+               , 'python': platform.python_version()
+               , 'platform': platform.platform()
+               , 'time': time.time()
+               , 'results': results
+                }
+    fp = open(filepath, 'w+')
+    try:
+        fp.write(aspen.json.dumps(baseline, indent=2, sort_keys=True))
+    finally:
+        fp.close()
+
+def load(filepath):
+    """Given a filepath, return the results in a baseline.
+    """
+    return aspen.json.loads(open(filepath).read())['results']
+
+def compare(baseline, results, tolerance=10, out=sys.stdout):
+    """Given two dictionaries of results and a percentage, report changes.
+
+    Return a list of the names of benchmarks that regressed.
+
+    """
+    regressed = []
+    for name in sorted(results):
+        if name not in baseline:
+            print >> out, "%-40s new" % name
+            continue
+        before = baseline[name]['ops']
+        after = results[name]['ops']
+        change = (after - before) / before * 100
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print >> out, ("%-40s %12.0f -> %12.0f ops/s  %+6.1f%%%s"
+                       % (name, before, after, change, flag))
+    return regressed
+
+
+# Command line
+# ============
+
+def main(argv=None):
+    """Run benchmarks from the command line. See the module docstring.
+    """
+    parser = optparse.OptionParser(usage="aspen-bench [options] [names]")
+    parser.add_option( "-s", "--seconds", type="float", default=1.0
+                     , help="how long to time each benchmark [1.0]"
+                      )
+    parser.add_option( "--save", metavar="FILE"
+                     , help="write the results to FILE as a JSON baseline"
+                      )
+    parser.add_option( "--compare", metavar="FILE"
+                     , help="compare the results to the baseline in FILE"
+                      )
+    parser.add_option( "--tolerance", type="float", default=10.0
+                     , help=("the drop in throughput, in percent, past which "
+                             "--compare calls it a regression [10]")
+                      )
+    parser.add_option( "-l", "--list", action="store_true", default=False
+                     , help="list the benchmarks and exit"
+                      )
+    opts, names = parser.parse_args(argv)
+
+    if opts.list:
+        from aspen.bench import cases
+        for name, setup in BENCHMARKS:
+            if not names or [n for n in names if n in name]:
+                print name
+        return 0
+
+    results = run(names, opts.seconds)
+    if opts.save:
+        save(results, opts.save)
+    if opts.compare:
+        print
+        regressed = compare(load(opts.compare), results, opts.tolerance)
+        if regressed:
+            print
+            print "%d benchmarks regressed." % len(regressed)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""The benchmarks run by aspen-bench.
+
+Each one builds whatever site it needs with mk, and returns the callable to
+time. See aspen.bench for how they're run.
+
+"""
+import itertools
+import os
+
+import aspen
+from aspen import dispatcher, resources, Response
+from aspen.bench import benchmark, Skip
+from aspen.http.request import Request
+from aspen.sockets import packet
+from aspen.sockets.message import Message
+from aspen.testing import sitegen, StubWSGIRequest
+from aspen.testing.fsfix import FSFIX, mk
+from aspen.website import Website
+
+
+def Site(*argv):
+    """Return a Website for FSFIX. Call mk first.
+    """
+    return Website(['--www_root', FSFIX] + list(argv))
+
+def StubRequest(website, path='/'):
+    """Given a Website and a URL path, return a Request for it.
+    """
+    request = Request.from_wsgi(StubWSGIRequest(path))
+    request.website = website
+    request.context = {}
+    return request
+
+def Responder(path, *files):
+    """Given a URL path and files to mk, return a callable to time.
+
+    The callable has a compiled resource respond to a request for path.
+
+    """
+    mk(*files)
+    website = Site()
+    request = StubRequest(website, path)
+    dispatcher.dispatch(request)
+    resource = resources.get(request)
+    return lambda: resource.respond(request)
+
+
+# Requests
+# ========
+
+@benchmark('request.from_wsgi')
+def request_from_wsgi():
+    environ = StubWSGIRequest('/foo/bar.html')
+    environ['QUERY_STRING'] = 'baz=buz&bloo=blah'
+    environ['HTTP_ACCEPT'] = 'text/html,application/xhtml+xml,*/*;q=0.8'
+    environ['HTTP_COOKIE'] = 'session=deadbeef; theme=dark'
+    return lambda: Request.from_wsgi(environ)
+
+
+# Dispatch
+# ========
+# Deep: ten levels of directories, every other one a wildcard. Wide: one
+# directory with five hundred files and a few wildcards among them.
+
+DEEP = ['%a', 'b', '%c.int', 'd', '%e', 'f', '%g', 'h', '%i', 'j']
+DEEP_PATH = '/a/b/3/d/e/f/g/h/i/j/index.html'
+
+def deep():
+    mk((os.path.join(*(DEEP + ['index.html'])), "Greetings, program!"))
+
+def wide():
+    files = [('file%03d.html' % i, "Greetings, program!") for i in range(500)]
+    files += [ ('%name.txt', "Greetings, program!")
+             , ('%id.html', "Greetings, program!")
+             , ('%dir/index.html', "Greetings, program!")
+              ]
+    mk(*files)
+
+def Dispatcher(path, *argv):
+    website = Site(*argv)
+    request = StubRequest(website, path)
+    return lambda: dispatcher.dispatch(request)
+
+@benchmark('dispatch.deep')
+def dispatch_deep():
+    deep()
+    return Dispatcher(DEEP_PATH, '--dispatch_cache_size', '0')
+
+@benchmark('dispatch.deep.cached')
+def dispatch_deep_cached():
+    deep()
+    return Dispatcher(DEEP_PATH)
+
+@benchmark('dispatch.wide')
+def dispatch_wide():
+    wide()
+    return Dispatcher('/file250.html', '--dispatch_cache_size', '0')
+
+@benchmark('dispatch.wide.wildcard')
+def dispatch_wide_wildcard():
+    wide()
+    return Dispatcher('/42.html', '--dispatch_cache_size', '0')
+
+@benchmark('dispatch.wide.cached')
+def dispatch_wide_cached():
+    wide()
+    return Dispatcher('/file250.html')
+
+@benchmark('dispatch.wide.404')
+def dispatch_wide_404():
+    wide()
+    return Dispatcher('/nope/nope.html', '--dispatch_cache_size', '0')
+
+
+# Resource cache
+# ==============
+
+SIMPLATE = """\
+import random
+^L
+program = random.choice(['program'])
+^L text/html
+<h1>Greetings, {{ program }}!</h1>
+^L text/plain
+Greetings, {{ program }}!
+""".replace('^L', '\x0c')
+
+def ResourceGetter(clear):
+    mk(('index', SIMPLATE))
+    website = Site()
+    request = StubRequest(website, '/')
+    dispatcher.dispatch(request)
+    def get():
+        if clear:
+            resources.__cache__.clear()
+        resources.get(request)
+    return get
+
+@benchmark('resources.get.hit')
+def resources_get_hit():
+    return ResourceGetter(clear=False)
+
+@benchmark('resources.get.miss')
+def resources_get_miss():
+    return ResourceGetter(clear=True)
+
+
+# Resource types
+# ==============
+
+@benchmark('respond.static')
+def respond_static():
+    return Responder('/foo.css', ('foo.css', "body { color: red; }\n" * 50))
+
+@benchmark('respond.rendered')
+def respond_rendered():
+    return Responder('/foo.html', ( 'foo.html'
+                                  , "program = 'program'\x0c"
+                                    "Greetings, {{ program }}!"
+                                   ))
+
+@benchmark('respond.negotiated')
+def respond_negotiated():
+    return Responder('/foo', ('foo', SIMPLATE))
+
+@benchmark('respond.json')
+def respond_json():
+    return Responder('/foo.json', ( 'foo.json'
+                                  , "\x0cresponse.body = {'foo': range(100)}"
+                                   ))
+
+
+# Renderers
+# =========
+
+TEMPLATES = { 'jinja2': "{% for i in items %}{{ i }} {% endfor %}{{ name }}"
+            , 'pystache': "{{#items}}{{.}} {{/items}}{{name}}"
+            , 'tornado': "{% for i in items %}{{ i }} {% end %}{{ name }}"
+            , 'stdlib_format': "{items} {name}"
+            , 'stdlib_percent': "%(items)s %(name)s"
+            , 'stdlib_template': "$items $name"
+             }
+
+def Renderer(name):
+    mk()
+    website = Site()
+    factory = website.renderer_factories[name]
+    if isinstance(factory, ImportError):
+        raise Skip(factory.args[0])
+    render = factory(os.path.join(FSFIX, 'index.html'), TEMPLATES[name])
+    context = {'items': range(20), 'name': 'program'}
+    return lambda: render(context)
+
+for name in aspen.RENDERERS:
+    benchmark('render.' + name)(lambda name=name: Renderer(name))
+
+
+# JSON
+# ====
+
+PAYLOAD = { 'users': [ { 'id': i
+                       , 'name': u'user %d' % i
+                       , 'email': 'user%d@example.com' % i
+                       , 'score': i * 1.5
+                       , 'tags': ['foo', 'bar']
+                       , 'active': i % 2 == 0
+                        } for i in range(50)]
+          , 'total': 50
+           }
+
+@benchmark('json.dumps')
+def json_dumps():
+    return lambda: aspen.json.dumps(PAYLOAD)
+
+@benchmark('json.loads')
+def json_loads():
+    encoded = aspen.json.dumps(PAYLOAD)
+    return lambda: aspen.json.loads(encoded)
+
+
+# Metrics
+# =======
+
+@benchmark('metrics.observe')
+def metrics_observe():
+    mk(('index.html', "Greetings, program!"))
+    website = Site('--metrics_path', '/_metrics')
+    request = StubRequest(website, '/')
+    dispatcher.dispatch(request)
+    response = Response(200)
+    return lambda: website.metrics.observe(request, response)
+
+
+# Socket.IO
+# =========
+
+MESSAGES = [ Message(3, '', '', 'Greetings, program!')
+           , Message(4, '', '', {'foo': range(10)})
+           , Message(5, '', '', {'name': 'bar', 'args': ['baz']})
+            ] * 10
+
+@benchmark('sockets.packet.encode')
+def sockets_packet_encode():
+    return lambda: packet.encode(MESSAGES)
+
+@benchmark('sockets.packet.decode')
+def sockets_packet_decode():
+    encoded = packet.encode(MESSAGES)
+    return lambda: [str(m) for m in packet.decode(encoded)]
+
+
+# End to end
+# ==========
+
+def WSGI(path, *files):
+    """Given a URL path and files to mk, return a callable to time.
+
+    The callable makes a WSGI call to a Website, and reads the whole body.
+
+    """
+    mk(*files)
+    return Caller(Site(), [path])
+
+def Caller(website, paths):
+    """Given a Website and URL paths, return a callable that calls it.
+
+    Each call is for the next path, round and round.
+
+    """
+    paths = itertools.cycle(paths)
+    start_response = lambda status, headers: None
+    def call():
+        environ = StubWSGIRequest(paths.next())
+        ''.join(website(environ, start_response))
+    return call
+
+@benchmark('wsgi.static')
+def wsgi_static():
+    return WSGI('/foo.css', ('foo.css', "body { color: red; }\n" * 50))
+
+@benchmark('wsgi.negotiated')
+def wsgi_negotiated():
+    return WSGI('/', ('index', SIMPLATE))
+
+@benchmark('wsgi.wildcard')
+def wsgi_wildcard():
+    return WSGI('/chad/', ( '%name/index.html'
+                          , "^L^LGreetings, {{ path['name'] }}!"
+                            .replace('^L', '\x0c')
+                           ))
+
+@benchmark('wsgi.404')
+def wsgi_404():
+    return WSGI('/nope.html', ('index.html', "Greetings, program!"))
+
+
+# Large sites
+# ===========
+# See aspen.testing.sitegen. We time a sample of a site's URLs, in order.
+
+LARGE = {'fanout': 6, 'depth': 3, 'files': 10, 'wildcards': 0.3}
+
+def large(*argv):
+    """Generate a large site. Return a Website for it, and a workload.
+    """
+    urls = sitegen.generate(FSFIX, **LARGE)
+    workload = [path for path, expected in sitegen.sample(urls, 1000)]
+    return Site('--list_directories', 'yes', *argv), workload
+
+def LargeDispatcher(*argv):
+    website, workload = large(*argv)
+    requests = itertools.cycle([StubRequest(website, path)
+                                for path in workload])
+    def dispatch():
+        try:
+            dispatcher.dispatch(requests.next())
+        except Response:    # 404s and redirects
+            pass
+    return dispatch
+
+@benchmark('dispatch.large')
+def dispatch_large():
+    return LargeDispatcher('--dispatch_cache_size', '0')
+
+@benchmark('dispatch.large.cached')
+def dispatch_large_cached():
+    return LargeDispatcher()
+
+@benchmark('wsgi.large')
+def wsgi_large():
+    return Caller(*large())
+
+@benchmark('wsgi.autoindex.large')
+def wsgi_autoindex_large():
+    sitegen.generate(FSFIX, depth=0, files=1000, indices=0)
+    return Caller(Site('--list_directories', 'yes'), ['/'])
@@ -0,0 +1,610 @@
+"""Drive a website with load over loopback, on one network engine or several.
+
+    $ aspen-load                                # every engine, 10 clients
+    $ aspen-load -e cheroot,tornado -c 50       # these engines, 50 clients
+    $ aspen-load --mix=static:8,json:2 -k       # this mix, no keep-alive
+    $ aspen-load --sockets=100                  # and 100 Socket.IO clients
+    $ aspen-load -- --workers=4                 # pass the rest to aspen
+
+For each engine we write a small site to a temporary directory, start aspen on
+it in a child process listening on 127.0.0.1, and drive it for --seconds from
+--concurrency client threads in this process. Each client picks requests from
+--mix at random, by weight. The request types are:
+
+    static      a static CSS file
+    rendered    a simplate rendered with the default renderer
+    negotiated  a content-negotiated simplate
+    json        a JSON simplate
+    404         a file that isn't there
+
+A mix entry that starts with a slash is a URL path instead, which is handy
+with --www_root to load your own site. For a large generated site, pass the
+--www_root and --workload you got from aspen.testing.sitegen. Clients use HTTP
+keep-alive unless you pass -k, in which case each request is made on a new
+connection.
+
+With --sockets, that many Socket.IO clients also connect to an echo socket
+over xhr-polling. Each holds a long-poll GET open all the time and POSTs a
+message every --socket_interval seconds, and we time the round trips.
+
+We report requests per second, latency percentiles in milliseconds, the CPU
+time the server used (as a percentage of one core), and the server's peak
+resident memory. CPU and memory come from /proc, so they're only reported on
+Linux. The client threads share this process and its one core's worth of
+Python, so we report the client's CPU too: if it's close to 100% the numbers
+are the client's, not the engine's, and you should use fewer clients or
+compare engines at a lower --concurrency.
+
+Engines that can't be imported, or that don't start up, are reported and
+skipped.
+
+"""
+import httplib
+import optparse
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import aspen
+from aspen.bench import percentile
+from aspen.sockets.packet import Packet
+from aspen.testing.sitegen import load_workload
+
+
+STARTUP_TIMEOUT = 10    # seconds to wait for a server to start listening
+SHUTDOWN_TIMEOUT = 10   # seconds to wait for a server to exit before killing
+CLIENT_TIMEOUT = 30     # seconds before a client gives up on a response
+CRASHED = "Oh no! Aspen crashed!"   # see aspen.server.main
+
+
+# Site
+# ====
+
+SITE = { 'static.css': "body { color: red; }\n" * 50
+       , 'rendered.html': "program = 'program'\x0c"
+                          "<h1>Greetings, {{ program }}!</h1>"
+       , 'negotiated': "import random\n"
+                       "\x0cprogram = random.choice(['program'])\n"
+                       "\x0c text/html\n<h1>Greetings, {{ program }}!</h1>\n"
+                       "\x0c text/plain\nGreetings, {{ program }}!\n"
+       , 'data.json': "\x0cresponse.body = {'items': range(100)}"
+       , 'echo.sock': "\x0c\x0csocket.send(socket.recv())"
+        }
+
+KINDS = { 'static': '/static.css'
+        , 'rendered': '/rendered.html'
+        , 'negotiated': '/negotiated'
+        , 'json': '/data.json'
+        , '404': '/missing.html'
+         }
+
+SOCKET = '/echo.sock'
+
+def make_site():
+    """Write SITE to a temporary directory, and return its path.
+    """
+    www_root = tempfile.mkdtemp(prefix='aspen-load-')
+    for filename, content in SITE.items():
+        open(os.path.join(www_root, filename), 'w+').write(content)
+    return www_root
+
+def parse_mix(mix):
+    """Given a mix string, return a list of URL paths, repeated by weight.
+
+    A mix string is a comma-separated list of kind:weight pairs, where kind is
+    a key in KINDS or a URL path, and weight defaults to 1.
+
+    """
+    paths = []
+    for entry in mix.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, weight = entry, '1'
+        if ':' in entry:
+            kind, weight = entry.rsplit(':', 1)
+        if kind.startswith('/'):
+            path = kind
+        elif kind in KINDS:
+            path = KINDS[kind]
+        else:
+            raise ValueError("Unknown request type in mix: %s." % kind)
+        paths.extend([path] * int(weight))
+    if not paths:
+        raise ValueError("The mix is empty.")
+    return paths
+
+
+# Server
+# ======
+
+def free_port():
+    """Return a port on 127.0.0.1 that nothing is listening on.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+class Server(object):
+    """Model an aspen child process, running one engine.
+    """
+
+    def __init__(self, engine, www_root, argv=()):
+        self.engine = engine
+        self.www_root = www_root
+        self.argv = list(argv)
+        self.port = free_port()
+        self.proc = None
+        self.logpath = None
+
+    def start(self):
+        """Start aspen and wait for it to listen. Raise Failed if it doesn't.
+        """
+        argv = [ sys.executable, '-c'
+               , 'import sys; from aspen.server import main; sys.exit(main())'
+               , '--network_engine', self.engine
+               , '--network_address', '127.0.0.1:%d' % self.port
+               , '--www_root', self.www_root
+               , '--logging_threshold', '1'     # no access log
+                ] + self.argv
+
+        # Make sure the child imports the same aspen we did. It runs in
+        # www_root, since configure changes to it anyway, and that way the ''
+        # that -c puts on sys.path doesn't pick up an aspen from here.
+        env = os.environ.copy()
+        here = os.path.abspath(aspen.__file__)
+        path = [os.path.dirname(os.path.dirname(here))]
+        if env.get('PYTHONPATH'):
+            path.append(env['PYTHONPATH'])
+        env['PYTHONPATH'] = os.pathsep.join(path)
+
+        fd, self.logpath = tempfile.mkstemp(prefix='aspen-load-')
+        try:
+            self.proc = subprocess.Popen( argv
+                                        , cwd=self.www_root
+                                        , env=env
+                                        , stdout=fd
+                                        , stderr=subprocess.STDOUT
+                                         )
+        finally:
+            os.close(fd)
+
+        # A crashed aspen waits for changes instead of exiting.
+        end = time.time() + STARTUP_TIMEOUT
+        while time.time() < end:
+            if self.proc.poll() is not None:
+                self.fail("exited with status %d" % self.proc.returncode)
+            if CRASHED in self.output(0):
+                self.fail("crashed")
+            try:
+                sock = socket.create_connection(('127.0.0.1', self.port), 1)
+            except socket.error:
+                time.sleep(0.05)
+                continue
+            sock.close()
+            return
+        self.fail("didn't listen within %d seconds" % STARTUP_TIMEOUT)
+
+    def fail(self, why):
+        """Given a reason, stop aspen and raise Failed, with its last words.
+        """
+        output = self.output()
+        self.stop()
+        raise Failed("%s:\n%s" % (why, output))
+
+    def stop(self):
+        """Interrupt aspen, and kill it if it doesn't exit in time.
+        """
+        if self.proc is None or self.proc.poll() is not None:
+            self.remove_log()
+            return
+        os.kill(self.proc.pid, signal.SIGINT)
+        end = time.time() + SHUTDOWN_TIMEOUT
+        while self.proc.poll() is None and time.time() < end:
+            time.sleep(0.05)
+        if self.proc.poll() is None:
+            os.kill(self.proc.pid, signal.SIGKILL)
+            self.proc.wait()
+        self.remove_log()
+
+    def output(self, nlines=12):
+        """Return the last lines aspen wrote, indented, or all of them for 0.
+        """
+        if self.logpath is None:
+            return ''
+        lines = open(self.logpath).read().splitlines()[-nlines:]
+        return '\n'.join(['  ' + line for line in lines])
+
+    def remove_log(self):
+        if self.logpath is not None:
+            os.remove(self.logpath)
+            self.logpath = None
+
+    def usage(self):
+        """Return a tuple: CPU seconds used so far, and peak RSS in megabytes.
+
+        Either is None if we can't tell (we read /proc).
+
+        """
+        cpu = rss = None
+        try:
+            stat = open('/proc/%d/stat' % self.proc.pid).read()
+            fields = stat.rsplit(')', 1)[1].split()
+            ticks = int(fields[11]) + int(fields[12])   # utime + stime
+            cpu = ticks / float(os.sysconf('SC_CLK_TCK'))
+            for line in open('/proc/%d/status' % self.proc.pid):
+                if line.startswith('VmHWM:'):
+                    rss = int(line.split()[1]) / 1024.0
+        except (IOError, OSError, ValueError, IndexError):
+            pass
+        return cpu, rss
+
+
+class Failed(Exception):
+    """Raised when a server won't start.
+    """
+
+
+# Clients
+# =======
+
+class Client(threading.Thread):
+    """Make requests from a mix until told to stop, and time them.
+    """
+
+    def __init__(self, port, paths, keep_alive, stopping):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.port = port
+        self.paths = paths
+        self.keep_alive = keep_alive
+        self.stopping = stopping
+        self.latencies = []     # seconds
+        self.statuses = {}      # status code -> count
+        self.nerrors = 0        # connections that broke
+        self.conn = None
+
+    def run(self):
+        while not self.stopping.isSet():
+            path = random.choice(self.paths)
+            start = time.time()
+            try:
+                status = self.request(path)
+            except (socket.error, httplib.HTTPException):
+                self.nerrors += 1
+                self.close()
+                continue
+            self.latencies.append(time.time() - start)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.close()
+
+    def request(self, path):
+        """Given a URL path, make a GET request and return the status code.
+        """
+        if self.conn is None:
+            self.conn = httplib.HTTPConnection( '127.0.0.1', self.port
+                                              , timeout=CLIENT_TIMEOUT
+                                               )
+        headers = {'Accept': 'text/html,*/*;q=0.8'}
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        self.conn.request('GET', path, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        if not self.keep_alive or response.will_close:
+            self.close()
+        return response.status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class SocketClient(threading.Thread):
+    """Connect to a Socket.IO echo socket, and time round trips.
+
+    This thread POSTs a message every interval seconds, each carrying the time
+    it was sent. A second thread, the poller, keeps a long-poll GET open to
+    receive the echoes.
+
+    """
+
+    def __init__(self, port, interval, stopping):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.port = port
+        self.interval = interval
+        self.stopping = stopping
+        self.latencies = []
+        self.nsent = 0
+        self.nerrors = 0
+        self.url = None
+
+    def connect(self):
+        return httplib.HTTPConnection( '127.0.0.1', self.port
+                                     , timeout=CLIENT_TIMEOUT
+                                      )
+
+    def call(self, conn, method, url, body=None):
+        conn.request(method, url, body)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise httplib.HTTPException("%s %s: %d"
+                                        % (method, url, response.status))
+        return body
+
+    def run(self):
+        conn = self.connect()
+        try:
+            sid = self.call(conn, 'GET', SOCKET + '/1/').split(':')[0]
+            self.url = SOCKET + '/1/xhr-polling/' + sid
+            self.call(conn, 'GET', self.url)    # confirm the transport
+        except (socket.error, httplib.HTTPException):
+            self.nerrors += 1
+            conn.close()
+            return
+
+        poller = threading.Thread(target=self.poll)
+        poller.daemon = True
+        poller.start()
+        while not self.stopping.isSet():
+            message = "3::%s:%r" % (SOCKET, time.time())
+            try:
+                self.call(conn, 'POST', self.url, message)
+                self.nsent += 1
+            except (socket.error, httplib.HTTPException):
+                self.nerrors += 1
+                conn.close()
+                conn = self.connect()
+            self.stopping.wait(self.interval)
+        try:
+            self.call(conn, 'POST', self.url, "0::" + SOCKET)   # disconnect
+        except (socket.error, httplib.HTTPException):
+            pass
+        conn.close()
+
+    def poll(self):
+        conn = self.connect()
+        while not self.stopping.isSet():
+            try:
+                body = self.call(conn, 'GET', self.url)
+            except (socket.error, httplib.HTTPException):
+                if self.stopping.isSet():
+                    break
+                self.nerrors += 1
+                conn.close()
+                conn = self.connect()
+                continue
+            now = time.time()
+            if body:
+                for message in Packet(body):
+                    if message.type == 3:
+                        self.latencies.append(now - float(message.data))
+        conn.close()
+
+
+# Running
+# =======
+
+def drive(engine, www_root, paths, opts, argv=()):
+    """Drive one engine, and return a dictionary of results.
+    """
+    server = Server(engine, www_root, argv)
+    server.start()
+    try:
+        stopping = threading.Event()
+        clients = [Client(server.port, paths, not opts.no_keep_alive, stopping)
+                   for i in range(opts.concurrency)]
+        sockets = [SocketClient(server.port, opts.socket_interval, stopping)
+                   for i in range(opts.sockets)]
+        for sock in sockets:
+            sock.start()
+
+        # Let it settle before we start counting.
+        time.sleep(opts.warmup)
+
+        cpu_before, rss = server.usage()
+        client_before = sum(os.times()[:2])
+        start = time.time()
+        for client in clients:
+            client.start()
+        time.sleep(opts.seconds)
+        stopping.set()
+        for client in clients:
+            client.join(CLIENT_TIMEOUT)
+        elapsed = time.time() - start
+        cpu_after, rss = server.usage()
+        client_cpu = sum(os.times()[:2]) - client_before
+    finally:
+        server.stop()
+
+    latencies = []
+    statuses = {}
+    nerrors = 0
+    for client in clients:
+        latencies.extend(client.latencies)
+        nerrors += client.nerrors
+        for status, n in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + n
+    latencies.sort()
+    nrequests = len(latencies)
+
+    result = { 'engine': engine
+             , 'requests': nrequests
+             , 'rps': nrequests / elapsed
+             , 'errors': nerrors
+             , 'statuses': statuses
+             , 'client_cpu': client_cpu / elapsed * 100
+             , 'cpu': None
+             , 'rss': rss
+              }
+    result.update(summarize(latencies))
+    if cpu_before is not None and cpu_after is not None:
+        result['cpu'] = (cpu_after - cpu_before) / elapsed * 100
+
+    if sockets:
+        socket_latencies = []
+        for sock in sockets:
+            socket_latencies.extend(sock.latencies)
+        socket_latencies.sort()
+        result['sockets'] = summarize(socket_latencies)
+        result['sockets']['sent'] = sum([s.nsent for s in sockets])
+        result['sockets']['received'] = len(socket_latencies)
+        result['sockets']['errors'] = sum([s.nerrors for s in sockets])
+    return result
+
+def summarize(latencies):
+    """Given a sorted list of seconds, return percentiles in milliseconds.
+    """
+    out = {}
+    for key, p in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+        out[key] = None
+        if latencies:
+            out[key] = percentile(latencies, p) * 1000
+    return out
+
+
+# Reporting
+# =========
+
+def format_number(number, format):
+    if number is None:
+        return '-'
+    return format % number
+
+HEADER = ("%-10s %9s %7s %8s %8s %8s %8s %7s %8s %7s"
+          % ( 'engine', 'req/s', 'errors', 'p50 ms', 'p90 ms', 'p99 ms'
+            , 'max ms', 'cpu %', 'rss MB', 'client %'
+             ))
+
+def format_result(result):
+    return ("%-10s %9.1f %7d %8s %8s %8s %8s %7s %8s %7.0f"
+            % ( result['engine'], result['rps'], result['errors']
+              , format_number(result['p50'], '%.2f')
+              , format_number(result['p90'], '%.2f')
+              , format_number(result['p99'], '%.2f')
+              , format_number(result['max'], '%.1f')
+              , format_number(result['cpu'], '%.0f')
+              , format_number(result['rss'], '%.1f')
+              , result['client_cpu']
+               ))
+
+def format_sockets(result):
+    sockets = result['sockets']
+    return ("%-10s %9s %7d %8s %8s %8s %8s   %d sent, %d echoed"
+            % ( '  sockets', '', sockets['errors']
+              , format_number(sockets['p50'], '%.2f')
+              , format_number(sockets['p90'], '%.2f')
+              , format_number(sockets['p99'], '%.2f')
+              , format_number(sockets['max'], '%.1f')
+              , sockets['sent'], sockets['received']
+               ))
+
+
+# Command line
+# ============
+
+def main(argv=None):
+    """Drive engines with load from the command line. See the module docstring.
+    """
+    parser = optparse.OptionParser(usage="aspen-load [options] [-- aspen "
+                                         "options]")
+    parser.add_option( "-e", "--engines"
+                     , default=','.join(aspen.NETWORK_ENGINES)
+                     , help="comma-separated network engines to drive [all]"
+                      )
+    parser.add_option( "-c", "--concurrency", type="int", default=10
+                     , help="how many clients make requests at once [10]"
+                      )
+    parser.add_option( "-s", "--seconds", type="float", default=10.0
+                     , help="how long to drive each engine [10]"
+                      )
+    parser.add_option( "-w", "--warmup", type="float", default=1.0
+                     , help="seconds to wait after starting up [1]"
+                      )
+    parser.add_option( "-k", "--no_keep_alive", action="store_true"
+                     , default=False
+                     , help="make each request on a new connection"
+                      )
+    parser.add_option( "-m", "--mix"
+                     , default="static:4,rendered:2,negotiated:2,json:1,404:1"
+                     , help=("weighted request types or paths, as kind:weight,"
+                             "... [static:4,rendered:2,negotiated:2,json:1,"
+                             "404:1]")
+                      )
+    parser.add_option( "--sockets", type="int", default=0
+                     , help="how many Socket.IO clients to connect [0]"
+                      )
+    parser.add_option( "--socket_interval", type="float", default=0.5
+                     , help="seconds between messages per Socket.IO client "
+                            "[0.5]"
+                      )
+    parser.add_option( "--www_root"
+                     , help="load this site instead of the built-in one"
+                      )
+    parser.add_option( "--workload", metavar="FILE"
+                     , help=("draw requests from the URLs in FILE instead of "
+                             "--mix (see aspen.testing.sitegen)")
+                      )
+    parser.add_option( "--save", metavar="FILE"
+                     , help="write the results to FILE as JSON"
+                      )
+    opts, aspen_argv = parser.parse_args(argv)
+
+    if opts.workload:
+        if opts.www_root is None:
+            parser.error("--workload needs --www_root.")
+        paths = [path for path, expected in load_workload(opts.workload)]
+    else:
+        try:
+            paths = parse_mix(opts.mix)
+        except ValueError, exc:
+            parser.error(exc.args[0])
+    engines = [e.strip() for e in opts.engines.split(',') if e.strip()]
+    for engine in engines:
+        if engine not in aspen.NETWORK_ENGINES:
+            parser.error("Unknown network engine: %s." % engine)
+
+    www_root = opts.www_root
+    if www_root is None:
+        www_root = make_site()
+    try:
+        results = []
+        print HEADER
+        for engine in engines:
+            try:
+                result = drive(engine, www_root, paths, opts, aspen_argv)
+            except Failed, exc:
+                print "%-10s skipped: %s" % (engine, exc.args[0].rstrip())
+                continue
+            results.append(result)
+            print format_result(result)
+            if 'sockets' in result:
+                print format_sockets(result)
+            sys.stdout.flush()
+    finally:
+        if opts.www_root is None:
+            shutil.rmtree(www_root)
+
+    if opts.save:
+        fp = open(opts.save, 'w+')
+        try:
+            fp.write(aspen.json.dumps(results, indent=2, sort_keys=True))
+        finally:
+            fp.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
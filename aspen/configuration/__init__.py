@@ -15,7 +15,7 @@ from aspen.hooks import Hooks
 from aspen.configuration import parse
 from aspen.configuration.exceptions import ConfigurationError
 from aspen.configuration.options import OptionParser, DEFAULT
-from aspen.utils import ascii_dammit
+from aspen.utils import ascii_dammit, Stopwatch
 
 
 # Nicer defaultdict
@@ -45,6 +45,71 @@ class NicerDefaultDict(collections.defaultdict):
         collections.defaultdict.get(self, name, default)
 
 
+# Renderer factories
+# ==================
+
+class RendererFactories(dict):
+    """Map renderer names to factories, importing ours on first use.
+
+    Aspen's own renderers (aspen.RENDERERS) are imported the first time
+    they're asked for, since most sites only use one or two, and some of the
+    third-party libraries behind them are slow to import. If the import fails,
+    the value is the ImportError (with sys.exc_info() at .info) instead of a
+    factory. Looking at all of them at once (keys, items, etc.) imports the
+    rest; that's for error messages and aspen --check.
+
+    """
+
+    def __init__(self, website):
+        dict.__init__(self)
+        self.website = website
+
+    def __missing__(self, name):
+        if name not in aspen.RENDERERS:
+            raise KeyError(name)
+        try:
+            capture = {}
+            python_syntax = 'from aspen.renderers.%s import Factory'
+            exec python_syntax % name in capture
+            make_renderer = capture['Factory'](self.website)
+        except ImportError, err:
+            make_renderer = err
+            err.info = sys.exc_info()
+        self[name] = make_renderer
+        return make_renderer
+
+    def __contains__(self, name):
+        return name in aspen.RENDERERS or dict.__contains__(self, name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def load_all(self):
+        """Import any of our renderers that haven't been yet.
+        """
+        for name in aspen.RENDERERS:
+            self[name]
+
+    def keys(self):
+        self.load_all()
+        return dict.keys(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
+
+    def iteritems(self):
+        self.load_all()
+        return dict.iteritems(self)
+
+    def __iter__(self):
+        self.load_all()
+        return dict.__iter__(self)
+
+
 # Defaults
 # ========
 # The from_unicode callable converts from unicode to whatever format is
@@ -64,17 +129,47 @@ KNOBS = \
 
     # Extended Options
     # 'name':               (default, from_unicode)
+    , 'admission_exempt':   (lambda: [], parse.list_)
+    , 'admission_limit':    (0, int)
+    , 'admission_queue':    (100, int)
+    , 'admission_wait_ms':  (1000, int)
     , 'changes_reload':     (False, parse.yes_no)
     , 'charset_dynamic':    (u'UTF-8', parse.charset)
     , 'charset_static':     (None, parse.charset)
+    , 'dispatch_cache_misses': (256, int)
+    , 'dispatch_cache_size': (1024, int)
     , 'indices':            ( lambda: [u'index.html', u'index.json', u'index']
                             , parse.list_
                              )
     , 'list_directories':   (False, parse.yes_no)
+    , 'logging_access_format': ('text', parse.logging_access_format)
+    , 'logging_buffer':     (0, int)
+    , 'logging_buffer_policy': ('drop_oldest', parse.logging_buffer_policy)
+    , 'logging_flush_ms':   (100, int)
+    , 'max_requests':       (0, int)
+    , 'max_rss':            (0, int)
     , 'media_type_default': ('text/plain', parse.media_type)
     , 'media_type_json':    ('application/json', parse.media_type)
+    , 'metrics_path':       (None, parse.identity)
+    , 'plain_errors':       (lambda: [], parse.list_)
+    , 'profile_dir':        (None, parse.identity)
+    , 'profile_secret':     (None, parse.identity)
     , 'renderer_default':   ('tornado', parse.renderer)
+    , 'request_budget_ms':  (0, int)
     , 'show_tracebacks':    (False, parse.yes_no)
+    , 'slow_request_ms':    (0, int)
+    , 'slow_request_sample_ms': (1000, int)
+    , 'socket_broker':      (None, parse.identity)
+    , 'socket_buffer_size': (1024, int)
+    , 'socket_buffer_policy': ('drop_oldest', parse.socket_buffer_policy)
+    , 'socket_flush_bytes': (65536, int)
+    , 'socket_flush_ms':    (7, int)
+    , 'trace_export':       (None, parse.identity)
+    , 'trace_sample':       (100, int)
+    , 'workers':            (1, int)
+    , 'workers_drain_timeout': (10, int)
+    , 'workers_reuse_port': (False, parse.yes_no)
+    , 'workers_warm_cache': (False, parse.yes_no)
      }
 
 
@@ -104,11 +199,14 @@ class Configurable(object):
         if aspen.is_callable(hydrated):
             hydrated = hydrated()  # Call it if we can.
         setattr(self, name, hydrated)
+        shown = hydrated
+        if name.endswith('_secret') and hydrated is not None:
+            shown = flat = u'********'  # we log this
         if name_in_context:
             assert isinstance(flat, unicode) # sanity check
             name_in_context = " %s=%s" % (name_in_context, flat)
         out = "  %-22s %-30s %-24s"
-        return out % (name, hydrated, context + name_in_context)
+        return out % (name, shown, context + name_in_context)
 
     def set(self, name, raw, from_unicode, context, name_in_context):
         assert isinstance(raw, str), "%s isn't a bytestring" % name
@@ -165,7 +263,9 @@ class Configurable(object):
         # Parse argv.
         # ===========
 
+        self.startup = Stopwatch()  # aspen.server logs this
         opts, args = OptionParser().parse_args(argv)
+        self.check = opts.check     # see aspen.server.check
 
 
         # Configure from defaults, environment, and command line.
@@ -201,6 +301,9 @@ class Configurable(object):
                                      ))
 
 
+        self.startup.lap('options')
+
+
         # Set some attributes.
         # ====================
 
@@ -229,6 +332,25 @@ class Configurable(object):
         # the testing module, that's really what this is about.
         if aspen.logging.LOGGING_THRESHOLD == -1:
             aspen.logging.LOGGING_THRESHOLD = self.logging_threshold
+
+        # logging_buffer, logging_buffer_policy, logging_flush_ms
+        if self.logging_buffer < 0:
+            raise ConfigurationError("logging_buffer must be at least 0.")
+        if self.logging_flush_ms < 1:
+            raise ConfigurationError("logging_flush_ms must be at least 1.")
+        if self.logging_buffer or aspen.logging.WRITER is not None:
+            aspen.logging.buffer( self.logging_buffer
+                                , self.logging_buffer_policy
+                                , self.logging_flush_ms / 1000.0
+                                 )
+
+        # logging_access_format
+        if self.logging_access_format == 'json':
+            try:
+                aspen.json.lazy_check()
+            except ImportError, err:
+                raise ConfigurationError(err.args[0])
+
         # Now that we know the user's desires, we can log appropriately.
         aspen.log_dammit(os.linesep.join(msgs))
 
@@ -275,45 +397,22 @@ class Configurable(object):
         os.chdir(self.www_root)
 
         # renderers
-        self.renderer_factories = {}
-        for name in aspen.RENDERERS:
-            # Pre-populate renderers so we can report on ImportErrors early
-            try:
-                capture = {}
-                python_syntax = 'from aspen.renderers.%s import Factory'
-                exec python_syntax % name in capture
-                make_renderer = capture['Factory'](self)
-            except ImportError, err:
-                make_renderer = err
-                err.info = sys.exc_info()
-            self.renderer_factories[name] = make_renderer
-
+        # These are imported on first use, except for the default, which we
+        # want to fail fast on. See aspen --check to try them all.
+        self.renderer_factories = RendererFactories(self)
         default_renderer = self.renderer_factories[self.renderer_default]
         if isinstance(default_renderer, ImportError):
-            msg = "\033[1;31mImportError loading the default renderer, %s:\033[0m"
+            msg = ("\033[1;31mImportError loading the default renderer, "
+                   "%s:\033[0m")
             aspen.log_dammit(msg % self.renderer_default)
             sys.excepthook(*default_renderer.info)
             raise default_renderer
-
-        aspen.log_dammit("Renderers (*ed are unavailable, CAPS is default):")
-        width = max(map(len, self.renderer_factories))
-        for name, factory in self.renderer_factories.items():
-            star = " "
-            if isinstance(factory, ImportError):
-                star = "*"
-                error = "ImportError: " + factory.args[0]
-            else:
-                error = ""
-            if name == self.renderer_default:
-                name = name.upper()
-            name = name.ljust(width + 2)
-            aspen.log_dammit(" %s%s%s" % (star, name, error))
-
         self.default_renderers_by_media_type = NicerDefaultDict()
         self.default_renderers_by_media_type.default = self.renderer_default
 
         # mime.types
         mimetypes.init()
+        self.startup.lap('mimetypes')
 
         # network_engine
         try:
@@ -330,6 +429,7 @@ class Configurable(object):
             aspen.log_dammit(msg % self.network_engine)
             raise
         self.network_engine = Engine(self.network_engine, self)
+        self.startup.lap('engine')
 
         # network_address, network_sockfam, network_port
         self.network_address, self.network_sockfam = self.network_address
@@ -338,14 +438,170 @@ class Configurable(object):
         else:
             self.network_port = None
 
+        # admission_*
+        for name in ('admission_limit', 'admission_queue',
+                     'admission_wait_ms'):
+            if getattr(self, name) < 0:
+                raise ConfigurationError("%s must be at least 0." % name)
+        from aspen.admission import Admission
+        from aspen.network_engines import ThreadedEngine
+        can_wait = isinstance(self.network_engine, ThreadedEngine)
+        self.admission = Admission(self, can_wait)
+
+        # dispatch_cache_size, dispatch_cache_misses
+        if self.dispatch_cache_size < 0:
+            raise ConfigurationError("dispatch_cache_size must be at least 0.")
+        if self.dispatch_cache_misses < 0:
+            raise ConfigurationError("dispatch_cache_misses must be at least "
+                                     "0.")
+        from aspen.dispatcher import DispatchCache
+        self.dispatch_cache = DispatchCache( self.dispatch_cache_size
+                                           , self.dispatch_cache_misses
+                                            )
+
+        # plain_errors
+        try:
+            self.plain_errors = [int(code) for code in self.plain_errors
+                                           if code]
+        except ValueError:
+            raise ConfigurationError("plain_errors must be HTTP status "
+                                     "codes.")
+
+        # profile_secret, profile_dir
+        # cProfile and pstats are only imported once a request asks.
+        self.profiler = None
+        if self.profile_secret is not None:
+            if not self.profile_secret:
+                raise ConfigurationError("profile_secret must not be empty.")
+            if self.profile_dir is None:
+                # Anyone can make this in a shared temporary directory first,
+                # to read our profiles or to point us elsewhere, so we only
+                # take one that's really a directory, and really ours.
+                import stat
+                import tempfile
+                self.profile_dir = os.path.join( tempfile.gettempdir()
+                                               , 'aspen-profiles'
+                                                )
+                try:
+                    os.mkdir(self.profile_dir, 0700)
+                except OSError, err:
+                    if err.errno != errno.EEXIST:
+                        raise
+                st = os.lstat(self.profile_dir)
+                if not stat.S_ISDIR(st.st_mode):
+                    raise ConfigurationError("%s isn't a directory, so we "
+                                             "won't write profiles there."
+                                             % self.profile_dir)
+                if st.st_uid != os.getuid():
+                    raise ConfigurationError("%s belongs to someone else, so "
+                                             "we won't write profiles there."
+                                             % self.profile_dir)
+                os.chmod(self.profile_dir, 0700)
+            self.profile_dir = os.path.realpath(self.profile_dir)
+            from aspen.profiling import Profiler
+            self.profiler = Profiler(self.profile_secret, self.profile_dir)
+            aspen.log_dammit("Profiling requests on demand, into %s."
+                             % self.profile_dir)
+
+        # request_budget_ms, slow_request_ms, slow_request_sample_ms
+        if self.request_budget_ms < 0:
+            raise ConfigurationError("request_budget_ms must be at least 0.")
+        if self.slow_request_ms < 0:
+            raise ConfigurationError("slow_request_ms must be at least 0.")
+        if self.slow_request_sample_ms < 1:
+            raise ConfigurationError("slow_request_sample_ms must be at least "
+                                     "1.")
+        from aspen.deadlines import Overseer
+        self.overseer = Overseer( self.slow_request_ms
+                                , self.slow_request_sample_ms
+                                 )
+
+        # metrics_path
+        # This comes after everything WebsiteMetrics reads from.
+        self.metrics = None
+        if self.metrics_path is not None:
+            if not self.metrics_path.startswith('/'):
+                raise ConfigurationError("metrics_path must start with a "
+                                         "slash.")
+            self.metrics_path = self.metrics_path.encode('UTF-8')
+            from aspen.metrics import WebsiteMetrics
+            self.metrics = WebsiteMetrics(self)
+
+        # trace_export, trace_sample
+        self.tracer = None
+        if self.trace_sample < 0 or self.trace_sample > 100:
+            raise ConfigurationError("trace_sample must be from 0 to 100.")
+        if self.trace_export is not None:
+            if self.trace_export.startswith('udp:'):
+                port = self.trace_export.rsplit(':', 1)[-1]
+                if self.trace_export.count(':') < 2 or not port.isdigit():
+                    raise ConfigurationError("trace_export must be a file "
+                                             "path or udp:host:port.")
+            elif not self.trace_export:
+                raise ConfigurationError("trace_export must not be empty.")
+            else:
+                self.trace_export = os.path.realpath(self.trace_export)
+            from aspen.tracing import Tracer
+            self.tracer = Tracer(self.trace_export, self.trace_sample)
+            aspen.log_dammit("Tracing requests, to %s." % self.trace_export)
+
+        # max_requests, max_rss
+        if self.max_requests < 0:
+            raise ConfigurationError("max_requests must be at least 0.")
+        if self.max_rss < 0:
+            raise ConfigurationError("max_rss must be at least 0.")
+
+        # workers
+        if self.workers < 1:
+            raise ConfigurationError("workers must be at least 1.")
+        if self.workers_drain_timeout < 0:
+            raise ConfigurationError("workers_drain_timeout must be at least "
+                                     "0.")
+        if self.workers > 1:
+            if aspen.WINDOWS:
+                raise ConfigurationError("Multiple workers need os.fork, "
+                                         "which Windows doesn't have.")
+            if hasattr(socket, 'AF_UNIX') and \
+               self.network_sockfam == socket.AF_UNIX:
+                raise ConfigurationError("Multiple workers need an IPv4 or "
+                                         "IPv6 network_address.")
+            if not self.network_engine.prefork:
+                raise ConfigurationError("The %s engine can't run multiple "
+                                         "workers." % self.network_engine.name)
+        from aspen.prefork import SO_REUSEPORT
+        if self.workers_reuse_port and SO_REUSEPORT is None:
+            raise ConfigurationError("workers_reuse_port needs SO_REUSEPORT, "
+                                     "which this platform doesn't have.")
+
+        # socket_buffer_size, socket_flush_bytes, socket_flush_ms
+        for name in ('socket_buffer_size', 'socket_flush_bytes',
+                     'socket_flush_ms'):
+            if getattr(self, name) < 0:
+                raise ConfigurationError("%s must be at least 0." % name)
+
+        # socket_broker
+        if self.socket_broker is None:
+            from aspen.sockets.backend import InProcessBackend
+            self.socket_backend = InProcessBackend()
+        else:
+            from aspen.sockets.broker import BrokerBackend
+            self.socket_broker = os.path.realpath(self.socket_broker)
+            self.socket_backend = BrokerBackend( self.socket_broker
+                                               , self.network_engine
+                                                )
+
         # hooks
+        # We only time them if there's somewhere to report it; see metrics.
         self.hooks = Hooks([ 'startup'
                            , 'inbound_early'
                            , 'inbound_late'
                            , 'outbound_early'
                            , 'outbound_late'
                            , 'shutdown'
-                            ])
+                            ], timed=self.metrics is not None)
+
+
+        self.startup.lap('settings')
 
 
         # Finally, exec any configuration scripts.
@@ -386,3 +642,4 @@ class Configurable(object):
                 # XXX smelly ... bug here? second else pls?
             else:
                 execution.if_changes(filepath)
+        self.startup.lap('configuration scripts')
@@ -14,7 +14,7 @@ aspen, version %s
 
 (c) 2006-2013 Chad Whitacre and contributors
 http://aspen.io/
-""" % aspen.__version__
+"""
 
 
 description = """\
@@ -30,14 +30,29 @@ class DEFAULT(object):
 DEFAULT = DEFAULT()
 
 
+class _OptionParser(optparse.OptionParser):
+    """Extend to look up our version only if asked for it. It's slow.
+    """
+
+    def get_version(self):
+        return version % aspen.__version__
+
+
 def OptionParser():
-    optparser = optparse.OptionParser( usage=usage
-                                     , version=version
-                                     , description=description
-                                      )
+    optparser = _OptionParser( usage=usage
+                             , version=version
+                             , description=description
+                              )
 
     basic = optparse.OptionGroup(optparser, "Basic Options")
 
+    basic.add_option( "--check"
+                    , help=("load every renderer and every resource under "
+                            "www_root, report any problems, and exit")
+                    , action="store_true"
+                    , default=False
+                     )
+
     basic.add_option( "-f", "--configuration_scripts"
                     , help=("comma-separated list of paths to configuration "
                             "files in Python syntax to exec in addition to "
@@ -79,6 +94,29 @@ def OptionParser():
                                      "often configured from the command "
                                      "line. But who knows?"
                                     )
+    extended.add_option( "--admission_exempt"
+                       , help=("comma-separated URL path prefixes that skip "
+                               "admission control, such as health checks and "
+                               "static files []")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--admission_limit"
+                       , help=("the most requests to handle at once; more "
+                               "wait in line or get a 503; 0 means no limit "
+                               "[0]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--admission_queue"
+                       , help=("the most requests to hold in line when we're "
+                               "at admission_limit; more get a 503 right away "
+                               "[100]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--admission_wait_ms"
+                       , help=("the most milliseconds a request waits in line "
+                               "before it gets a 503 [1000]")
+                       , default=DEFAULT
+                        )
     extended.add_option( "--changes_reload"
                        , help=("if set to yes/true/1, changes to configuration"
                                " files and Python modules will cause aspen to "
@@ -100,6 +138,18 @@ def OptionParser():
                                "just leave this unset []")
                        , default=DEFAULT
                         )
+    extended.add_option( "--dispatch_cache_misses"
+                       , help=("the number of URL paths that weren't found "
+                               "(404) to remember, apart from those that "
+                               "were [256]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--dispatch_cache_size"
+                       , help=("the number of URL paths to remember the "
+                               "dispatch result for; 0 means dispatch every "
+                               "request afresh [1024]")
+                       , default=DEFAULT
+                        )
     extended.add_option( "--indices"
                        , help=("a comma-separated list of filenames to look "
                                "for when a directory is requested directly; "
@@ -114,6 +164,43 @@ def OptionParser():
                                "[no]")
                        , default=DEFAULT
                         )
+    extended.add_option( "--logging_access_format"
+                       , help=( "how to log requests; one of "
+                              + "{%s}" % ','.join(aspen.LOGGING_ACCESS_FORMATS)
+                              + "; json gives one object per line [text]"
+                               )
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--logging_buffer"
+                       , help=("the number of log lines to buffer in memory "
+                               "for a background thread to write out; 0 "
+                               "means write each line as it's logged [0]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--logging_buffer_policy"
+                       , help=( "what to do when the log buffer is full; one "
+                              + "of {%s}" % ','.join(aspen.LOGGING_BUFFER_POLICIES)
+                              + " [drop_oldest]"
+                               )
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--logging_flush_ms"
+                       , help=("the most milliseconds buffered log lines wait "
+                               "before being written out [100]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--max_requests"
+                       , help=("the number of requests after which a worker "
+                               "finishes up and is replaced; 0 means no limit "
+                               "[0]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--max_rss"
+                       , help=("the resident memory, in megabytes, past which "
+                               "a worker finishes up and is replaced; 0 means "
+                               "no limit [0]")
+                       , default=DEFAULT
+                        )
     extended.add_option( "--media_type_default"
                        , help=("this is set as the Content-Type for resources "
                                "of otherwise unknown media type [text/plain]")
@@ -124,6 +211,31 @@ def OptionParser():
                                "resources [application/json]")
                        , default=DEFAULT
                         )
+    extended.add_option( "--metrics_path"
+                       , help=("the URL path to serve metrics at, in "
+                               "Prometheus's text format; unset means don't "
+                               "serve them []")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--plain_errors"
+                       , help=("comma-separated HTTP status codes, such as "
+                               "404, to answer with a plain-text body instead "
+                               "of rendering an error page []")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--profile_dir"
+                       , help=("the directory to write request profiles to "
+                               "[aspen-profiles in the system's temporary "
+                               "directory]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--profile_secret"
+                       , help=("profile requests that carry this in an "
+                               "X-Aspen-Profile header or aspen_profile "
+                               "query parameter; unset means never profile "
+                               "[]")
+                       , default=DEFAULT
+                        )
     extended.add_option( "--renderer_default"
                     , help=( "the renderer to use by default; one of "
                            + "{%s}" % ','.join(aspen.RENDERERS)
@@ -131,11 +243,100 @@ def OptionParser():
                             )
                     , default=DEFAULT
                      )
+    extended.add_option( "--request_budget_ms"
+                       , help=("the milliseconds each request has to finish "
+                               "before it's reported as overrunning; "
+                               "simplates can set their own with "
+                               "__budget_ms__; 0 means no budget [0]")
+                       , default=DEFAULT
+                        )
     extended.add_option( "--show_tracebacks"
                        , help=("if set to {yes,true,1}, 500s will have a "
                                "traceback in the browser [no]")
                        , default=DEFAULT
                         )
+    extended.add_option( "--slow_request_ms"
+                       , help=("the milliseconds after which a request still "
+                               "running has its stack logged, and again every "
+                               "slow_request_sample_ms until it finishes; 0 "
+                               "means don't watch [0]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--slow_request_sample_ms"
+                       , help=("the milliseconds between stack snapshots of "
+                               "a slow request [1000]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--socket_broker"
+                       , help=("the filesystem path of an aspen-broker's Unix "
+                               "socket, for sharing Socket.IO channels and "
+                               "sessions with other aspen processes []")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--socket_buffer_size"
+                       , help=("the maximum number of messages to hold in each "
+                               "of a socket's incoming and outgoing buffers; "
+                               "0 means unbounded [1024]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--socket_buffer_policy"
+                       , help=( "what to do when a socket buffer is full; one "
+                              + "of {%s}" % ','.join(aspen.SOCKET_BUFFER_POLICIES)
+                              + "; block waits at most 5 seconds for room "
+                              + "[drop_oldest]"
+                               )
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--socket_flush_bytes"
+                       , help=("the most bytes of messages to send in one "
+                               "response to a polling client (at least one "
+                               "message is always sent); 0 means no limit "
+                               "[65536]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--socket_flush_ms"
+                       , help=("the most milliseconds to spend gathering "
+                               "messages for one response to a polling client "
+                               "[7]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--trace_export"
+                       , help=("a file to append request trace spans to, as "
+                               "JSON lines, or udp:host:port to send them to; "
+                               "unset means don't trace []")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--trace_sample"
+                       , help=("the percent of requests to trace, of those "
+                               "that don't say in a traceparent header [100]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--workers"
+                       , help=("the number of worker processes to fork, each "
+                               "running the network engine; more than one "
+                               "needs an engine that supports it and an IPv4 "
+                               "or IPv6 address [1]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--workers_drain_timeout"
+                       , help=("the most seconds a stopping or reloading "
+                               "worker waits for requests in flight to finish "
+                               "before it's killed [10]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--workers_reuse_port"
+                       , help=("if set to {yes,true,1}, each worker binds its "
+                               "own socket with SO_REUSEPORT, instead of all "
+                               "of them sharing one socket bound before "
+                               "forking [no]")
+                       , default=DEFAULT
+                        )
+    extended.add_option( "--workers_warm_cache"
+                       , help=("if set to {yes,true,1}, load every resource "
+                               "under www_root before forking, so that the "
+                               "workers share them [no]")
+                       , default=DEFAULT
+                        )
 
 
     optparser.add_option_group(basic)
@@ -70,6 +70,27 @@ def renderer(value):
         raise ValueError(msg)
     return value.encode('US-ASCII')
 
+def socket_buffer_policy(value):
+    typecheck(value, unicode)
+    if value not in aspen.SOCKET_BUFFER_POLICIES:
+        msg = "not one of {%s}" % (','.join(aspen.SOCKET_BUFFER_POLICIES))
+        raise ValueError(msg)
+    return value.encode('US-ASCII')
+
+def logging_buffer_policy(value):
+    typecheck(value, unicode)
+    if value not in aspen.LOGGING_BUFFER_POLICIES:
+        msg = "not one of {%s}" % (','.join(aspen.LOGGING_BUFFER_POLICIES))
+        raise ValueError(msg)
+    return value.encode('US-ASCII')
+
+def logging_access_format(value):
+    typecheck(value, unicode)
+    if value not in aspen.LOGGING_ACCESS_FORMATS:
+        msg = "not one of {%s}" % (','.join(aspen.LOGGING_ACCESS_FORMATS))
+        raise ValueError(msg)
+    return value.encode('US-ASCII')
+
 def network_address(address):
     """Given a socket address string, return a tuple (sockfam, address).
 
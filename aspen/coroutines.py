@@ -0,0 +1,303 @@
+"""Support simplates whose second page is a coroutine.
+
+If page two of a simplate has a yield statement in it, Aspen compiles it as a
+generator. Page two can then yield Futures, and each yield evaluates to the
+Future's result (or raises its exception) once it's done:
+
+    import urllib2
+    engine = website.network_engine
+    ^L
+    yield engine.pause(0.5)
+    body = yield engine.defer(lambda: urllib2.urlopen(url).read())
+    ^L
+    Here's what we found: %(body)s
+
+Names bound on page two end up in the context just like they do for regular
+simplates. Yielding None just gives up control for a moment.
+
+The network engine decides what to do with a coroutine. Threaded engines run
+it to completion right away in the current thread. The asyncore engine
+suspends the request instead, and resumes it on its event loop when the
+Futures are done, so that lots of I/O-bound requests can wait at once.
+
+"""
+from __future__ import with_statement # for Python 2.5
+import __builtin__
+import sys
+import threading
+import time
+from types import FunctionType
+
+from aspen.http.response import Response
+
+try:                # Python >= 2.6
+    import ast
+except ImportError: # Python < 2.6
+    ast = None
+
+
+CO_GENERATOR = 0x20  # from Include/code.h
+PAGE_TWO = '__page_two__'
+
+
+def is_coroutine(code):
+    """Given a code object, return a boolean.
+    """
+    return bool(code.co_flags & CO_GENERATOR)
+
+
+# Compiling
+# =========
+
+def compile_page_two(source, filename):
+    """Given page two's source and a filename, return a code object.
+
+    If source yields, we wrap it in a generator function and return that
+    function's code. Every name that source binds at the top level is declared
+    global, so that when we give the function the context as its globals the
+    names land there, as they would if we'd exec'd source in the context.
+
+    """
+    try:
+        return compile(source, filename, 'exec')
+    except SyntaxError, exc:
+        if "'yield' outside function" not in str(exc):
+            raise
+        if ast is None:
+            raise SyntaxError("Yielding from page two requires Python 2.6 or "
+                              "later (%s)." % filename)
+
+    module = ast.parse(source, filename)
+    body = module.body
+    names = sorted(_find_bound_names(body))
+    if names:
+        body = [ast.Global(names, lineno=1, col_offset=0)] + body
+    function = ast.FunctionDef( PAGE_TWO
+                              , ast.arguments([], None, None, [])
+                              , body
+                              , []
+                              , lineno=1
+                              , col_offset=0
+                               )
+    module.body = [function]
+    code = compile(module, filename, 'exec')
+    for const in code.co_consts:
+        if getattr(const, 'co_name', None) == PAGE_TWO:
+            return const
+    raise RuntimeError("Couldn't find %s in %s." % (PAGE_TWO, filename))
+
+
+def generate(code, context):
+    """Given a coroutine's code object and a context dict, return a generator.
+    """
+    context.setdefault('__builtins__', __builtin__)   # exec does this for us
+    return FunctionType(code, context)()
+
+
+def _find_bound_names(nodes):
+    """Given a list of AST nodes, return a set of the names they bind.
+
+    We don't descend into functions, classes, lambdas, or generator
+    expressions, since those have their own scopes.
+
+    """
+    names = set()
+    nodes = list(nodes)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            nodes.extend(node.decorator_list)
+            if isinstance(node, ast.ClassDef):
+                nodes.extend(node.bases)
+            else:
+                nodes.extend(node.args.defaults)
+            continue
+        elif isinstance(node, (ast.Lambda, ast.GeneratorExp)):
+            continue
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(node, ast.Name) and \
+             isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+# Futures
+# =======
+
+class Future(object):
+    """Model the eventual result of some operation.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_result(self, result):
+        self._resolve(result, None)
+
+    def set_exc_info(self, exc_info):
+        """Given a sys.exc_info() tuple, resolve with that exception.
+        """
+        self._resolve(None, exc_info)
+
+    def _resolve(self, result, exc_info):
+        with self._lock:
+            if self.done:
+                raise RuntimeError("This future is already done.")
+            self.done = True
+            self._result = result
+            self._exc_info = exc_info
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Given a callable, call it with us when we're done.
+
+        If we're already done we call it right away. Otherwise it's called
+        from whichever thread resolves us.
+
+        """
+        with self._lock:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def result(self):
+        """Return our result, or raise our exception.
+        """
+        if not self.done:
+            raise RuntimeError("This future isn't done yet.")
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def join(self):
+        """Block the current thread until we're done.
+        """
+        if not self.done:
+            event = threading.Event()
+            self.add_done_callback(lambda future: event.set())
+            event.wait()
+
+    def wait(self):
+        """Block the current thread until we're done, then return result().
+        """
+        self.join()
+        return self.result()
+
+
+def resolved(result):
+    """Given an object, return a Future that's done with it as its result.
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class Coroutine(Future):
+    """Model a generator as a Future that's done when the generator stops.
+    """
+
+    def __init__(self, generator, deadline=None):
+        """Takes a generator and maybe a time.time() to be done by.
+
+        If we're resumed after deadline, we raise a 503 Response at the yield
+        instead (once). See aspen.deadlines.
+
+        """
+        Future.__init__(self)
+        self.generator = generator
+        self.deadline = deadline
+
+    def start(self):
+        self.step(None)
+
+    def run(self):
+        """Start, then block until we're done, and return result().
+        """
+        self.start()
+        return self.wait()
+
+    def step(self, future):
+        """Given a finished Future (or None), resume the generator with it.
+
+        We keep going until the generator yields a Future that isn't done yet,
+        and then we add ourselves as that Future's callback.
+
+        """
+        while 1:
+            if self.deadline is not None and time.time() > self.deadline:
+                self.deadline = None
+                future = Future()
+                try:
+                    raise Response(503)
+                except Response:
+                    future.set_exc_info(sys.exc_info())
+            try:
+                if future is None:
+                    yielded = self.generator.send(None)
+                elif future._exc_info is not None:
+                    yielded = self.generator.throw(*future._exc_info)
+                else:
+                    yielded = self.generator.send(future._result)
+            except StopIteration:
+                self.set_result(None)
+                return
+            except:
+                self.set_exc_info(sys.exc_info())
+                return
+
+            if yielded is None:
+                future = None
+            elif isinstance(yielded, Future):
+                if not yielded.done:
+                    yielded.add_done_callback(self.step)
+                    return
+                future = yielded
+            else:
+                future = Future()
+                try:
+                    raise TypeError("Page two yielded %r, but it can only "
+                                    "yield Futures or None." % (yielded,))
+                except TypeError:
+                    future.set_exc_info(sys.exc_info())
+
+
+class Suspension(object):
+    """Model a request that's waiting on page two of a simplate.
+
+    DynamicResource.respond makes one of these and hands it to the network
+    engine's suspend method. Threaded engines call wait, which runs page two
+    to completion and returns (or raises) the Response. Evented engines return
+    the Suspension itself, and Website.__call__ hands it back to them with a
+    resume method that they call after page two is done.
+
+    """
+
+    resume = None # set by Website.__call__; returns a WSGI iterable
+
+    def __init__(self, page_two, finish):
+        """Takes a Coroutine and a callable that returns or raises a Response.
+        """
+        self.page_two = page_two
+        self.finish = finish
+
+    def wait(self):
+        self.page_two.start()
+        self.page_two.join()
+        return self.finish()
+
+    def then(self, callback):
+        """Start page two, and call callback with no arguments when it's done.
+        """
+        self.page_two.add_done_callback(lambda future: callback())
+        self.page_two.start()
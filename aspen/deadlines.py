@@ -0,0 +1,225 @@
+"""Give requests a time budget, report the ones that overrun it, and watch slow
+ones.
+
+Set request_budget_ms to give every request a budget, counting from when it
+arrived. A simplate can set its own budget on page one, which replaces the
+global one for requests it handles (0 means none):
+
+    __budget_ms__ = 5000
+    ^L
+    rows = fetch_report(timeout=request.remaining())
+
+With a budget, request.deadline is the time.time() by which we ought to be
+done, and request.remaining() is the number of seconds left; pass it along as
+the timeout for calls to other services. Without one, both are None.
+
+A request still running past its deadline is reported once, with a snapshot of
+its stack. We can't safely stop a thread from the outside, but coroutine
+simplates (see aspen.coroutines) yield control regularly, so we interrupt
+those: the next time page two resumes after its deadline, a 503 Response is
+raised at the yield.
+
+Budgets are for requests that ought to give up. To find out where requests
+are spending their time, set slow_request_ms instead: we watch every request
+in flight, and one still running after that long has a snapshot of its stack
+logged every slow_request_sample_ms until it finishes. Then we log a summary:
+how long it took, and the innermost frames we caught it in, by count, which
+is usually enough to tell a slow query from lock contention from a heavy
+template. Snapshots are of the request's thread, so under an evented engine
+(where requests share a thread) they show whatever was running at the time,
+except for coroutine simplates suspended on a yield.
+
+"""
+import sys
+import thread
+import threading
+import time
+import traceback
+
+import aspen
+
+
+BUDGET = '__budget_ms__'    # the name to set on page one
+NFRAMES = 5                 # innermost frames to list in a slow summary
+
+
+class Watch(object):
+    """Model what we know about one request in flight.
+    """
+
+    def __init__(self, request, ident):
+        self.request = request
+        self.ident = ident          # of the thread handling it
+        self.overran = False        # reported past its deadline
+        self.next_sample = 0        # time.time() to next snapshot its stack
+        self.nsamples = 0
+        self.innermost = {}         # "file:line in func" -> nsamples
+
+
+class Overseer(object):
+    """Watch requests in flight. Report overruns, and sample slow stacks.
+    """
+
+    interval = 0.1  # seconds between checks
+
+    def __init__(self, slow_ms=0, sample_ms=1000):
+        self.slow = slow_ms / 1000.0            # 0 means don't track
+        self.sample_interval = sample_ms / 1000.0
+        self.watched = {}   # id(request) -> Watch
+        self.lock = threading.Lock()
+        self.thread = None
+        self.noverruns = 0
+        self.nslow = 0
+
+    def stamp(self, request, budget_ms):
+        """Given a Request and a budget in milliseconds, set request.deadline.
+
+        A budget of 0 (or None) means no deadline.
+
+        """
+        if not budget_ms:
+            request.deadline = None
+            if not self.slow:
+                self.unwatch(request)
+            return
+        request.deadline = request.started + budget_ms / 1000.0
+        self.track(request)
+
+    def track(self, request):
+        """Given a Request, watch it until unwatch. It's fine if we are.
+        """
+        self.lock.acquire()
+        try:
+            if id(request) not in self.watched:
+                self.watched[id(request)] = Watch(request, thread.get_ident())
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.watch)
+                self.thread.daemon = True
+                self.thread.start()
+        finally:
+            self.lock.release()
+
+    def unwatch(self, request):
+        """Given a Request, stop watching it. It's fine if we weren't.
+
+        If we sampled its stack because it was slow, log a summary.
+
+        """
+        self.lock.acquire()
+        try:
+            watch = self.watched.pop(id(request), None)
+        finally:
+            self.lock.release()
+        if watch is not None and watch.nsamples:
+            self.summarize(watch, time.time())
+
+    def watch(self):
+        """Check for overruns forever. This runs in its own daemon thread.
+        """
+        try:
+            while 1:
+                time.sleep(self.interval)
+                self.check()
+        except:
+            if time is not None:    # at exit, module globals are set to None
+                raise
+
+    def check(self):
+        """Report requests past their deadline, and sample slow ones.
+
+        Without slow tracking, we stop watching requests once they overrun.
+
+        """
+        now = time.time()
+        overdue = []
+        slow = []
+        self.lock.acquire()
+        try:
+            for watch in self.watched.values():
+                request = watch.request
+                if request.deadline is not None and not watch.overran \
+                                                and request.deadline < now:
+                    watch.overran = True
+                    overdue.append(watch)
+                    if not self.slow:
+                        del self.watched[id(request)]
+                if self.slow and now - request.started >= self.slow \
+                             and now >= watch.next_sample:
+                    watch.next_sample = now + self.sample_interval
+                    slow.append(watch)
+        finally:
+            self.lock.release()
+        for watch in overdue:
+            self.noverruns += 1
+            self.report(watch.request, watch.ident, now)
+        for watch in slow:
+            self.sample(watch, now)
+
+    def report(self, request, ident, now):
+        """Given an overdue Request, its thread's ident, and a time, log it.
+        """
+        frame = self.find_frame(request, ident)
+        over = (now - request.deadline) * 1000
+        aspen.log_dammit("%s %s is %d ms past its deadline:\n%s"
+                         % (request.line.method, request.line.uri.path.raw,
+                            over, format_stack(frame)))
+
+    def sample(self, watch, now):
+        """Given a slow request's Watch and a time, log a stack snapshot.
+        """
+        if not watch.nsamples:
+            self.nslow += 1
+        frame = self.find_frame(watch.request, watch.ident)
+        watch.nsamples += 1
+        if frame is not None:
+            where = "%s:%d in %s" % ( frame.f_code.co_filename
+                                    , frame.f_lineno
+                                    , frame.f_code.co_name
+                                     )
+            watch.innermost[where] = watch.innermost.get(where, 0) + 1
+        elapsed = (now - watch.request.started) * 1000
+        aspen.log_dammit("%s has been running for %d ms (sample %d):\n%s"
+                         % (describe(watch.request), elapsed, watch.nsamples,
+                            format_stack(frame)))
+
+    def summarize(self, watch, now):
+        """Given a slow request's Watch and a time, log where it spent time.
+        """
+        elapsed = (now - watch.request.started) * 1000
+        innermost = sorted( watch.innermost.items()
+                          , key=lambda item: item[1]
+                          , reverse=True
+                           )[:NFRAMES]
+        lines = ["  %3d x %s" % (n, where) for where, n in innermost]
+        aspen.log_dammit("%s finished after %d ms. Innermost frames in %d "
+                         "samples:\n%s"
+                         % (describe(watch.request), elapsed, watch.nsamples,
+                            '\n'.join(lines) or "  (none)"))
+
+    def find_frame(self, request, ident):
+        """Given a Request and its thread's ident, return its current frame.
+        """
+        coroutine = getattr(request, 'coroutine', None)
+        if coroutine is not None and not coroutine.generator.gi_running:
+            return coroutine.generator.gi_frame     # suspended on a yield
+        return sys._current_frames().get(ident)
+
+
+def describe(request):
+    """Given a Request, return its method, path, and file, for logging.
+    """
+    fs = request.fs
+    website = getattr(request, 'website', None)
+    if website is not None and fs.startswith(website.www_root):
+        fs = '.' + fs[len(website.www_root):]
+    out = "%s %s" % (request.line.method, request.line.uri.path.raw)
+    if fs:
+        out += " (%s)" % fs
+    return out
+
+def format_stack(frame):
+    """Given a frame or None, return a formatted stack.
+    """
+    if frame is None:
+        return "  (no stack; it just finished)"
+    return ''.join(traceback.format_stack(frame)).rstrip()
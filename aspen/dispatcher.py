@@ -2,12 +2,14 @@
 """
 import mimetypes
 import os
+import time
 try:                    # python2.6+
     from collections import namedtuple
 except ImportError:     # < python2.6
     from backcompat import namedtuple
 
 from aspen import Response
+from aspen.utils import LRU
 
 
 def debug_noop(*args, **kwargs):
@@ -240,13 +242,115 @@ def match_index(request, indir):
     return None
 
 
-def update_neg_type(request, filename):
+def neg_type(request, filename):
     media_type = mimetypes.guess_type(filename, strict=False)[0]
     if media_type is None:
-        media_type = self.website.media_type_default
-    request.headers['X-Aspen-Accept'] = media_type
+        media_type = request.website.media_type_default
+    return media_type
 
 
+# Caching
+# =======
+# Dispatching lists directories and checks files all the way down the path, so
+# we remember what we decided for each URL path, as a Dispatched. Along with
+# how to update the request (or which status to raise) that records each
+# directory we looked in and its modification time. Adding, removing, or
+# renaming a file changes the mtime of the directory it's in, so we check
+# those on the way out of the cache, and dispatch afresh if any changed.
+#
+# Some filesystems only keep mtimes to the second, though, so a directory
+# stamped in the same second it changed can change again without its mtime
+# moving. We record such a directory as UNVERIFIED, which never matches, so
+# the next lookup dispatches afresh and stamps it again, by which time the
+# second is over.
+
+Dispatched = namedtuple( 'Dispatched'
+                       , 'fs wildcards headers code dirs'.split()
+                        )
+
+
+UNVERIFIED = object()
+
+def stamp(dirs, now=None):
+    """Given a list of directory paths, return a tuple of (path, mtime).
+
+    With now, an mtime no older than the second now is in is UNVERIFIED.
+
+    """
+    out = []
+    for path in dirs:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if now is not None and mtime is not None and int(mtime) >= int(now):
+            mtime = UNVERIFIED
+        out.append((path, mtime))
+    return tuple(out)
+
+
+class DispatchCache(object):
+    """Remember dispatch results by URL path, for hits and misses separately.
+
+    We keep misses (400 and 404) apart from everything else, with a smaller
+    limit, so that a scanner trying lots of paths that aren't there can't push
+    out the ones that are.
+
+    """
+
+    def __init__(self, maxsize, maxmisses):
+        self.found = LRU(maxsize)
+        self.missing = LRU(maxmisses)
+        self.nlookups = 0   # since we started [int]
+        self.nhits = 0      # since we started [int]
+        self.nstale = 0     # entries dropped because www_root changed [int]
+
+    def get(self, key):
+        """Given a key, return a Dispatched that's still good, or None.
+        """
+        self.nlookups += 1
+        for lru in (self.found, self.missing):
+            dispatched = lru.get(key)
+            if dispatched is not None:
+                dirs = [path for path, mtime in dispatched.dirs]
+                if stamp(dirs) == dispatched.dirs:
+                    self.nhits += 1
+                    return dispatched
+                lru.pop(key)
+                self.nstale += 1
+                return None
+        return None
+
+    def put(self, key, dispatched):
+        """Given a key and a Dispatched, remember it.
+        """
+        if dispatched.code in (400, 404):
+            self.missing[key] = dispatched
+        else:
+            self.found[key] = dispatched
+
+    def clear(self):
+        self.found.clear()
+        self.missing.clear()
+
+    def metrics(self):
+        """Return a dictionary of statistics about this cache.
+        """
+        hits, lookups = self.nhits, self.nlookups
+        return { 'found': len(self.found)
+               , 'found_maxsize': self.found.maxsize
+               , 'missing': len(self.missing)
+               , 'missing_maxsize': self.missing.maxsize
+               , 'hits': hits
+               , 'lookups': lookups
+               , 'hit_rate': lookups and float(hits) / lookups or 0.0
+               , 'stale': self.nstale
+                }
+
+
+# Dispatching
+# ===========
+
 def dispatch(request, pure_dispatch=False):
     """Concretize dispatch_abstract.
 
@@ -262,29 +366,86 @@ def dispatch(request, pure_dispatch=False):
     intercept_socket(request)
 
 
+    # Dispatch, or remember how we did last time.
+    # ===========================================
+    # Socket requests have a different path every time, so we don't bother.
+
+    cache = getattr(request.website, 'dispatch_cache', None)
+    if pure_dispatch or request.socket is not None or cache is None:
+        dispatched = find(request, pure_dispatch)
+    else:
+        key = (request.website.www_root, request.line.uri.path.raw)
+        dispatched = cache.get(key)
+        if dispatched is None:
+            dispatched = find(request, pure_dispatch)
+            cache.put(key, dispatched)
+
+
+    # Update the request, or raise.
+    # =============================
+
+    if dispatched.code == 301:                      # trailing-slash redirect
+        uri = request.line.uri
+        location = uri.path.raw + '/'
+        if uri.querystring.raw:
+            location += '?' + uri.querystring.raw
+        raise Response(301, headers={'Location': location})
+    elif dispatched.code is not None:
+        raise Response(dispatched.code)
+
+    request.fs = dispatched.fs
+    for k, v in dispatched.headers:
+        request.headers[k] = v
+    for k, v in dispatched.wildcards:
+        request.line.uri.path[k] = v
+
+
+def find(request, pure_dispatch=False):
+    """Given a request, return a Dispatched, without changing the request.
+    """
+
     # Set up the real environment for the dispatcher.
     # ===============================================
 
-    listnodes = os.listdir
+    dirs = []           # the directories we look in, for DispatchCache
+    headers = []
+
+    def listnodes(path):
+        dirs.append(path)
+        return os.listdir(path)
+
+    def find_index(path):
+        dirs.append(path)
+        return match_index(request, path)
+
+    def noext_matched(filename):
+        media_type = neg_type(request, filename)
+        headers.append(('X-Aspen-Accept', media_type))
+
     is_leaf = os.path.isfile
     traverse = os.path.join
-    find_index = lambda x: match_index(request, x)
-    noext_matched = lambda x: update_neg_type(request, x)
     startdir = request.website.www_root
     pathsegs = request.line.uri.path.decoded.lstrip('/').split('/')
 
+    def dispatched(fs=None, wildcards=(), code=None):
+        return Dispatched(fs, tuple(wildcards), tuple(headers), code,
+                          stamp(dirs, time.time()))
+
 
     # Dispatch!
     # =========
 
-    result = dispatch_abstract( listnodes
-                              , is_leaf
-                              , traverse
-                              , find_index
-                              , noext_matched
-                              , startdir
-                              , pathsegs
-                               )
+    try:
+        result = dispatch_abstract( listnodes
+                                   , is_leaf
+                                   , traverse
+                                   , find_index
+                                   , noext_matched
+                                   , startdir
+                                   , pathsegs
+                                    )
+    except Response, response:      # from _typecast
+        return dispatched(code=response.code)
 
     debug(lambda: "dispatch_abstract returned: " + repr(result))
 
@@ -298,8 +459,7 @@ def dispatch(request, pure_dispatch=False):
         if request.line.uri.path.raw == '/favicon.ico':
             if result.status != DispatchStatus.okay:
                 path = request.line.uri.path.raw[1:]
-                request.fs = request.website.find_ours(path)
-                return
+                return dispatched(request.website.find_ours(path))
 
 
         # robots.txt
@@ -310,7 +470,7 @@ def dispatch(request, pure_dispatch=False):
         if request.line.uri.path.raw == '/robots.txt':
             if result.status != DispatchStatus.missing:
                 if not result.match.endswith('robots.txt'):
-                    raise Response(404)
+                    return dispatched(code=404)
 
 
     # Handle returned states.
@@ -319,26 +479,20 @@ def dispatch(request, pure_dispatch=False):
     if result.status == DispatchStatus.okay:
         if result.match.endswith('/'):              # autoindex
             if not request.website.list_directories:
-                raise Response(404)
+                return dispatched(code=404)
             autoindex = request.website.ours_or_theirs('autoindex.html')
             assert autoindex is not None # sanity check
-            request.headers['X-Aspen-AutoIndexDir'] = result.match
-            request.fs = autoindex
-            return  # return so we skip the no-escape check
+            headers.append(('X-Aspen-AutoIndexDir', result.match))
+            return dispatched(autoindex)    # skip the no-escape check
         else:                                       # normal match
-            request.fs = result.match
-            for k, v in result.wildcards.iteritems():
-                request.line.uri.path[k] = v
+            fs = result.match
+            wildcards = result.wildcards.items()
 
     elif result.status == DispatchStatus.non_leaf:  # trailing-slash redirect
-        uri = request.line.uri
-        location = uri.path.raw + '/'
-        if uri.querystring.raw:
-            location += '?' + uri.querystring.raw
-        raise Response(301, headers={'Location': location})
+        return dispatched(code=301)
 
     elif result.status == DispatchStatus.missing:   # 404
-        raise Response(404)
+        return dispatched(code=404)
 
     else:
         raise Response(500, "Unknown result status.")
@@ -347,6 +501,7 @@ def dispatch(request, pure_dispatch=False):
     # Protect against escaping the www_root.
     # ======================================
 
-    if not request.fs.startswith(startdir):
-        raise Response(404)
+    if not fs.startswith(startdir):
+        return dispatched(code=404)
 
+    return dispatched(fs, wildcards)
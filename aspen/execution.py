@@ -1,7 +1,12 @@
 """Implement re-execution of the aspen process.
 
 When files change on the filesystem or we receive HUP, we want to re-execute
-ourselves.
+ourselves. File descriptors are closed across the exec, except for those that
+have been passed to inherit (aspen.prefork uses this to hold onto its
+listening socket).
+
+We also re-execute, or in aspen.prefork are replaced, when we wear out: once
+we've served max_requests requests, or grown past max_rss megabytes.
 
 For thoughts on a more sophisticated approach, see:
 
@@ -12,10 +17,15 @@ import os
 import sys
 
 import aspen
+import aspen.logging
+
+
+MB = 1024 * 1024
 
 
 extras = set()
 mtimes = {}
+inherited = set()
 
 
 ###############################################################################
@@ -52,6 +62,7 @@ def _do_execv():
     """
     args = sys.argv[:]
     aspen.log_dammit("Re-executing %s." % ' '.join(args))
+    aspen.logging.flush()   # execv doesn't run atexit handlers
 
     if sys.platform[:4] == 'java':
         from _systemrestart import SystemRestart
@@ -78,13 +89,19 @@ def _set_cloexec():
 
     Set self.max_cloexec_files to 0 to disable this behavior.
 
+    File descriptors passed to inherit are left open for the new process.
+
     """
     for fd in range(3, max_cloexec_files):  # skip stdin/out/err
         try:
             flags = fcntl.fcntl(fd, fcntl.F_GETFD)
         except IOError:
             continue
-        fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+        if fd in inherited:
+            flags &= ~fcntl.FD_CLOEXEC
+        else:
+            flags |= fcntl.FD_CLOEXEC
+        fcntl.fcntl(fd, fcntl.F_SETFD, flags)
 
 #
 ###############################################################################
@@ -99,6 +116,11 @@ def clear_changes():
 def if_changes(filename):
     extras.add(filename)
 
+def inherit(fd):
+    """Given a file descriptor, keep it open when we re-execute.
+    """
+    inherited.add(fd)
+
 
 def check_one(filename):
     """Given a filename, return None or restart.
@@ -146,12 +168,64 @@ def check_all():
         check_one(filepath)
 
 
+# Recycling
+# =========
+
+def rss():
+    """Return the resident set size of this process in bytes, or None.
+
+    On Linux we read the current size from /proc. Elsewhere the best we can do
+    is the peak size, from getrusage.
+
+    """
+    try:
+        statm = open('/proc/self/statm').read().split()
+    except IOError:
+        try:
+            import resource
+        except ImportError:     # Windows
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return sys.platform == 'darwin' and peak or peak * 1024
+    return int(statm[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def worn_out(website):
+    """Given a Website, return a reason to recycle the process, or None.
+    """
+    if website.max_requests and website.nrequests >= website.max_requests:
+        return "served %d requests" % website.nrequests
+    if website.max_rss:
+        size = rss()
+        if size is not None and size >= website.max_rss * MB:
+            return "using %d MB of memory" % (size // MB)
+    return None
+
+def check_wear(website, reasons):
+    """Given a Website and a list, interrupt the engine if we're worn out.
+
+    The reason goes on the list, so that whoever started the engine knows to
+    drain it and replace us. We only interrupt once.
+
+    """
+    if reasons:
+        return
+    reason = worn_out(website)
+    if reason is not None:
+        aspen.log_dammit("Recycling after %s." % reason)
+        reasons.append(reason)
+        website.network_engine.interrupt()
+
+
 # Setup
 # =====
 
-def install(website):
-    """Given a Website instance, start a loop over check_all.
+def install(website, check=check_all):
+    """Given a Website instance and a callable, start a loop over the latter.
+
+    Engines keep only one loop, so callers with more than one thing to check
+    (changes and wear, say) should combine them into one callable.
+
     """
     for script_path in website.configuration_scripts:
         if_changes(script_path)
-    website.network_engine.start_checking(check_all)
+    website.network_engine.start_checking(check)
@@ -1,6 +1,55 @@
 """Give users some control over the server and request lifecycles.
+
+A hook registered with a path only runs for requests whose URL path it
+applies to: a string is a prefix, and anything else with a match method (a
+compiled regex, say) is matched against the start of the path:
+
+    website.hooks.inbound_early.register(check_api_key, path='/api/')
+    website.hooks.outbound_late.register(no_cache, re.compile('/[^/]+/edit'))
+
+Hooks still run in the order they were registered. The first time a Hook runs
+after a registration we compile its hooks into a plan: the unscoped hooks, a
+table of prefixes for each prefix length, and the patterns. Picking the hooks
+for a request is then a dictionary lookup per distinct prefix length, plus a
+match per pattern, instead of a call to every hook. Startup and shutdown hooks
+(and any others that aren't given a request or response) run only their
+unscoped hooks.
+
+Hooks(names, timed=True) times every hook call, in seconds, in the
+aspen_hook_seconds histogram in aspen.metrics.REGISTRY, labeled with the
+section and the hook's name. A website's hooks are timed if it has a
+metrics_path.
+
 """
+from timeit import default_timer as clock
+
 from aspen import is_callable
+from aspen.metrics import REGISTRY
+
+
+TIMES = REGISTRY.histogram( 'aspen_hook_seconds'
+                          , "Time spent in each hook."
+                          , ('section', 'hook')
+                           )
+
+
+def name_of(obj):
+    """Given a callable, return a name for it, for timing.
+    """
+    name = getattr(obj, '__name__', None) or obj.__class__.__name__
+    module = getattr(obj, '__module__', None)
+    if module:
+        name = '%s.%s' % (module, name)
+    return name
+
+def path_of(thing):
+    """Given a request, response, or website, return a URL path or None.
+    """
+    request = getattr(thing, 'request', thing)  # a Response has a request
+    try:
+        return request.line.uri.path.raw
+    except AttributeError:
+        return None
 
 
 class Hooks(dict):
@@ -10,14 +59,14 @@ class Hooks(dict):
 
     """
 
-    def __init__(self, names):
-        """Takes a list of hook names.
+    def __init__(self, names, timed=False):
+        """Takes a list of hook names, and whether to time hook calls.
         """
         if isinstance(names, basestring):
             raise TypeError("Please pass in an iterable of unicodes.")
         self.__names = names
         for name in names:
-            hook = Hook()
+            hook = Hook(name, timed)
             try:
                 setattr(self, name, hook)
             except NameError:
@@ -31,35 +80,126 @@ class Hooks(dict):
     def __setitem__(self, name, value):
         raise NotImplementedError("Please use attribute access.")
 
-    def register(self, obj):
+    def register(self, obj, path=None):
         """Convenience - hand this an object with methods on it named after
-           the hookpoints and it will register them all
+           the hookpoints and it will register them all, for path if given
         """
         for name in self.__names:
             hook = getattr(obj, name, None)
             if hook is not None:
                 hookpoint = getattr(self, name)
-                hookpoint.register(hook)
+                hookpoint.register(hook, path)
+
+
+class Plan(object):
+    """Model the hooks of a Hook, compiled for picking by URL path.
+
+    Hooks are referred to by their index in the Hook.
+
+    """
+
+    def __init__(self, scopes):
+        """Takes a list of scopes: None, a prefix, or a pattern, per hook.
+        """
+        self.everywhere = []    # indices of unscoped hooks
+        self.prefixes = []      # (length, {prefix: [indices]}), by length
+        self.patterns = []      # (index, pattern)
+        self.scoped = False     # whether there's anything but everywhere
+
+        by_length = {}
+        for i, scope in enumerate(scopes):
+            if scope is None:
+                self.everywhere.append(i)
+            elif isinstance(scope, basestring):
+                table = by_length.setdefault(len(scope), {})
+                table.setdefault(scope, []).append(i)
+            else:
+                self.patterns.append((i, scope))
+        self.prefixes = sorted(by_length.items())
+        self.scoped = bool(self.prefixes or self.patterns)
+
+    def pick(self, path):
+        """Given a URL path or None, return a sorted list of indices.
+        """
+        indices = list(self.everywhere)
+        if path is not None:
+            n = len(path)
+            for length, table in self.prefixes:
+                if length > n:
+                    break
+                found = table.get(path[:length])
+                if found is not None:
+                    indices.extend(found)
+            for i, pattern in self.patterns:
+                if pattern.match(path) is not None:
+                    indices.append(i)
+            indices.sort()
+        return indices
 
 
 class Hook(list):
     """Model a single point where callbacks can be registered.
     """
 
+    def __init__(self, name='', timed=False):
+        list.__init__(self)
+        self.name = name
+        self.timed = timed      # whether to observe TIMES; see run
+        self.scopes = []        # None, a prefix, or a pattern, per hook
+        self.names = []         # per hook, for timing
+        self.plan = None        # compiled on the next run; see compile
+
     def append(self, obj):
         raise NotImplementedError("Please use register.")
 
-    def register(self, obj):
+    def register(self, obj, path=None):
         """Extend to ensure that obj is callable. Could check signature, too.
+
+        If path is given, obj only runs for requests whose URL path starts
+        with it (a string) or matches it (anything with a match method).
+
         """
         if not is_callable(obj):
             raise TypeError("Hooks must be callable objects; this isn't: %s."
                             % str(obj))
+        if path is not None and not isinstance(path, basestring) \
+                            and not hasattr(path, 'match'):
+            raise TypeError("A hook's path must be a string prefix or have a "
+                            "match method; this doesn't: %s." % str(path))
         list.append(self, obj)
+        self.scopes.append(path)
+        self.names.append(name_of(obj))
+        self.plan = None
+
+    def compile(self):
+        """Compile our hooks into a Plan, and return it.
+        """
+        self.plan = Plan(self.scopes)
+        return self.plan
+
+    def pick(self, thing):
+        """Given a request, response, or website, return indices of hooks.
+        """
+        plan = self.plan
+        if plan is None:
+            plan = self.compile()
+        if not plan.scoped:
+            return plan.everywhere
+        return plan.pick(path_of(thing))
 
     def run(self, thing):
         """Takes a request/response/website.
         """
-        for hook in self:
-            thing = hook(thing) or thing
+        if not self:
+            return thing
+        if not self.timed:
+            for i in self.pick(thing):
+                thing = self[i](thing) or thing
+            return thing
+        for i in self.pick(thing):
+            start = clock()
+            try:
+                thing = self[i](thing) or thing
+            finally:
+                TIMES.observe(clock() - start, (self.name, self.names[i]))
         return thing
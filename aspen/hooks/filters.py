@@ -1,19 +1,30 @@
+"""Filters for hooks, deciding per request whether to run them.
+
+For a prefix or a regex it's cheaper to register the hook with a path; see
+aspen.hooks.
+
+"""
 import re
 
 
 def by_regex(hook, regex_tuples, default=True):
     """A filter for hooks. regex_tuples is a list of (regex, filter?) where if the regex matches
        the requested URI, then the hook is applied or not based on if filter? is True or False.
+       A dictionary works too, but then the regexes are tried in no particular order.
     """
-    regex_res = [ (re.compile(regex), disposition) for regex, disposition in regex_tuples.iteritems() ]
+    if hasattr(regex_tuples, 'items'):
+        regex_tuples = regex_tuples.items()
+    regex_res = [ (re.compile(regex), disposition) for regex, disposition in regex_tuples ]
     def filtered_hook(request):
         for regex, disposition in regex_res:
-            if regex.matches(request.line.uri):
+            if regex.match(request.line.uri):
                 if disposition:
                     return hook(request)
                 else:
                     return request
-        return default
+        if default:
+            return hook(request)
+        return request
     return filtered_hook
 
 
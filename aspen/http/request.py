@@ -29,6 +29,7 @@ import cgi
 import mimetypes
 import re
 import sys
+import time
 import urllib
 import urlparse
 from cStringIO import StringIO
@@ -37,6 +38,7 @@ from aspen import Response
 from aspen.http.baseheaders import BaseHeaders
 from aspen.http.mapping import Mapping
 from aspen.context import Context
+from aspen.tracing import NULL_TRACE
 from aspen.utils import ascii_dammit, typecheck
 
 
@@ -165,6 +167,9 @@ class Request(str):
     original_resource = None
     server_software = ''
     fs = '' # the file on the filesystem that will handle this request
+    deadline = None # a time.time() to be done by, or None; see aspen.deadlines
+    profile = None  # a cProfile.Profile, or None; see aspen.profiling
+    trace = NULL_TRACE  # see aspen.tracing
 
     # NB: no __slots__ for str:
     #   http://docs.python.org/reference/datamodel.html#__slots__
@@ -177,6 +182,7 @@ class Request(str):
         obj = str.__new__(cls, '') # start with an empty string, see below for
                                    # laziness
         obj.server_software = server_software
+        obj.started = time.time()
         try:
             obj.line = Line(method, uri, version)
             if not headers:
@@ -266,6 +272,17 @@ class Request(str):
         if self.line.method not in methods:
             raise Response(405, headers={'Allow': ', '.join(methods)})
 
+    def remaining(self):
+        """Return the number of seconds left until our deadline, or None.
+
+        Pass this along as the timeout for calls to other services, so that
+        they don't outlast the request. It's never less than zero.
+
+        """
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.time())
+
     def is_xhr(self):
         """Check the value of X-Requested-With.
         """
@@ -14,14 +14,21 @@ class CloseWrapper(object):
     """Conform to WSGI's facility for running code *after* a response is sent.
     """
 
+    span = None
+
     def __init__(self, request, body):
         self.request = request
         self.body = body
+        trace = getattr(request, 'trace', None)
+        if trace is not None:   # see aspen.tracing
+            self.span = trace.span('response.write')
 
     def __iter__(self):
         return iter(self.body)
 
     def close(self):
+        if self.span is not None:
+            self.span.finish()
         socket = getattr(self.request, "socket", None)
         if socket is not None:
             pass
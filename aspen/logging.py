@@ -15,18 +15,34 @@ that your application will have its own wrapper(s).
 
 Unicode objects are encoded as UTF-8. Bytestrings are passed through as-is.
 
+By default each call to log writes to stdout and flushes it right then, on the
+calling thread. Under load that serializes request threads on stdout. Call
+buffer (Website does, when logging_buffer is set) to have log append lines to
+a bounded in-memory buffer instead, which a Writer thread of its own writes
+out in batches: whenever the buffer is half full, and every flush_seconds
+otherwise. When the buffer is full, the policy decides what happens:
+
+    drop_oldest     make room by throwing away the oldest line
+    block           wait for the writer to make room
+
+Dropped lines are counted and reported in the log when there's room again.
+
 """
 from __future__ import with_statement
+import atexit
+import collections
 import os
 import pprint
 import sys
 import thread
 import threading
+import time
 
 
 LOGGING_THRESHOLD = -1
 PID = os.getpid()
 LOCK = threading.Lock()
+WRITER = None   # a Writer, when we're buffered
 
 
 def stringify(o):
@@ -50,17 +66,189 @@ def log(*messages, **kw):
                                             , thread.get_ident()
                                             , t.getName()
                                              )
+        # Log lines from different threads can get interleaved, but that's
+        # okay, because we prepend lines with thread identifiers that can be
+        # used to reassemble log messages per-thread.
+        lines = []
         for message in messages:
             message = stringify(message)
             for line in message.splitlines():
-                with LOCK:
-                    # Log lines can get interleaved, but that's okay, because
-                    # we prepend lines with thread identifiers that can be used
-                    # to reassemble log messages per-thread.
-                    print fmt % line
-                    sys.stdout.flush()
+                lines.append(fmt % line)
+        write(lines)
 
 
 def log_dammit(*messages):
     log(*messages, **{'level': 1})
     #log(*messages, level=1)  <-- SyntaxError in Python 2.5
+
+
+# Writing
+# =======
+
+def write(lines):
+    """Given a list of bytestrings, write each out as a line, as is.
+    """
+    writer = WRITER
+    if writer is not None:
+        writer.put(lines)
+    elif lines:
+        with LOCK:
+            sys.stdout.write('\n'.join(lines) + '\n')
+            sys.stdout.flush()
+
+def buffer(maxsize, policy='drop_oldest', flush_seconds=0.1):
+    """Given an int, a policy, and a float, start buffering log lines.
+
+    Any Writer we already had is flushed and replaced. A maxsize of 0 means
+    stop buffering, and write lines out as they're logged again.
+
+    """
+    global WRITER
+    old, WRITER = WRITER, None
+    if old is not None:
+        old.stop()
+    if maxsize > 0:
+        WRITER = Writer(maxsize, policy, flush_seconds)
+
+def flush():
+    """Write out any buffered lines now.
+
+    Call this before the process exits or re-executes without running atexit
+    handlers (os._exit, os.execv).
+
+    """
+    if WRITER is not None:
+        WRITER.flush()
+
+def after_fork():
+    """Start a fresh Writer in a child process, if we're buffered.
+
+    The parent's writer thread doesn't survive fork, and its lock might have
+    been held by some other thread when we forked. Flush before forking, or
+    lines buffered in the parent will be written twice.
+
+    """
+    global WRITER
+    if WRITER is not None:
+        old = WRITER
+        WRITER = Writer(old.maxsize, old.policy, old.flush_seconds)
+
+atexit.register(flush)
+
+
+class Writer(object):
+    """Write log lines from a bounded buffer, on a thread of our own.
+    """
+
+    def __init__(self, maxsize, policy='drop_oldest', flush_seconds=0.1):
+        """Takes an int, a policy (see the module docstring), and a float.
+        """
+        self.maxsize = maxsize
+        self.policy = policy
+        self.flush_seconds = flush_seconds
+        self.batch = max(1, maxsize // 2)   # wake the writer at this depth
+        self.lines = collections.deque()
+        self.lock = threading.Condition()
+        self.flushing = threading.Lock()    # keep batches in order
+        self.stopping = False
+        self.high_water = 0     # the deepest we've been [int]
+        self.ndropped = 0       # lines lost to overflow [int]
+        self.nreported = 0      # dropped lines we've told about [int]
+        self.nwritten = 0       # since we started [int]
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def put(self, lines):
+        """Given a list of bytestrings, buffer them for writing.
+        """
+        self.lock.acquire()
+        try:
+            for line in lines:
+                if len(self.lines) >= self.maxsize:
+                    if self.policy == 'block' and not self.stopping:
+                        self.wait_for_room()
+                    else:
+                        self.lines.popleft()
+                        self.ndropped += 1
+                self.lines.append(line)
+            depth = len(self.lines)
+            if depth > self.high_water:
+                self.high_water = depth
+            if depth >= self.batch:
+                self.lock.notifyAll()
+        finally:
+            self.lock.release()
+
+    def wait_for_room(self):
+        """Block until the writer has made room. Called with self.lock held.
+        """
+        while len(self.lines) >= self.maxsize and not self.stopping:
+            self.lock.notifyAll()
+            self.lock.wait(self.flush_seconds)
+        while len(self.lines) >= self.maxsize:  # stopped underneath us
+            self.lines.popleft()
+            self.ndropped += 1
+
+    def run(self):
+        """Write out batches of lines until stopped. This is our thread.
+        """
+        try:
+            while not self.stopping:
+                self.lock.acquire()
+                try:
+                    if len(self.lines) < self.batch:
+                        self.lock.wait(self.flush_seconds)
+                finally:
+                    self.lock.release()
+                self.flush()
+        except:
+            if time is not None:    # at exit, module globals are set to None
+                raise
+
+    def flush(self):
+        """Write out everything that's buffered, in one go.
+        """
+        self.flushing.acquire()
+        try:
+            self.lock.acquire()
+            try:
+                lines = list(self.lines)
+                self.lines.clear()
+                ndropped = self.ndropped - self.nreported
+                self.nreported = self.ndropped
+                self.lock.notifyAll()   # there's room now
+            finally:
+                self.lock.release()
+            if ndropped:
+                lines.append("pid-%s Dropped %d log lines; the buffer was "
+                             "full." % (PID, ndropped))
+            if lines:
+                sys.stdout.write('\n'.join(lines) + '\n')
+                sys.stdout.flush()
+                self.nwritten += len(lines)
+        finally:
+            self.flushing.release()
+
+    def stop(self):
+        """Write out what's buffered, and stop our thread.
+        """
+        self.lock.acquire()
+        try:
+            self.stopping = True
+            self.lock.notifyAll()
+        finally:
+            self.lock.release()
+        if self.thread is not threading.currentThread():
+            self.thread.join()
+        self.flush()
+
+    def metrics(self):
+        """Return a dictionary of statistics about this buffer.
+        """
+        return { 'depth': len(self.lines)
+               , 'maxsize': self.maxsize
+               , 'high_water': self.high_water
+               , 'dropped': self.ndropped
+               , 'written': self.nwritten
+                }
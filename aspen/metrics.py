@@ -0,0 +1,523 @@
+"""Count what a website is doing, and serve it in Prometheus's text format.
+
+Set metrics_path and a GET for it returns every metric we keep, in the format
+Prometheus scrapes (version 0.0.4):
+
+    $ aspen --metrics_path=/_metrics
+    $ curl http://localhost:8080/_metrics
+    # HELP aspen_requests_total Requests answered, by status code.
+    # TYPE aspen_requests_total counter
+    aspen_requests_total{code="200"} 1027
+    ...
+
+We keep three kinds of metric: a Counter only goes up, a Gauge is whatever it
+is right now, and a Histogram counts observations (request latencies, say) in
+buckets. Most gauges, and counters that something else already keeps, are
+Callbacks, which ask for their value when we render, so they cost nothing
+between scrapes.
+
+Counters and histograms are updated on every request, so they're sharded by
+thread: each thread writes to its own dictionary without a lock, and we add up
+the shards when we render. A thread's shard outlives the thread (its counts
+still count) and is reused by the next thread with the same ident. Past
+MAX_SHARDS threads (greenlets look like threads to us under gevent and
+eventlet) we fall back to one shared shard under a lock.
+
+Metrics for a website are in website.metrics, a WebsiteMetrics. Modules that
+don't know about a website (resources, the auth modules) register theirs with
+REGISTRY here, and we render that along with the website's. With multiple
+workers (see aspen.prefork) each worker counts for itself, and a scrape sees
+whichever worker answers it.
+
+The metrics_path is answered before inbound hooks run, so it isn't behind
+website.protected or any auth hook. Its output includes the paths of
+resources under www_root, so keep it off the public internet.
+
+"""
+import bisect
+import threading
+import time
+from thread import get_ident
+
+import aspen
+from aspen.http.response import Response
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+MAX_SHARDS = 64
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Formatting
+# ==========
+
+def escape(value, help=False):
+    """Given a label value (or help text), return it escaped for the format.
+    """
+    if isinstance(value, unicode):
+        value = value.encode('UTF-8')
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    if not help:
+        value = value.replace('"', '\\"')
+    return value
+
+def format_value(value):
+    """Given a number, return a string the format accepts.
+    """
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return value > 0 and '+Inf' or '-Inf'
+        return repr(value)
+    return str(value)
+
+def format_labels(names, values):
+    """Given sequences of label names and values, return '{a="b",...}'.
+    """
+    if not names:
+        return ''
+    pairs = ['%s="%s"' % (name, escape(value))
+             for name, value in zip(names, values)]
+    return '{%s}' % ','.join(pairs)
+
+
+# Metrics
+# =======
+
+class Metric(object):
+    """Represent a family of time series that share a name.
+
+    Label values are passed as a tuple of strings, in the order of the label
+    names given at construction.
+
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self):
+        """Return a list of (suffix, label names, label values, value).
+        """
+        raise NotImplementedError
+
+    def render(self):
+        """Return the lines for this metric, or [] if it has no samples.
+        """
+        samples = self.samples()
+        if not samples:
+            return []
+        lines = [ "# HELP %s %s" % (self.name, escape(self.help, help=True))
+                , "# TYPE %s %s" % (self.name, self.type)
+                 ]
+        for suffix, names, values, value in samples:
+            lines.append("%s%s%s %s" % ( self.name
+                                       , suffix
+                                       , format_labels(names, values)
+                                       , format_value(value)
+                                        ))
+        return lines
+
+
+class Sharded(Metric):
+    """A Metric whose values are kept in one dictionary per thread.
+    """
+
+    def __init__(self, name, help, labels=()):
+        Metric.__init__(self, name, help, labels)
+        self.shards = {}        # thread ident -> {label values: value}
+        self.shared = {}        # for threads past MAX_SHARDS
+        self.lock = threading.Lock()
+
+    def shard(self):
+        """Return the calling thread's shard, or None to use the shared one.
+        """
+        ident = get_ident()
+        self.lock.acquire()
+        try:
+            if ident in self.shards:
+                return self.shards[ident]
+            if len(self.shards) >= MAX_SHARDS:
+                return None
+            shard = self.shards[ident] = {}
+            return shard
+        finally:
+            self.lock.release()
+
+    def update(self, shard, values, amount):
+        """Given a shard, label values, and an amount, record it.
+        """
+        raise NotImplementedError
+
+    def record(self, values, amount):
+        shard = self.shards.get(get_ident())
+        if shard is None:
+            shard = self.shard()
+            if shard is None:
+                self.lock.acquire()
+                try:
+                    self.update(self.shared, values, amount)
+                finally:
+                    self.lock.release()
+                return
+        self.update(shard, values, amount)
+
+    def merged(self):
+        """Return a list of (label values, value) summed across shards.
+        """
+        self.lock.acquire()
+        try:
+            shards = self.shards.values()
+            shared = self.shared.items()
+        finally:
+            self.lock.release()
+        totals = {}
+        for items in [shard.items() for shard in shards] + [shared]:
+            for values, value in items:
+                if values in totals:
+                    totals[values] = self.add(totals[values], value)
+                else:
+                    totals[values] = self.add(None, value)
+        return sorted(totals.items())
+
+
+class Counter(Sharded):
+    """A number that only goes up.
+    """
+
+    type = 'counter'
+
+    def inc(self, values=(), amount=1):
+        """Given label values and an amount, count it.
+        """
+        self.record(values, amount)
+
+    def update(self, shard, values, amount):
+        shard[values] = shard.get(values, 0) + amount
+
+    def add(self, total, value):
+        return (total or 0) + value
+
+    def value(self, values=()):
+        """Given label values, return the count so far.
+        """
+        return dict(self.merged()).get(values, 0)
+
+    def samples(self):
+        return [('', self.labels, values, value)
+                for values, value in self.merged()]
+
+
+class Histogram(Sharded):
+    """Count observations in buckets, and keep their sum.
+
+    A shard maps label values to a list: a count per bucket (not cumulative;
+    the last bucket is +Inf), then the sum, then the count.
+
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        Sharded.__init__(self, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.size = len(self.buckets) + 3
+
+    def observe(self, value, values=()):
+        """Given a number and label values, count it.
+        """
+        self.record(values, value)
+
+    def update(self, shard, values, amount):
+        row = shard.get(values)
+        if row is None:
+            row = shard[values] = [0] * self.size
+        row[bisect.bisect_left(self.buckets, amount)] += 1
+        row[-2] += amount
+        row[-1] += 1
+
+    def add(self, total, row):
+        if total is None:
+            return list(row)
+        return [a + b for a, b in zip(total, row)]
+
+    def samples(self):
+        samples = []
+        names = self.labels + ('le',)
+        bounds = [format_value(float(b)) for b in self.buckets] + ['+Inf']
+        for values, row in self.merged():
+            cumulative = 0
+            for bound, count in zip(bounds, row):
+                cumulative += count
+                samples.append(('_bucket', names, values + (bound,),
+                                cumulative))
+            samples.append(('_sum', self.labels, values, row[-2]))
+            samples.append(('_count', self.labels, values, row[-1]))
+        return samples
+
+
+class Gauge(Metric):
+    """A number that's whatever we last set it to.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        Metric.__init__(self, name, help, labels)
+        self.values = {}
+
+    def set(self, value, values=()):
+        self.values[values] = value
+
+    def samples(self):
+        return [('', self.labels, values, value)
+                for values, value in sorted(self.values.items())]
+
+
+class Callback(Metric):
+    """A metric whose value we ask for when we render.
+
+    The callable takes no arguments and returns a number, or a dictionary of
+    label values to numbers, or None if there's nothing to report right now.
+
+    """
+
+    def __init__(self, name, type, help, func, labels=()):
+        Metric.__init__(self, name, help, labels)
+        self.type = type
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [('', self.labels, values, value)
+                for values, value in sorted(value.items())
+                if value is not None]
+
+
+# Registries
+# ==========
+
+class Registry(object):
+    """Hold metrics, in the order they're rendered.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.names = set()
+
+    def register(self, metric):
+        if metric.name in self.names:
+            raise ValueError("There's already a metric named %s."
+                             % metric.name)
+        self.names.add(metric.name)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, type, help, func, labels=()):
+        return self.register(Callback(name, type, help, func, labels))
+
+    def render(self):
+        """Return the text format for all of our metrics, as a bytestring.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return ''.join([line + '\n' for line in lines])
+
+
+REGISTRY = Registry()   # process-wide; see the module docstring
+
+
+# Website
+# =======
+
+ENGINE = { 'threads': "Worker threads in the network engine's pool."
+         , 'threads_busy': "Worker threads handling a connection."
+         , 'threads_idle': "Worker threads waiting for a connection."
+         , 'queued': "Accepted connections waiting for a worker thread."
+         , 'connections': "Open connections."
+         , 'connections_busy': "Connections with a request in flight."
+         , 'callbacks': "Callbacks waiting to run on the event loop."
+         , 'timeouts': "Timeouts scheduled on the event loop."
+          }
+
+class WebsiteMetrics(Registry):
+    """Hold the metrics for a Website, and answer requests for metrics_path.
+    """
+
+    def __init__(self, website):
+        Registry.__init__(self)
+        self.website = website
+        self.www_root = website.www_root
+
+        # Requests
+        self.requests = self.counter( 'aspen_requests_total'
+                                    , "Requests answered, by status code."
+                                    , ('code',)
+                                     )
+        self.latency = self.histogram( 'aspen_request_duration_seconds'
+                                     , "Time to answer a request, by the "
+                                       "resource under www_root that "
+                                       "answered it."
+                                     , ('resource',)
+                                      )
+        self.add_admission()
+        self.add_caches()
+        self.add_engine()
+        self.add_sockets()
+        self.add_overseer()
+        self.add_logging()
+
+    def add_admission(self):
+        metrics = self.website.admission.metrics
+        get = lambda key: lambda: metrics()[key]
+        for key, type, help in [
+                ('in_flight', 'gauge', "Requests being handled.")
+              , ('queued', 'gauge', "Requests waiting for admission.")
+              , ('admitted', 'counter', "Requests admitted.")
+              , ('shed', 'counter', "Requests turned away with a 503.")
+                ]:
+            name = 'aspen_admission_' + key
+            if type == 'counter':
+                name += '_total'
+            self.callback(name, type, help, get(key))
+
+    def add_caches(self):
+        from aspen import resources
+        metrics = self.website.dispatch_cache.metrics
+        get = lambda key: lambda: metrics()[key]
+        self.callback( 'aspen_dispatch_cache_entries', 'gauge'
+                     , "Entries in the dispatch cache, for paths found and "
+                       "missing."
+                     , lambda: { ('found',): metrics()['found']
+                               , ('missing',): metrics()['missing']
+                                }
+                     , ('cache',)
+                      )
+        for key, help in [ ('hits', "Dispatch cache hits.")
+                         , ('lookups', "Dispatch cache lookups.")
+                         , ('stale', "Dispatch cache entries found stale.")
+                          ]:
+            self.callback( 'aspen_dispatch_cache_%s_total' % key, 'counter'
+                         , help, get(key)
+                          )
+        self.callback( 'aspen_resource_cache_entries', 'gauge'
+                     , "Resources in the resource cache."
+                     , lambda: len(resources.__cache__)
+                      )
+
+    def add_engine(self):
+        engine = self.website.network_engine
+        get = lambda key: lambda: engine.metrics().get(key)
+        for key in sorted(ENGINE):
+            self.callback( 'aspen_engine_' + key, 'gauge', ENGINE[key]
+                         , get(key)
+                          )
+
+    def add_sockets(self):
+        from aspen import sockets
+
+        def buffers(key, reduce):
+            def get():
+                out = {}
+                per_socket = sockets.metrics()
+                for direction in ('incoming', 'outgoing'):
+                    numbers = [m[direction][key] for m in per_socket
+                               if m[direction][key] is not None]
+                    out[(direction,)] = reduce(numbers or [0])
+                return out
+            return get
+
+        self.callback( 'aspen_sockets', 'gauge', "Open Socket.IO sockets."
+                     , lambda: len(sockets.__sockets__)
+                      )
+        self.callback( 'aspen_socket_channels', 'gauge'
+                     , "Socket.IO channels."
+                     , lambda: len(sockets.__channels__)
+                      )
+        self.callback( 'aspen_socket_buffer_depth', 'gauge'
+                     , "Messages in socket buffers, summed over sockets."
+                     , buffers('depth', sum)
+                     , ('direction',)
+                      )
+        self.callback( 'aspen_socket_buffer_depth_max', 'gauge'
+                     , "Messages in the deepest socket buffer."
+                     , buffers('depth', max)
+                     , ('direction',)
+                      )
+        self.callback( 'aspen_socket_buffer_dropped', 'gauge'
+                     , "Messages dropped by the buffers of open sockets."
+                     , buffers('dropped', sum)
+                     , ('direction',)
+                      )
+
+    def add_overseer(self):
+        overseer = self.website.overseer
+        self.callback( 'aspen_request_overruns_total', 'counter'
+                     , "Requests that ran past request_budget_ms."
+                     , lambda: overseer.noverruns
+                      )
+        self.callback( 'aspen_slow_requests_total', 'counter'
+                     , "Requests that ran past slow_request_ms."
+                     , lambda: overseer.nslow
+                      )
+
+    def add_logging(self):
+
+        def get(key):
+            def get():
+                writer = aspen.logging.WRITER
+                if writer is None:
+                    return None
+                return writer.metrics()[key]
+            return get
+
+        self.callback( 'aspen_log_buffer_depth', 'gauge'
+                     , "Lines waiting in the log buffer.", get('depth')
+                      )
+        self.callback( 'aspen_log_lines_dropped_total', 'counter'
+                     , "Lines the log buffer dropped.", get('dropped')
+                      )
+        self.callback( 'aspen_log_lines_written_total', 'counter'
+                     , "Lines the log buffer wrote.", get('written')
+                      )
+
+
+    # Requests
+    # ========
+
+    def observe(self, request, response):
+        """Given a Request and its Response, count it.
+        """
+        self.requests.inc((str(response.code),))
+        fs = request.fs
+        if request.original_resource is not None:  # an error page answered
+            fs = request.original_resource.fs
+        if fs.startswith(self.www_root):
+            fs = fs[len(self.www_root):]
+        else:
+            fs = ''     # 404s, and requests that didn't get that far
+        self.latency.observe(time.time() - request.started, (fs,))
+
+    def respond(self, request):
+        """Given a Request for metrics_path, return a Response.
+        """
+        body = self.render() + REGISTRY.render()
+        return Response(200, body, {'Content-Type': CONTENT_TYPE})
@@ -5,14 +5,20 @@ flavors: threaded and evented. The Buffer object is part of Aspen's Socket.IO
 implementation.
 
 """
+import collections
+import sys
 import time
 
-from aspen.sockets.buffer import ThreadedBuffer
-from aspen.sockets.loop import ThreadedLoop
+from aspen.coroutines import Future
+from aspen.sockets.buffer import configure, ThreadedBuffer, unload
+from aspen.sockets.loop import Die, ThreadedLoop
 
 
 class BaseEngine(object):
 
+    prefork = False # whether we can serve on a socket we're given; see below
+    socket = None   # a listening socket from aspen.prefork, to use in bind
+
     def __init__(self, name, website):
         """Takes an identifying string and a WSGI application.
         """
@@ -21,6 +27,9 @@ class BaseEngine(object):
 
     def bind(self):
         """Bind to a socket, based on website.sockfam and website.address.
+
+        If self.socket is set, engines that support prefork use that instead.
+
         """
 
     def start(self):
@@ -31,6 +40,23 @@ class BaseEngine(object):
         """Stop listening on the socket.
         """
 
+    def interrupt(self):
+        """Make start return. This is called from a signal handler.
+
+        The default is to raise SystemExit wherever the main thread happens to
+        be. Engines that run requests on the main thread should override this.
+
+        """
+        raise SystemExit
+
+    def drain(self, seconds):
+        """Stop accepting connections, and finish requests already in flight.
+
+        Give up after seconds. Engines that support prefork should override
+        this; the default is to do nothing, and leave it to stop.
+
+        """
+
     def start_checking(self, check_all):
         """Start a loop that runs check_all every half-second.
         """
@@ -39,10 +65,93 @@ class BaseEngine(object):
         """Stop the loop that runs check_all (optional).
         """
 
+    def add_callback(self, callback):
+        """Given a callable, call it wherever sockets are safe to touch.
+
+        Our own threads (aspen.sockets.broker's) use this to reach sockets. By
+        default we call it right away, in the calling thread. Engines with an
+        event loop override this to hand callback to the loop.
+
+        """
+        callback()
+
+    def metrics(self):
+        """Return a dictionary of statistics about this engine.
+
+        See aspen.metrics.ENGINE for the keys we know about. Engines report
+        whichever of them they can; the default is none.
+
+        """
+        return {}
+
+    def long_poll(self, socket, timeout):
+        """Given a Socket and a number of seconds, return an iterable.
+
+        The iterable yields bytestrings from the socket's outgoing buffer, or
+        a single empty bytestring if nothing showed up before timeout. We check
+        every 10ms, sleeping in between. Engines that can suspend a request
+        without sleeping should override this.
+
+        """
+        bytes_iter = iter([""])
+        end = time.time() + timeout
+        while time.time() < end:
+            _bytes_iter = socket._recv()
+            if _bytes_iter is not None:
+                bytes_iter = _bytes_iter
+                break
+            self.sleep(0.010)
+        return bytes_iter
+
+
+    # Coroutines
+    # ==========
+    # See aspen.coroutines. By default we run page two to completion in the
+    # current thread, so Futures from pause and defer are already done by the
+    # time they're yielded. Engines with an event loop override all three.
+
+    def suspend(self, suspension):
+        """Given a Suspension, return a Response (or a Suspension to resume).
+        """
+        return suspension.wait()
+
+    def pause(self, seconds):
+        """Given a number of seconds, return a Future that's done after that.
+        """
+        self.sleep(seconds)
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def defer(self, func, *a, **kw):
+        """Given a callable and arguments, return a Future for its result.
+
+        The callable may block. Engines with an event loop run it in a thread.
+
+        """
+        future = Future()
+        try:
+            future.set_result(func(*a, **kw))
+        except:
+            future.set_exc_info(sys.exc_info())
+        return future
+
 
 # Threaded
 # ========
 
+def pool_metrics(pool):
+    """Given a ThreadPool from cheroot or CherryPy, return a dictionary.
+    """
+    threads = len(pool._threads)
+    idle = pool.idle
+    return { 'threads': threads
+           , 'threads_busy': threads - idle
+           , 'threads_idle': idle
+           , 'queued': pool.qsize
+            }
+
+
 class ThreadedEngine(BaseEngine):
     """An engine that uses threads for concurrent persistent sockets.
     """
@@ -77,3 +186,208 @@ class CooperativeEngine(BaseEngine):
         raise NotImplementedError
 
     Buffer = NotImplemented
+
+
+# Evented
+# =======
+# Engines with a single-threaded event loop (tornado_, asyncore_) can't block
+# for socket messages, so they share these. Subclass each of them with an
+# event_loop method that returns an object with add_callback(callback),
+# add_timeout(when, callback), and remove_timeout(timeout) methods.
+
+class EventedBuffer(collections.deque):
+    """Model a buffer of items.
+
+    There are two of these for each Socket, one for incoming message payloads
+    and one for outgoing message objects.
+
+    Here's what the flow looks like:
+
+        wire => [msg, msg, msg, msg, msg, msg, msg, msg] => resource
+        wire <= [msg, msg, msg, msg, msg, msg, msg, msg] <= resource
+
+    Instead of blocking, you can ask us to call you back the next time
+    something is put.
+
+    """
+
+    def __init__(self, name, socket=None, maxsize=None, policy=None):
+        """Takes a string and maybe a socket, a size limit, and a policy.
+
+        See aspen.sockets.buffer.configure. We can't block, so when we're full
+        the block policy drops the oldest message, same as drop_oldest.
+
+        """
+        collections.deque.__init__(self)
+        self._socket = socket
+        self._name = name
+        self.maxsize = configure(self, socket, maxsize, policy)
+        self.waiters = []
+
+    get = collections.deque.pop
+    empty = lambda d: not bool(d)
+
+    def event_loop(self):
+        raise NotImplementedError
+
+    def put(self, item):
+        """Add item, and schedule any waiters to be called back.
+        """
+        if item is not Die and 0 < self.maxsize <= len(self):
+            self.ndropped += 1
+            if self.policy == 'disconnect':
+                if self._socket is not None and \
+                   not self._socket.loop.please_stop:
+                    self._socket.disconnect()
+                return
+            self.pop()
+        self.appendleft(item)
+        if len(self) > self.high_water:
+            self.high_water = len(self)
+        waiters, self.waiters = self.waiters, []
+        event_loop = self.event_loop()
+        for callback in waiters:
+            event_loop.add_callback(callback)
+
+    def wait(self, callback):
+        """Given a callable, call it on the event loop after the next put.
+        """
+        self.waiters.append(callback)
+
+    def unwait(self, callback):
+        """Given a callable passed to wait, forget about it.
+        """
+        if callback in self.waiters:
+            self.waiters.remove(callback)
+
+    def metrics(self):
+        """Return a dictionary of statistics about this buffer.
+        """
+        return { 'depth': len(self)
+               , 'maxsize': self.maxsize
+               , 'high_water': self.high_water
+               , 'dropped': self.ndropped
+                }
+
+
+    # flush
+    # =====
+    # Used for outgoing buffer.
+
+    def flush(self):
+        """Return an iterable of bytestrings or None.
+        """
+        if not self.empty():
+            return self.__flusher()
+        return None
+
+    def __flusher(self):
+        """Yield a packet bytestring; see aspen.sockets.buffer.unload.
+
+        This generator is instantiated in self.flush.
+
+        """
+        yield unload(self)
+
+
+    # next
+    # ====
+    # Used for incoming buffer.
+
+    def next(self):
+        """Return the next item from the buffer.
+
+        EventedLoop only ticks when we have something, so as long as the
+        resource calls socket.recv once per tick this won't come up empty.
+
+        """
+        if self.empty():
+            raise RuntimeError("There's nothing to recv, and we can't block "
+                               "on an event loop. Please call socket.recv at "
+                               "most once per tick.")
+        return self.get()
+
+
+class EventedLoop(object):
+    """Model a socket's loop as a callback that reschedules itself.
+    """
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.please_stop = False
+
+    def event_loop(self):
+        raise NotImplementedError
+
+    def __call__(self):
+        """Tick if there's an incoming message, and then go again.
+        """
+        if self.please_stop:
+            return
+        if self.socket.incoming.empty():
+            self.socket.incoming.wait(self)
+        else:
+            self.socket.tick()
+            self.event_loop().add_callback(self)
+
+    def start(self):
+        self.event_loop().add_callback(self)
+
+    def stop(self):
+        self.please_stop = True
+        self.socket.incoming.unwait(self)
+
+
+class EventedLongPoll(object):
+    """Model a long-poll against a socket's outgoing buffer.
+
+    The engine calls answer with a callback. We call that back, once, with an
+    iterable of bytestrings, either as soon as the socket has something to
+    send or else when we time out.
+
+    """
+
+    def __init__(self, socket, timeout):
+        self.socket = socket
+        self.seconds = timeout
+        self.finish = None
+        self.timeout = None
+
+    def event_loop(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        """Support being treated as a plain body; don't wait.
+        """
+        return iter(self.socket._recv() or [""])
+
+    def answer(self, finish):
+        self.finish = finish
+        self.timeout = self.event_loop().add_timeout( time.time()
+                                                    + self.seconds
+                                                    , self.time_out
+                                                     )
+        self.check()
+
+    def check(self):
+        if self.finish is None:
+            return
+        bytes_iter = self.socket._recv()
+        if bytes_iter is None:
+            self.socket.outgoing.wait(self.check)
+        else:
+            self._answer(bytes_iter)
+
+    def time_out(self):
+        self.timeout = None
+        self._answer([""])
+
+    def _answer(self, bytes_iter):
+        finish, self.finish = self.finish, None
+        if finish is None:
+            return
+        if self.timeout is not None:
+            self.event_loop().remove_timeout(self.timeout)
+            self.timeout = None
+        self.socket.outgoing.unwait(self.check)
+        finish(bytes_iter)
@@ -0,0 +1,599 @@
+"""Serve HTTP/1.1 from a single thread on the stdlib's asyncore event loop.
+
+This engine has no dependencies outside the standard library. It parses HTTP
+itself, supports persistent connections and pipelining, and never blocks the
+event loop while waiting on something, so one process can hold open lots of
+connections at once:
+
+    - Simplates whose second page is a coroutine (see aspen.coroutines) are
+      suspended while they wait on Futures from engine.pause and
+      engine.defer, and resumed on the event loop when those are done.
+
+    - Socket.IO sockets work like they do under Tornado. SocketLoop runs
+      socket.tick once per incoming message, so the third page of a socket
+      resource should call socket.recv at most once and shouldn't block. XHR
+      long-polls are held open without sleeping.
+
+Everything else (regular simplates, static files, hooks) runs synchronously on
+the event loop, so keep it quick, and use engine.defer for blocking calls.
+
+Request bodies are read into memory before we respond, so we answer 413 for a
+Content-Length over MAX_BODY without reading the body at all.
+
+"""
+import asynchat
+import asyncore
+import collections
+import heapq
+import itertools
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import traceback
+import urllib
+import Queue
+from cStringIO import StringIO
+from functools import partial
+
+import aspen
+from aspen import Response
+from aspen.coroutines import Future, Suspension
+from aspen.http import status_strings
+from aspen.network_engines import CooperativeEngine, EventedBuffer, \
+                                  EventedLongPoll, EventedLoop
+
+
+MAX_HEAD = 65536    # bytes allowed in a request line plus headers
+MAX_BODY = 10 * 1024 * 1024 # bytes allowed in a request body, which we buffer
+DEFER_THREADS = 10  # size of the thread pool for engine.defer
+
+
+# Event Loop
+# ==========
+
+class Waker(asyncore.file_dispatcher):
+    """Model a pipe that lets other threads interrupt the event loop.
+    """
+
+    def __init__(self, map):
+        self.reader, self.writer = os.pipe()
+        asyncore.file_dispatcher.__init__(self, self.reader, map)
+
+    def wake(self):
+        try:
+            os.write(self.writer, 'x')
+        except OSError:
+            pass    # the pipe is full, which is just as good
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except (OSError, socket.error):
+            pass
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        for fd in (self.reader, self.writer):
+            try:
+                os.close(fd)
+            except OSError:
+                pass    # newer file_dispatchers dup and close the reader
+
+
+class EventLoop(object):
+    """Model an asyncore loop with callbacks and timeouts.
+
+    Only add_callback is safe to call from other threads.
+
+    """
+
+    def __init__(self):
+        self.map = {}                           # for asyncore
+        self.callbacks = collections.deque()
+        self.timeouts = []                      # heap of [when, id, callback]
+        self.ids = itertools.count()
+        self.waker = None
+        self.thread = None
+        self.please_stop = False
+
+    def add_callback(self, callback):
+        """Given a callable, call it on the next pass through the loop.
+        """
+        self.callbacks.append(callback)
+        if self.waker is not None and \
+           threading.currentThread() is not self.thread:
+            self.waker.wake()
+
+    def add_timeout(self, when, callback):
+        """Given a timestamp and a callable, call it then. Return a handle.
+        """
+        timeout = [when, self.ids.next(), callback]
+        heapq.heappush(self.timeouts, timeout)
+        return timeout
+
+    def remove_timeout(self, timeout):
+        """Given a handle from add_timeout, cancel it.
+        """
+        timeout[2] = None
+
+    def run(self):
+        """Run until stop is called.
+        """
+        self.thread = threading.currentThread()
+        self.waker = Waker(self.map)
+        use_poll = hasattr(select, 'poll')
+        try:
+            while not self.please_stop:
+                self.run_timeouts()
+                self.run_callbacks()
+                if self.callbacks:
+                    timeout = 0
+                elif self.timeouts:
+                    timeout = max(0, self.timeouts[0][0] - time.time())
+                else:
+                    timeout = 30.0
+                asyncore.loop(timeout, use_poll, self.map, 1)
+        finally:
+            self.waker.close()
+            self.waker = None
+            self.thread = None
+            self.please_stop = False
+
+    def stop(self):
+        self.please_stop = True
+        if self.waker is not None:
+            self.waker.wake()
+
+    def run_callbacks(self):
+        for i in range(len(self.callbacks)):    # not any added meanwhile
+            self.call(self.callbacks.popleft())
+
+    def run_timeouts(self):
+        now = time.time()
+        while self.timeouts and self.timeouts[0][0] <= now:
+            callback = heapq.heappop(self.timeouts)[2]
+            if callback is not None:
+                self.call(callback)
+
+    def call(self, callback):
+        try:
+            callback()
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except:
+            aspen.log_dammit(traceback.format_exc())
+
+
+event_loop = EventLoop()
+
+
+# HTTP
+# ====
+
+class HTTPChannel(asynchat.async_chat):
+    """Model one HTTP/1.1 connection.
+
+    We respond to requests in the order they come in. While we're responding
+    to one (which can take a while if it's suspended), we stop reading, and
+    queue up any pipelined requests we've already read.
+
+    """
+
+    def __init__(self, engine, sock, addr):
+        asynchat.async_chat.__init__(self, sock, event_loop.map)
+        self.engine = engine
+        self.addr = addr
+        self.busy = False
+        self.closed = False
+        self.hanging_up = False
+        self.pending = collections.deque()  # WSGI environs
+        self.reset()
+
+    def reset(self):
+        self.head = []
+        self.nhead = 0
+        self.environ = None
+        self.set_terminator('\r\n\r\n')
+
+    def readable(self):
+        return not self.busy and asynchat.async_chat.readable(self)
+
+    def in_flight(self):
+        """Return a boolean, whether we have a response to finish or send.
+        """
+        return bool(self.busy or self.producer_fifo)
+
+    def handle_close(self):
+        self.close()
+
+    def close(self):
+        self.closed = True
+        asynchat.async_chat.close(self)
+
+
+    # Parsing
+    # =======
+
+    def collect_incoming_data(self, data):
+        if self.hanging_up:
+            return
+        self.head.append(data)
+        self.nhead += len(data)
+        if self.environ is None and self.nhead > MAX_HEAD:
+            self.bail(400, "The request line and headers are too long.")
+
+    def found_terminator(self):
+        if self.hanging_up:
+            return
+        data = ''.join(self.head)
+        if self.environ is None:                # head
+            try:
+                environ = self.parse_head(data)
+            except ValueError, exc:
+                self.bail(400, str(exc))
+                return
+            if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', ''):
+                self.bail(411, "Please send a Content-Length.")
+                return
+            try:
+                nbytes = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                self.bail(400, "Bad Content-Length.")
+                return
+            if nbytes > MAX_BODY:
+                self.bail(413, "The request body is too long.")
+                return
+            if nbytes > 0:
+                self.environ = environ
+                self.head = []
+                self.nhead = 0
+                self.set_terminator(nbytes)
+                return
+        else:                                   # body
+            environ = self.environ
+            environ['wsgi.input'] = StringIO(data)
+        self.reset()
+        self.pending.append(environ)
+        if not self.busy:
+            self.respond_next()
+
+    def parse_head(self, data):
+        """Given a bytestring, return a WSGI environ.
+        """
+        lines = data.lstrip('\r\n').split('\r\n')
+        try:
+            method, uri, version = lines[0].split()
+        except ValueError:
+            raise ValueError("Bad request line.")
+        if not version.startswith('HTTP/1.'):
+            raise ValueError("Bad HTTP version.")
+        path, _, querystring = uri.partition('?')
+        if '://' in path:                       # absolute-form
+            path = '/' + path.split('://', 1)[1].partition('/')[2]
+
+        website = self.engine.website
+        if website.network_port is None:        # AF_UNIX
+            server_name = 'localhost'
+        else:
+            server_name = website.network_address[0]
+        environ = { 'REQUEST_METHOD': method
+                  , 'SCRIPT_NAME': ''
+                  , 'PATH_INFO': urllib.unquote(path)
+                  , 'QUERY_STRING': querystring
+                  , 'SERVER_PROTOCOL': version
+                  , 'SERVER_SOFTWARE': 'Aspen! asyncore!'
+                  , 'SERVER_NAME': server_name
+                  , 'SERVER_PORT': str(website.network_port or '')
+                  , 'REMOTE_ADDR': str(self.addr and self.addr[0] or '')
+                  , 'wsgi.version': (1, 0)
+                  , 'wsgi.url_scheme': 'http'
+                  , 'wsgi.input': StringIO('')
+                  , 'wsgi.errors': sys.stderr
+                  , 'wsgi.multithread': False
+                  , 'wsgi.multiprocess': False
+                  , 'wsgi.run_once': False
+                   }
+
+        name = None
+        for line in lines[1:]:
+            if line[:1] in ' \t':               # obsolete line folding
+                if name is None:
+                    raise ValueError("Bad header line.")
+                environ[name] += ' ' + line.strip()
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise ValueError("Bad header line.")
+            name = name.strip().upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            value = value.strip()
+            if name in environ:
+                environ[name] += ', ' + value
+            else:
+                environ[name] = value
+        return environ
+
+
+    # Responding
+    # ==========
+
+    def respond_next(self):
+        """Respond to the next pending request.
+        """
+        environ = self.pending.popleft()
+        self.busy = True
+        captured = []
+        def start_response(status, headers, exc_info=None):
+            captured[:] = [status, headers]
+            return lambda data: None  # Aspen doesn't use write
+
+        try:
+            result = self.engine.website(environ, start_response)
+        except Response, response:              # e.g., from Request.from_wsgi
+            self.bail(response.code, "".join(response.body))
+            return
+        except:
+            aspen.log_dammit(traceback.format_exc())
+            self.bail(500, "Internal Server Error")
+            return
+
+        def finish(chunks):
+            status, headers = captured
+            self.write(environ, status, headers, chunks)
+
+        if isinstance(result, Suspension):      # page two is a coroutine
+            result.then(lambda: finish(result.resume()))
+        elif isinstance(getattr(result, 'body', None), LongPoll):
+            result.body.answer(finish)
+        else:
+            finish(result)
+
+    def write(self, environ, status, headers, chunks):
+        """Given a WSGI environ, status, headers, and body, send a response.
+        """
+        try:
+            body = ''.join(chunks)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        if self.closed:                         # the client went away
+            return
+
+        keep_alive = self.keep_alive(environ, headers)
+        out = ["HTTP/1.1 %s" % status]
+        have_length = False
+        for name, value in headers:
+            if name.lower() == 'content-length':
+                have_length = True
+            out.append("%s: %s" % (name, value))
+        if not have_length:
+            out.append("Content-Length: %d" % len(body))
+        if not keep_alive:
+            out.append("Connection: close")
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            body = ''
+        self.push('\r\n'.join(out) + '\r\n\r\n' + body)
+
+        if not keep_alive:
+            self.pending.clear()
+            self.close_when_done()
+        elif self.pending:
+            self.respond_next()
+        else:
+            self.busy = False
+
+    def keep_alive(self, environ, headers):
+        """Given a WSGI environ and response headers, return a boolean.
+        """
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        for name, value in headers:
+            if name.lower() == 'connection':
+                connection = value.lower()
+        if environ['SERVER_PROTOCOL'] == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+    def bail(self, code, msg):
+        """Given an HTTP status code and a message, respond and hang up.
+        """
+        self.push( "HTTP/1.1 %d %s\r\nContent-Length: %d\r\n"
+                   "Connection: close\r\n\r\n%s"
+                 % (code, status_strings.get(code, 'Unknown'), len(msg), msg)
+                  )
+        self.busy = True
+        self.hanging_up = True
+        self.pending.clear()
+        self.close_when_done()
+
+
+class HTTPServer(asyncore.dispatcher):
+    """Model a listening socket.
+    """
+
+    def __init__(self, engine):
+        asyncore.dispatcher.__init__(self, map=event_loop.map)
+        self.engine = engine
+        if engine.socket is not None:
+            engine.socket.setblocking(0)
+            self.set_socket(engine.socket)
+            self.accepting = True
+            return
+        address = engine.website.network_address
+        self.create_socket(engine.website.network_sockfam, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(address)
+        self.listen(1024)
+
+    def writable(self):
+        return False
+
+    def handle_accept(self):
+        try:
+            pair = self.accept()
+        except socket.error:
+            return
+        if pair is not None:
+            sock, addr = pair
+            if not isinstance(addr, tuple):     # AF_UNIX
+                addr = None
+            HTTPChannel(self.engine, sock, addr)
+
+
+# Sockets
+# =======
+
+class OnEventLoop(object):
+    """Mix in to schedule callbacks on our event loop.
+    """
+
+    def event_loop(self):
+        return event_loop
+
+
+class AsyncoreBuffer(OnEventLoop, EventedBuffer):
+    """Model a buffer of items; see aspen.network_engines.EventedBuffer.
+    """
+
+
+class SocketLoop(OnEventLoop, EventedLoop):
+    """Model a socket's loop as a callback that reschedules itself.
+    """
+
+
+class LongPoll(OnEventLoop, EventedLongPoll):
+    """Model a long-poll; HTTPChannel calls answer.
+    """
+
+
+# Engine
+# ======
+
+class Engine(CooperativeEngine):
+
+    prefork = True
+    server = None
+    checker = None
+    deferred = None     # a Queue for the defer thread pool
+
+    def bind(self):
+        self.server = HTTPServer(self)
+
+    def start(self):
+        try:
+            event_loop.run()
+        except SystemExit:
+            pass
+
+    def stop(self):
+        event_loop.stop()
+
+    def add_callback(self, callback):
+        """Override to call back on the event loop.
+        """
+        event_loop.add_callback(callback)
+
+    def interrupt(self):
+        """Override to stop after the current callback, not in the middle.
+        """
+        event_loop.stop()
+
+    def drain(self, seconds):
+        """Stop accepting, and run the event loop until no channel is busy.
+        """
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        end = time.time() + seconds
+        def check():
+            busy = [d for d in event_loop.map.values()
+                    if isinstance(d, HTTPChannel) and d.in_flight()]
+            if not busy or time.time() >= end:
+                event_loop.stop()
+            else:
+                event_loop.add_timeout(time.time() + 0.05, check)
+        event_loop.add_callback(check)
+        event_loop.run()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def metrics(self):
+        """Report on connections and the event loop.
+        """
+        channels = [d for d in event_loop.map.values()
+                    if isinstance(d, HTTPChannel)]
+        return { 'connections': len(channels)
+               , 'connections_busy': len([c for c in channels
+                                          if c.in_flight()])
+               , 'callbacks': len(event_loop.callbacks)
+               , 'timeouts': len(event_loop.timeouts)
+                }
+
+    def start_checking(self, check_all):
+        def check():
+            self.checker = event_loop.add_timeout(time.time() + 0.5, check)
+            check_all()
+        self.checker = event_loop.add_timeout(time.time() + 0.5, check)
+
+    def stop_checking(self):
+        if self.checker is not None:
+            event_loop.remove_timeout(self.checker)
+
+    def long_poll(self, socket, timeout):
+        """Override to suspend the request instead of sleeping.
+        """
+        return LongPoll(socket, timeout)
+
+
+    # Coroutines
+    # ==========
+
+    def suspend(self, suspension):
+        """Override to hand the Suspension back to HTTPChannel.
+        """
+        return suspension
+
+    def pause(self, seconds):
+        """Override to resolve on the event loop instead of sleeping.
+        """
+        future = Future()
+        event_loop.add_timeout( time.time() + seconds
+                              , lambda: future.set_result(None)
+                               )
+        return future
+
+    def defer(self, func, *a, **kw):
+        """Override to call func in a thread, and resolve on the event loop.
+        """
+        if self.deferred is None:
+            self.deferred = Queue.Queue()
+            for i in range(DEFER_THREADS):
+                worker = threading.Thread(target=self.work)
+                worker.daemon = True
+                worker.start()
+        future = Future()
+        self.deferred.put((future, func, a, kw))
+        return future
+
+    def work(self):
+        """Call deferred functions forever. This runs in its own thread.
+        """
+        while 1:
+            future, func, a, kw = self.deferred.get()
+            try:
+                resolve = partial(future.set_result, func(*a, **kw))
+            except:
+                resolve = partial(future.set_exc_info, sys.exc_info())
+            event_loop.add_callback(resolve)
+            future = resolve = None # don't hold onto these while we wait
+
+    Buffer = AsyncoreBuffer
+    Loop = SocketLoop
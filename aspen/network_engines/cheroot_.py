@@ -2,19 +2,41 @@ import time
 import threading
 
 import cheroot.wsgi
-from aspen.network_engines import ThreadedEngine
+from aspen.network_engines import ThreadedEngine, pool_metrics
+
+
+class Server(cheroot.wsgi.WSGIServer):
+    """Extend to serve on a socket we already have, if we're given one.
+    """
+
+    prebound = None
+    stopping = False
+
+    def bind(self, family, type, proto=0):
+        if self.prebound is None:
+            cheroot.wsgi.WSGIServer.bind(self, family, type, proto)
+        else:
+            self.socket = self.prebound
+            self.request_queue_size = 1024  # start listens again; keep ours
+
+    def tick(self):
+        if self.stopping:
+            raise SystemExit    # between connections, not in the middle of one
+        cheroot.wsgi.WSGIServer.tick(self)
 
 
 class Engine(ThreadedEngine):
 
     cheroot_server = None
+    prefork = True
 
     def bind(self):
         name = "Aspen! Cheroot!"
-        self.cheroot_server = cheroot.wsgi.WSGIServer( self.website.network_address
-                                                     , server_name=name
-                                                     , wsgi_app=self.website
-                                                      )
+        self.cheroot_server = Server( self.website.network_address
+                                    , server_name=name
+                                    , wsgi_app=self.website
+                                     )
+        self.cheroot_server.prebound = self.socket
 
     def start(self):
         self.cheroot_server.start()
@@ -22,6 +44,30 @@ class Engine(ThreadedEngine):
     def stop(self):
         self.cheroot_server.stop()
 
+    def interrupt(self):
+        """Override to stop accepting after the current tick.
+
+        Raising SystemExit right away could land between accepting a
+        connection and handing it to a worker thread, which would drop it.
+
+        """
+        self.cheroot_server.stopping = True
+
+    def drain(self, seconds):
+        """Let worker threads finish their requests, for up to seconds.
+        """
+        server = self.cheroot_server
+        server.shutdown_timeout = seconds
+        server.socket = None    # start has returned; don't poke it awake
+        server.stop()           # joins worker threads, up to the timeout
+
+    def metrics(self):
+        """Report on the worker thread pool, and connections waiting for it.
+        """
+        if self.cheroot_server is None:   # not bound yet
+            return {}
+        return pool_metrics(self.cheroot_server.requests)
+
     def start_checking(self, check_all):
 
         def loop():
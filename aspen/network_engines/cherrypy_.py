@@ -2,7 +2,7 @@ import time
 import threading
 
 from cherrypy.wsgiserver import CherryPyWSGIServer
-from aspen.network_engines import ThreadedEngine
+from aspen.network_engines import ThreadedEngine, pool_metrics
 
 
 class Engine(ThreadedEngine):
@@ -33,6 +33,13 @@ class Engine(ThreadedEngine):
     def stop(self):
         self.cp_server.stop()
 
+    def metrics(self):
+        """Report on the worker thread pool, and connections waiting for it.
+        """
+        if self.cp_server is None:   # not bound yet
+            return {}
+        return pool_metrics(self.cp_server.requests)
+
     def start_checking(self, check_all):
 
         def loop():
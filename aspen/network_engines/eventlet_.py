@@ -3,18 +3,19 @@ import sys
 import time
 
 import eventlet
+import eventlet.greenio
 import eventlet.wsgi
 from aspen.network_engines import CooperativeEngine
-from aspen.sockets import packet
+from aspen.sockets.buffer import configure, CooperativeBuffer
 from aspen.sockets.loop import Die
-from eventlet.queue import LightQueue
+from eventlet.queue import Full, LightQueue
 
 
 class DevNull:
     def write(self, msg):
         pass
 
-class EventletBuffer(LightQueue):
+class EventletBuffer(CooperativeBuffer, LightQueue):
     """Model a buffer of items.
 
     There are two of these for each Socket, one for incoming message payloads
@@ -25,48 +26,26 @@ class EventletBuffer(LightQueue):
         wire => [msg, msg, msg, msg, msg, msg, msg, msg] => resource
         wire <= [msg, msg, msg, msg, msg, msg, msg, msg] <= resource
 
+    See aspen.sockets.buffer.CooperativeBuffer for put, metrics, and flush.
+
     """
 
-    def __init__(self, name, socket=None):
-        """Takes a string and maybe a socket.
+    Queue = LightQueue
+    Full = Full
+
+    def __init__(self, name, socket=None, maxsize=None, policy=None):
+        """Takes a string and maybe a socket, a size limit, and a policy.
 
-        If given a socket, we will try to play nice with its loop.
+        If given a socket, we will try to play nice with its loop. See
+        aspen.sockets.buffer.configure for the rest.
 
         """
-        LightQueue.__init__(self)
+        maxsize = configure(self, socket, maxsize, policy)
+        LightQueue.__init__(self, maxsize or None) # None: unbounded
         self._socket = socket
         self._name = name
 
 
-    # flush
-    # =====
-    # Used for outgoing buffer.
-
-    def flush(self):
-        """Return an iterable of bytestrings or None.
-        """
-        if not self.empty():
-            return self.__flusher()
-        return None
-
-    def __flusher(self):
-        """Yield strings.
-
-        We unload bytestrings as fast as we can until we run out of time or
-        bytestrings. On my MacBook Pro I am seeing between 500 and 1000
-        messages dumped in 2ms--without any WSGI/HTTP/TCP overhead. We always
-        yield at least one bytestring to avoid deadlock.
-
-        This generator is instantiated in self.flush.
-
-        """
-        if not self.empty():
-            yield packet.frame(self.get())
-        timeout = time.time() + (0.007) # We have 7ms to dump bytestrings. Go!
-        while not self.empty() and time.time() < timeout:
-            yield packet.frame(self.get())
-
-
     # next
     # ====
     # Used for incoming buffer.
@@ -134,8 +113,13 @@ class EventletLoop(object):
 class Engine(CooperativeEngine):
 
     eventlet_socket = None # a socket, per eventlet
+    pool = None # a GreenPool of handlers, so that we can drain it
+    prefork = True
 
     def bind(self):
+        if self.socket is not None:
+            self.eventlet_socket = eventlet.greenio.GreenSocket(self.socket)
+            return
         self.eventlet_socket = eventlet.listen( self.website.network_address
                                               , self.website.network_sockfam
                                                )
@@ -150,7 +134,22 @@ class Engine(CooperativeEngine):
         eventlet.sleep(seconds)
 
     def start(self):
-        eventlet.wsgi.server(self.eventlet_socket, self.website, log=DevNull())
+        self.pool = eventlet.GreenPool()
+        eventlet.wsgi.server( self.eventlet_socket
+                            , self.website
+                            , log=DevNull()
+                            , custom_pool=self.pool
+                             )
+
+    def drain(self, seconds):
+        """Stop accepting, and wait for the pool of handlers to finish.
+        """
+        self.eventlet_socket.close()
+        end = time.time() + seconds
+        while self.pool is not None and self.pool.running():
+            if time.time() >= end:
+                break
+            self.sleep(0.05)
 
     def start_checking(self, check_all):
         def loop():
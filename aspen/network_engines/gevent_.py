@@ -1,15 +1,14 @@
-import time
-
 import gevent
+import gevent.pool
 import gevent.socket
 import gevent.queue
 import gevent.wsgi
 from aspen.network_engines import CooperativeEngine
-from aspen.sockets import packet
+from aspen.sockets.buffer import configure, CooperativeBuffer
 from aspen.sockets.loop import Die
 
 
-class GeventBuffer(gevent.queue.Queue):
+class GeventBuffer(CooperativeBuffer, gevent.queue.Queue):
     """Model a buffer of items.
 
     There are two of these for each Socket, one for incoming message payloads
@@ -20,48 +19,26 @@ class GeventBuffer(gevent.queue.Queue):
         wire => [msg, msg, msg, msg, msg, msg, msg, msg] => resource
         wire <= [msg, msg, msg, msg, msg, msg, msg, msg] <= resource
 
+    See aspen.sockets.buffer.CooperativeBuffer for put, metrics, and flush.
+
     """
 
-    def __init__(self, name, socket=None):
-        """Takes a string and maybe a socket.
+    Queue = gevent.queue.Queue
+    Full = gevent.queue.Full
 
-        If given a socket, we will try to play nice with its loop.
+    def __init__(self, name, socket=None, maxsize=None, policy=None):
+        """Takes a string and maybe a socket, a size limit, and a policy.
+
+        If given a socket, we will try to play nice with its loop. See
+        aspen.sockets.buffer.configure for the rest.
 
         """
-        gevent.queue.Queue.__init__(self)
+        maxsize = configure(self, socket, maxsize, policy)
+        gevent.queue.Queue.__init__(self, maxsize or None) # None: unbounded
         self._socket = socket
         self._name = name
 
 
-    # flush
-    # =====
-    # Used for outgoing buffer.
-
-    def flush(self):
-        """Return an iterable of bytestrings or None.
-        """
-        if not self.empty():
-            return self.__flusher()
-        return None
-
-    def __flusher(self):
-        """Yield strings.
-
-        We unload bytestrings as fast as we can until we run out of time or
-        bytestrings. On my MacBook Pro I am seeing between 500 and 1000
-        messages dumped in 2ms--without any WSGI/HTTP/TCP overhead. We always
-        yield at least one bytestring to avoid deadlock.
-
-        This generator is instantiated in self.flush.
-
-        """
-        if not self.empty():
-            yield packet.frame(self.get())
-        timeout = time.time() + (0.007) # We have 7ms to dump bytestrings. Go!
-        while not self.empty() and time.time() < timeout:
-            yield packet.frame(self.get())
-
-
     # next
     # ====
     # Used for incoming buffer.
@@ -128,14 +105,22 @@ class GeventLoop(object):
 
 class Engine(CooperativeEngine):
 
-    wsgi_server = None # a WSGI server, per gevent
+    gevent_server = None # a WSGI server, per gevent
+    prefork = True
 
     def bind(self):
-        self.gevent_server = gevent.wsgi.WSGIServer( listener=self.website.network_address
+        listener = self.socket or self.website.network_address
+        self.gevent_server = gevent.wsgi.WSGIServer( listener=listener
                                                    , application=self.website
                                                    , log=None
+                                                   , spawn=gevent.pool.Pool()
                                                     )
 
+    def drain(self, seconds):
+        """Stop accepting, and wait for the pool of handlers to finish.
+        """
+        self.gevent_server.stop(timeout=seconds)
+
     def sleep(self, seconds):
         gevent.sleep(seconds)
 
@@ -1,158 +1,143 @@
-import collections
-import time
+"""Tornado is single-threaded, so sockets work a little differently here.
 
-from aspen.network_engines import CooperativeEngine
-from aspen.sockets import packet
-from aspen.sockets.loop import Die
-import tornado.ioloop
-import tornado.httpserver
-import tornado.wsgi
+Nothing is allowed to block the IOLoop. That has two consequences:
 
+    - TornadoLoop doesn't run socket.tick over and over. It runs it once each
+      time there's a message in the socket's incoming buffer, so the third
+      page of a socket resource should call socket.recv at most once, and
+      shouldn't sleep or otherwise block.
 
-class TornadoBuffer(collections.deque):
-    """Model a buffer of items.
+    - Long-polls don't sleep. The XHR transport gets a LongPoll object from
+      Engine.long_poll, and AspenContainer holds onto the HTTP request until
+      the socket has something to send or the poll times out.
 
-    There are two of these for each Socket, one for incoming message payloads
-    and one for outgoing message objects.
+"""
+import time
 
-    Here's what the flow looks like:
+from aspen.network_engines import CooperativeEngine, EventedBuffer, \
+                                  EventedLongPoll, EventedLoop
+import tornado.ioloop
+import tornado.httpserver
+import tornado.wsgi
 
-        wire => [msg, msg, msg, msg, msg, msg, msg, msg] => resource
-        wire <= [msg, msg, msg, msg, msg, msg, msg, msg] <= resource
 
+class OnIOLoop(object):
+    """Mix in to schedule callbacks on Tornado's IOLoop.
     """
 
-    def __init__(self, name, socket=None):
-        """Takes a string and maybe a socket.
-
-        If given a socket, we will try to play nice with its loop.
-
-        """
-
-        # It feels like it's going to take deeper rewiring to get *.sock files
-        # working with Tornado callbacks.
-        raise NotImplementedError("Sorry, for now please use a different "
-                                  "networking library in order to use *.sock "
-                                  "files.")
+    def event_loop(self):
+        return tornado.ioloop.IOLoop.instance()
 
-        collections.deque.__init__(self)
-        self._socket = socket
-        self._name = name
-
-    put = collections.deque.appendleft
-    get = collections.deque.pop
-    empty = lambda d: not bool(d)
-
-
-    # flush
-    # =====
-    # Used for outgoing buffer.
-
-    def flush(self):
-        """Return an iterable of bytestrings or None.
-        """
-        if not self.empty():
-            return self.__flusher()
-        return None
-
-    def __flusher(self):
-        """Yield strings.
-
-        We unload bytestrings as fast as we can until we run out of time or
-        bytestrings. On my MacBook Pro I am seeing between 500 and 1000
-        messages dumped in 2ms--without any WSGI/HTTP/TCP overhead. We always
-        yield at least one bytestring to avoid deadlock.
-
-        This generator is instantiated in self.flush.
-
-        """
-        if not self.empty():
-            yield packet.frame(self.get())
-        timeout = time.time() + (0.007) # We have 7ms to dump bytestrings. Go!
-        while not self.empty() and time.time() < timeout:
-            yield packet.frame(self.get())
 
+class TornadoBuffer(OnIOLoop, EventedBuffer):
+    """Model a buffer of items; see aspen.network_engines.EventedBuffer.
+    """
 
-    # next
-    # ====
-    # Used for incoming buffer.
 
-    def next(self):
-        """Return the next item from the queue.
+class TornadoLoop(OnIOLoop, EventedLoop):
+    """Model a loop as a callback that reschedules itself on the IOLoop.
+    """
 
-        The first time this is called, we lazily instantiate the generator at
-        self._blocked. Subsequent calls are directed directly to that
-        generator's next method.
 
-        """
-        self._blocked = self._blocked()
-        self.next = self._next
-        return self.next()
+class LongPoll(OnIOLoop, EventedLongPoll):
+    """Model a long-poll; AspenContainer calls answer.
+    """
 
-    def _next(self):
-        try:
-            return self._blocked.next()
-        except StopIteration:
-            # When the _blocked generator discovers Die and breaks, the
-            # effect is a StopIteration here. It's a bug if this happens
-            # other than when we are disconnecting the socket.
-            assert self._socket is not None
-            assert self._socket.loop.please_stop
 
-    def _blocked(self):
-        """Yield items from self forever.
+class AspenContainer(tornado.wsgi.WSGIContainer):
+    """Extend WSGIContainer to answer long-polls without blocking the IOLoop.
+    """
 
-        This generator is lazily instantiated in self.next. It is designed to
-        cooperate with ThreadedLoop. XXX Oh yeah?
+    in_flight = 0   # requests not yet written, for Engine.drain [int]
 
+    def __call__(self, request):
+        """Call the website, and write the response now or when it's ready.
         """
-        if self._socket is None:    # We're on a Channel.
-            while 1:
-                yield self.get()
-        else:                       # We're on a Socket.
-            while not self._socket.loop.please_stop:
-                out = self.get()
-                if out is Die:
-                    break # will result in a StopIteration
-                yield out
-
-
-class TornadoLoop(object):
-
-    def __init__(self, socket):
-        self.socket = socket
-        self.please_stop = False
-
-    def __call__(self):
-        while not self.please_stop:
-            self.socket.tick()
-
-    def start(self):
-        pass
-
-    def stop(self):
-        self.please_stop = True
-        self.socket.incoming.put(Die)
+        self.in_flight += 1
+        captured = []
+        def start_response(status, headers, exc_info=None):
+            captured[:] = [status, headers]
+            return lambda data: None  # Aspen doesn't use write
+
+        environ = tornado.wsgi.WSGIContainer.environ(request)
+        body = self.wsgi_application(environ, start_response)
+        status, headers = captured
+
+        def finish(chunks):
+            def replay(environ, start_response):
+                start_response(status, headers)
+                return chunks
+            try:
+                tornado.wsgi.WSGIContainer(replay)(request)
+            finally:
+                self.in_flight -= 1
+                if chunks is not body:  # WSGIContainer closed body itself
+                    body.close()
+
+        long_poll = getattr(body, 'body', None)   # body is a CloseWrapper
+        if isinstance(long_poll, LongPoll):
+            long_poll.answer(finish)
+        else:
+            finish(body)
 
 
 class Engine(CooperativeEngine):
 
     checker = None
+    container = None
+    http_server = None
 
     def bind(self):
-        container = tornado.wsgi.WSGIContainer(self.website)
-        http_server = tornado.httpserver.HTTPServer(container)
-        http_server.listen(self.website.network_address[1])
+        self.container = AspenContainer(self.website)
+        self.http_server = tornado.httpserver.HTTPServer(self.container)
+        self.http_server.listen(self.website.network_address[1])
 
     def sleep(self, seconds):
         time.sleep(seconds)
 
+    def add_callback(self, callback):
+        """Override to call back on the IOLoop.
+        """
+        tornado.ioloop.IOLoop.instance().add_callback(callback)
+
+    def long_poll(self, socket, timeout):
+        """Override to suspend the request instead of sleeping.
+        """
+        return LongPoll(socket, timeout)
+
     def start(self):
         try:
             tornado.ioloop.IOLoop.instance().start()
         except SystemExit:
             pass
 
+    def interrupt(self):
+        """Override to stop the IOLoop between callbacks, not in the middle.
+        """
+        tornado.ioloop.IOLoop.instance().stop()
+
+    def drain(self, seconds):
+        """Stop accepting, and run the IOLoop until no request is in flight.
+
+        Long-polls are what's usually left; they answer when their socket has
+        something to send or they time out.
+
+        """
+        if self.http_server is not None:
+            self.http_server.stop()
+            self.http_server = None
+        if self.container is None:
+            return
+        ioloop = tornado.ioloop.IOLoop.instance()
+        end = time.time() + seconds
+        def check():
+            if not self.container.in_flight or time.time() >= end:
+                ioloop.stop()
+            else:
+                ioloop.add_timeout(time.time() + 0.05, check)
+        ioloop.add_callback(check)
+        ioloop.start()
+
     def start_checking(self, check_all):
         self.checker = tornado.ioloop.PeriodicCallback(check_all, 500)
         self.checker.start()
@@ -162,4 +147,3 @@ class Engine(CooperativeEngine):
 
     Buffer = TornadoBuffer
     Loop = TornadoLoop
-
@@ -0,0 +1,309 @@
+"""Run a website in several worker processes forked from a master.
+
+Python threads can only use one CPU core between them, so for CPU-bound sites
+you can ask aspen to fork:
+
+    $ aspen --workers=4
+
+The master process configures the website, optionally loads every resource
+under www_root (--workers_warm_cache), binds the listening socket, and then
+forks. Everything loaded before the fork is shared with the workers
+copy-on-write. Each worker runs the network engine on the shared socket, or,
+with --workers_reuse_port, on its own socket bound with SO_REUSEPORT, so that
+the kernel spreads connections between them.
+
+The master doesn't serve requests. It restarts workers that die, and it
+forwards signals: INT, QUIT, and TERM stop the workers and then the master.
+
+HUP reloads without dropping connections. The master re-executes itself in
+place, keeping the listening socket open across the exec and passing it and
+the pids of the old workers along in the environment. The new master forks a
+new generation of workers on the same socket, and then sends the old ones
+TERM. Workers that get TERM stop accepting connections, finish the requests
+they have in flight, and exit; any still around after workers_drain_timeout
+are killed. When changes_reload is set, workers ask the master to reload by
+sending it HUP.
+
+A worker that has served max_requests requests, or grown past max_rss
+megabytes, stops accepting connections, finishes the requests it has in
+flight, and exits, and the master starts another in its place.
+
+"""
+import errno
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import aspen
+import aspen.logging
+from aspen import execution, resources
+
+
+# Python 2 doesn't define SO_REUSEPORT on Linux.
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+if SO_REUSEPORT is None and sys.platform.startswith('linux'):
+    SO_REUSEPORT = 15   # from asm-generic/socket.h; needs Linux >= 3.9
+
+MIN_LIFETIME = 1    # seconds a worker must live to be restarted right away
+KILL_GRACE = 1      # seconds past workers_drain_timeout before we kill
+
+LISTEN_FD = 'ASPEN_LISTEN_FD'   # environment variables for reloading
+DRAINING = 'ASPEN_DRAINING'
+
+
+def listen(website, reuse_port=False):
+    """Given a Website and a boolean, return a listening socket.
+    """
+    sock = socket.socket(website.network_sockfam, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind(website.network_address)
+    sock.listen(1024)
+    return sock
+
+def hand_off(sock):
+    """Given a listening socket, pass it to inherit when we re-execute.
+
+    We hand off a duplicate, so that it's fine to close sock in the meantime.
+
+    """
+    fd = os.dup(sock.fileno())
+    os.environ[LISTEN_FD] = str(fd)
+    execution.inherit(fd)
+
+def inherit(website):
+    """Given a Website, return the listening socket of the master we replaced.
+
+    If there isn't one, or it's on a different port than the website is now
+    configured for, return None.
+
+    """
+    fd = os.environ.pop(LISTEN_FD, None)
+    if fd is None:
+        return None
+    fd = int(fd)
+    sock = socket.fromfd(fd, website.network_sockfam, socket.SOCK_STREAM)
+    os.close(fd)    # fromfd dups
+    if sock.getsockname()[1] != website.network_port:
+        sock.close()
+        return None
+    return sock
+
+
+class Master(object):
+    """Model the process that forks and supervises workers.
+    """
+
+    def __init__(self, website):
+        self.website = website
+        self.socket = None          # shared, unless we're reusing the port
+        self.workers = {}           # pid -> (slot number, start time)
+        self.draining = {}          # pid -> time to kill it, or None if done
+        self.signals = []           # received, not yet handled
+        self.pid = os.getpid()
+
+    def run(self):
+        """Fork workers and supervise them until we're told to stop.
+        """
+        website = self.website
+        predecessors = os.environ.pop(DRAINING, '')
+        predecessors = [int(pid) for pid in predecessors.split(',') if pid]
+        if website.workers_warm_cache:
+            nloaded = resources.warm(website)
+            aspen.log("Loaded %d resources before forking." % nloaded)
+            website.startup.lap('warm')
+        self.socket = inherit(website)
+        if website.workers_reuse_port:
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+        elif self.socket is None:
+            self.socket = listen(website)
+
+        website.startup.lap('listen')
+        aspen.log("Started up in %s." % website.startup)
+
+        for signum in (signal.SIGHUP, signal.SIGINT, signal.SIGQUIT,
+                       signal.SIGTERM):
+            signal.signal(signum, self.receive)
+
+        if website.network_port is not None:
+            welcome = "port %d" % website.network_port
+        else:
+            welcome = "%s port %d" % website.network_address[:2]
+        aspen.log_dammit("Greetings, program! Welcome to %s." % welcome)
+        aspen.log("Forking %d workers." % website.workers)
+        for slot in range(website.workers):
+            self.spawn(slot)
+        if predecessors:
+            aspen.log("Draining %d old workers." % len(predecessors))
+            for pid in predecessors:
+                self.drain(pid)
+
+        while 1:
+            self.reap()
+            self.kill_stragglers()
+            if [s for s in self.signals if s != signal.SIGHUP]:
+                self.stop_workers()
+                raise SystemExit
+            if self.signals and not self.draining:
+                self.reload()   # wait for one generation to drain at a time
+            time.sleep(0.5)     # signals cut this short
+
+    def receive(self, signum, frame):
+        self.signals.append(signum)
+
+    def reload(self):
+        """Re-execute ourselves, handing off the socket and the workers.
+        """
+        aspen.log_dammit("Received HUP, reloading.")
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)    # until we're back
+        pids = self.workers.keys() + self.draining.keys()
+        os.environ[DRAINING] = ','.join([str(pid) for pid in pids])
+        if self.socket is not None:
+            hand_off(self.socket)
+        execution.execute()
+
+
+    # Workers
+    # =======
+
+    def spawn(self, slot):
+        """Given a slot number, fork a worker into it.
+        """
+        aspen.logging.flush()   # or the worker would write it out again
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                aspen.logging.after_fork()
+                status = self.work(slot)
+            finally:
+                aspen.logging.flush()   # os._exit doesn't run atexit handlers
+                os._exit(status)
+        self.workers[pid] = (slot, time.time())
+        aspen.log("Started worker %d (pid %d)." % (slot, pid))
+
+    def work(self, slot):
+        """Given a slot number, serve the website. Return an exit status.
+
+        This runs in the worker process.
+
+        """
+        master = self.pid
+        aspen.logging.PID = os.getpid()
+        website = self.website
+        engine = website.network_engine
+
+        def stop(signum, frame):
+            for signum in (signal.SIGINT, signal.SIGQUIT, signal.SIGTERM):
+                signal.signal(signum, signal.SIG_IGN)   # once is enough
+            engine.interrupt()
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for signum in (signal.SIGINT, signal.SIGQUIT, signal.SIGTERM):
+            signal.signal(signum, stop)
+
+        reloading = []
+        def reload_master():
+            if not reloading:                   # once is enough
+                reloading.append(True)
+                os.kill(master, signal.SIGHUP)
+        execution.execute = reload_master   # instead of execv-ing ourselves
+
+        recycling = []
+        def check_all():
+            if os.getppid() != master:      # orphaned
+                raise SystemExit
+            execution.check_wear(website, recycling)
+            if website.changes_reload:
+                execution.check_all()
+
+        engine.socket = self.socket
+        if engine.socket is None:
+            engine.socket = listen(website, reuse_port=True)
+        try:
+            try:
+                engine.bind()
+                engine.start_checking(check_all)
+                website.start()
+            except (KeyboardInterrupt, SystemExit):
+                pass
+            except:
+                aspen.log_dammit(traceback.format_exc())
+                return 1
+            engine.drain(website.workers_drain_timeout)
+        finally:
+            website.stop()
+        return 0
+
+    def reap(self):
+        """Wait on dead workers without blocking, and restart them.
+        """
+        while self.workers or self.draining:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                if exc.errno == errno.ECHILD:   # not ours after all
+                    self.draining.clear()
+                    break
+                raise
+            if pid == 0:
+                break
+            if pid in self.draining:
+                del self.draining[pid]
+                continue
+            if pid not in self.workers:
+                continue
+            slot, started = self.workers.pop(pid)
+            if os.WIFSIGNALED(status):
+                how = "was killed by signal %d" % os.WTERMSIG(status)
+            elif os.WEXITSTATUS(status) == 0:
+                how = "finished"                # recycled; see work
+            else:
+                how = "exited with status %d" % os.WEXITSTATUS(status)
+            aspen.log_dammit("Worker %d (pid %d) %s. Restarting."
+                             % (slot, pid, how))
+            if time.time() - started < MIN_LIFETIME:
+                time.sleep(MIN_LIFETIME)    # don't spin on a crashing worker
+            self.spawn(slot)
+
+    def drain(self, pid):
+        """Given a worker's pid, tell it to finish up and exit.
+        """
+        self.workers.pop(pid, None)
+        timeout = self.website.workers_drain_timeout + KILL_GRACE
+        self.draining[pid] = time.time() + timeout
+        self.kill(pid, signal.SIGTERM)
+
+    def kill_stragglers(self):
+        """Kill draining workers that are past their deadline.
+        """
+        now = time.time()
+        for pid, deadline in self.draining.items():
+            if deadline is not None and now >= deadline:
+                aspen.log_dammit("Killing worker pid %d." % pid)
+                self.kill(pid, signal.SIGKILL)
+                self.draining[pid] = None
+
+    def stop_workers(self):
+        """Drain all workers, and wait for them to exit.
+        """
+        for pid in self.workers.keys():
+            self.drain(pid)
+        while self.draining:
+            self.reap()
+            self.kill_stragglers()
+            time.sleep(0.05)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError, exc:
+            if exc.errno != errno.ESRCH:
+                raise
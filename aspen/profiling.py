@@ -0,0 +1,218 @@
+"""Profile requests on demand, in place.
+
+Set profile_secret, and a request that carries it is run under cProfile:
+
+    $ curl -H 'X-Aspen-Profile: s3cret' http://example.com/slow.html
+    $ curl http://example.com/slow.html?aspen_profile=s3cret
+
+We write the profile to profile_dir (a private directory under the system's
+temporary directory by default) as a .pstats file, for pstats or a viewer like
+SnakeViz, along with a .txt file of the top functions by cumulative time. The
+response has an X-Aspen-Profile header naming the file, with the number of
+calls and the time they took.
+
+One request can be misleading, so you can ask for a sample instead, by adding
+a count to the secret:
+
+    $ curl -H 'X-Aspen-Profile: s3cret:50' http://example.com/slow.html
+
+That profiles this request and the next 49 requests for the same URL path,
+from anyone, and writes one merged profile when the last of them is done. A
+sample is at most 1,000 requests, and we drop one that's gone five minutes
+without a request for its path starting or finishing.
+
+Only the thread handling the request is profiled. For a coroutine simplate
+(see aspen.coroutines) that includes page two's resumption, but not time
+spent suspended. Query strings often end up in logs, so prefer the header.
+
+"""
+import os
+import threading
+import time
+
+import aspen
+
+
+HEADER = 'X-Aspen-Profile'
+QUERY = 'aspen_profile'
+NTOP = 40   # functions in the .txt summary
+MAX_SAMPLE = 1000       # requests in a sample
+SAMPLE_TIMEOUT = 300    # seconds a sample can sit idle before we drop it
+
+
+def constant_time_compare(a, b):
+    """Given two strings, return whether they're equal, in constant time.
+
+    That is, in time that doesn't depend on where they differ, so that a
+    timing attack can't guess the secret a byte at a time.
+
+    """
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+def slugify(path):
+    """Given a URL path, return something safe to put in a filename.
+    """
+    slug = []
+    for c in path.strip('/') or 'index':
+        if not (c.isalnum() or c in '.-'):
+            c = '_'
+        slug.append(c)
+    return ''.join(slug)[:64]
+
+
+class Sample(object):
+    """Model a merged profile of several requests for one URL path.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.nstarted = 1
+        self.stats = None       # a pstats.Stats, once the first is done
+        self.nfinished = 0
+        self.touched = time.time()
+
+    def touch(self):
+        self.touched = time.time()
+
+    def is_stale(self):
+        return time.time() - self.touched > SAMPLE_TIMEOUT
+
+
+class Profiler(object):
+    """Decide which requests to profile, and write out their profiles.
+    """
+
+    def __init__(self, secret, directory):
+        self.secret = secret
+        self.directory = directory
+        self.samples = {}       # URL path -> Sample
+        self.lock = threading.Lock()
+        self.nwritten = 0
+
+    def check(self, request):
+        """Given a Request, set request.profile to a cProfile.Profile or None.
+        """
+        request.profile = None
+        path = request.line.uri.path.raw
+        value = request.headers.get(HEADER)
+        if value is None:
+            value = request.line.uri.querystring.get(QUERY)
+
+        if value is None:
+            if path not in self.samples:
+                return              # fast path: nothing to do
+            self.lock.acquire()
+            try:
+                sample = self.samples.get(path)
+                if sample is None:
+                    return
+                if sample.is_stale():
+                    self.drop(path)
+                    return
+                if sample.nstarted >= sample.n:
+                    return
+                sample.nstarted += 1
+                sample.touch()
+            finally:
+                self.lock.release()
+        else:
+            secret, n = value, 1
+            if ':' in value:
+                secret, n = value.rsplit(':', 1)
+                try:
+                    n = min(max(int(n), 1), MAX_SAMPLE)
+                except ValueError:
+                    n = 1
+            if not constant_time_compare(secret, self.secret):
+                return
+            if n > 1:
+                self.lock.acquire()
+                try:
+                    sample = self.samples.get(path)
+                    if sample is not None:
+                        if not sample.is_stale():
+                            return  # one sample per path at a time
+                        self.drop(path)
+                    self.samples[path] = Sample(n)
+                finally:
+                    self.lock.release()
+
+        import cProfile
+        request.profile = cProfile.Profile()
+
+    def finish(self, request, response):
+        """Given a profiled Request and its Response, write out the profile.
+        """
+        import pstats
+        path = request.line.uri.path.raw
+        stats = pstats.Stats(request.profile)
+        request.profile = None
+
+        self.lock.acquire()
+        try:
+            sample = self.samples.get(path)
+            if sample is not None:
+                if sample.stats is None:
+                    sample.stats = stats
+                else:
+                    sample.stats.add(stats)
+                sample.nfinished += 1
+                sample.touch()
+                if sample.nfinished < sample.n:
+                    response.headers[HEADER] = ( "sampled %d of %d"
+                                               % (sample.nfinished, sample.n)
+                                                )
+                    return
+                del self.samples[path]
+                stats = sample.stats
+            self.nwritten += 1
+            n = self.nwritten
+        finally:
+            self.lock.release()
+
+        name = "%s-%s-%d-%d" % ( time.strftime('%Y%m%d-%H%M%S')
+                               , slugify(path)
+                               , aspen.logging.PID
+                               , n
+                                )
+        if sample is not None:
+            name += "-x%d" % sample.n
+        filepath = self.write(stats, name)
+        response.headers[HEADER] = ( "%s; %d calls in %.1f ms"
+                                   % ( os.path.basename(filepath)
+                                     , stats.total_calls
+                                     , stats.total_tt * 1000
+                                      ))
+        aspen.log_dammit("Wrote a profile of %s to %s." % (path, filepath))
+
+    def drop(self, path):
+        """Given a URL path, forget its stale sample. Call with the lock held.
+        """
+        sample = self.samples.pop(path)
+        aspen.log_dammit( "Dropped a sample of %s after %d of %d requests."
+                        % (path, sample.nfinished, sample.n)
+                         )
+
+    def write(self, stats, name):
+        """Given a pstats.Stats and a name, write it out. Return the filepath.
+        """
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory, 0700)
+            except OSError:
+                if not os.path.isdir(self.directory):   # lost a race is fine
+                    raise
+        filepath = os.path.join(self.directory, name + '.pstats')
+        stats.dump_stats(filepath)
+        fp = open(os.path.join(self.directory, name + '.txt'), 'w+')
+        try:
+            stats.stream = fp
+            stats.sort_stats('cumulative').print_stats(NTOP)
+        finally:
+            fp.close()
+        return filepath
@@ -33,6 +33,8 @@ import traceback
 PAGE_BREAK = chr(12) # used in the following imports
 
 from aspen.exceptions import LoadError
+from aspen.metrics import REGISTRY
+from aspen.http.request import Request
 from aspen.resources.json_resource import JSONResource
 from aspen.resources.negotiated_resource import NegotiatedResource
 from aspen.resources.rendered_resource import RenderedResource
@@ -45,6 +47,15 @@ from aspen.resources.static_resource import StaticResource
 
 __cache__ = dict()        # cache, keyed to filesystem path
 
+HITS = REGISTRY.counter( 'aspen_resource_cache_hits_total'
+                       , "Resource cache hits."
+                        )
+COMPILES = REGISTRY.counter( 'aspen_resource_compiles_total'
+                           , "Resources loaded and compiled, by whether that "
+                             "raised."
+                           , ('result',)
+                            )
+
 class Entry:
     """An entry in the global resource cache.
     """
@@ -186,17 +197,23 @@ def get(request):
 
     mtime = os.stat(request.fs)[stat.ST_MTIME]
     if entry.mtime == mtime:                                # cache hit
+        HITS.inc()
         if entry.exc is not None:
             raise entry.exc
     else:                                                   # cache miss
+        span = request.trace.span('resource.load', fs=request.fs)
         try:
             entry.resource = load(request, mtime)
         except:     # capture any Exception
+            span.set(error=sys.exc_info()[0].__name__)
             entry.exc = ( LoadError(traceback.format_exc())
                         , sys.exc_info()[2]
                          )
+            COMPILES.inc(('error',))
         else:       # reset any previous Exception
             entry.exc = None
+            COMPILES.inc(('ok',))
+        span.finish()
 
         entry.mtime = mtime
         if entry.exc is not None:
@@ -209,3 +226,32 @@ def get(request):
     # entry.resource.pages[0].
 
     return entry.resource
+
+
+def warm(website, failures=None):
+    """Given a Website and maybe a list, load everything under www_root.
+
+    This is for use before forking worker processes, so that they all start
+    out sharing compiled resources. Files and directories whose names start
+    with a dot are skipped. If given a list, we append (filepath, LoadError)
+    for each resource that fails to load. Return the number of resources
+    loaded.
+
+    """
+    nloaded = 0
+    for root, dirs, files in os.walk(website.www_root):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for filename in files:
+            if filename.startswith('.'):
+                continue
+            request = Request()
+            request.website = website
+            request.fs = os.path.join(root, filename)
+            try:
+                get(request)
+            except LoadError, exc:
+                if failures is not None:
+                    failures.append((request.fs, exc))
+                continue    # we'll raise it again on request
+            nloaded += 1
+    return nloaded
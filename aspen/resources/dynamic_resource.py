@@ -1,4 +1,9 @@
+from __future__ import with_statement # for Python 2.5
+
 from aspen import Response
+from aspen.coroutines import Coroutine, Suspension, compile_page_two
+from aspen.coroutines import generate, is_coroutine
+from aspen.deadlines import BUDGET
 from aspen.resources import PAGE_BREAK
 from aspen.resources.resource import Resource
 
@@ -21,6 +26,7 @@ class DynamicResource(Resource):
 
     min_pages = None  # set on subclass
     max_pages = None
+    coroutines = True # whether page two may yield; see aspen.coroutines
 
     def __init__(self, *a, **kw):
         Resource.__init__(self, *a, **kw)
@@ -32,6 +38,8 @@ class DynamicResource(Resource):
         """Given a Request and maybe a Response, return or raise a Response.
         """
         response = response or Response(charset=self.website.charset_dynamic)
+        if BUDGET in self.pages[0]:     # see aspen.deadlines
+            self.website.overseer.stamp(request, self.pages[0][BUDGET])
 
 
         # Populate context.
@@ -42,19 +50,42 @@ class DynamicResource(Resource):
 
         # Exec page two.
         # ==============
+        # If page two is a coroutine, the network engine decides whether to
+        # wait for it here or to suspend the request and finish it later.
+
+        if is_coroutine(self.pages[1]):
+            page_two = Coroutine( generate(self.pages[1], context)
+                                , request.deadline
+                                 )
+            request.coroutine = page_two
+            span = request.trace.span('page.exec', coroutine=True)
+            def finish():
+                span.finish()
+                return self.finish(context, page_two)
+            suspension = Suspension(page_two, finish)
+            return self.website.network_engine.suspend(suspension)
 
         try:
-            exec self.pages[1] in context
+            with request.trace.span('page.exec'):
+                exec self.pages[1] in context
         except Response, response:
             response = self.process_raised_response(response)
             raise response
 
+        return self.finish(context)
+
+
+    def finish(self, context, page_two=None):
+        """Given a context dict and maybe a Coroutine, return a Response.
 
-        # Hook.
-        # =====
+        If given a Coroutine it must be done. We raise whatever it raised.
 
+        """
         try:
-            response = self.get_response(context)
+            if page_two is not None:
+                page_two.result()
+            with context['request'].trace.span('render'):
+                response = self.get_response(context)
         except Response, response:
             response = self.process_raised_response(response)
             raise response
@@ -149,7 +180,10 @@ class DynamicResource(Resource):
         exec one in context    # mutate context
         one = context          # store it
 
-        two = compile(two, self.fs, 'exec')
+        if self.coroutines:
+            two = compile_page_two(two, self.fs)
+        else:
+            two = compile(two, self.fs, 'exec')
 
         pages[0] = one
         pages[1] = two
@@ -7,6 +7,7 @@ class SocketResource(DynamicResource):
 
     min_pages = 1
     max_pages = 4
+    coroutines = False # sockets have their own loop
 
     def respond(self):
         """Override and kill it. For sockets the Socket object responds.
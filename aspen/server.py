@@ -21,8 +21,8 @@ def _main(argv):
     # =======================
 
     def SIGHUP(signum, frame):
-        aspen.log_dammit("Received HUP, re-executing.")
-        execution.execute()
+        aspen.log_dammit("Received HUP, reloading.")
+        execution.execute()     # drains first once we're serving; see below
     if not aspen.WINDOWS:
         signal.signal(signal.SIGHUP, SIGHUP)
 
@@ -49,6 +49,18 @@ def _main(argv):
     if argv is None:
         argv = sys.argv[1:]
     website = Website(argv)
+    if website.check:
+        return check(website)
+
+
+    # Fork workers, maybe.
+    # ====================
+    # See aspen/prefork.py.
+
+    if website.workers > 1:
+        from aspen.prefork import Master
+        Master(website).run()
+        return
 
 
     # Start serving the website.
@@ -57,6 +69,12 @@ def _main(argv):
     # restarting as needed. Wrap the whole thing in a try/except to
     # do some cleanup on shutdown.
 
+    recycling = []  # a reason, if we wear out; see aspen/execution.py
+    execv = execution.execute
+    def reload():
+        if not recycling:   # once is enough
+            recycling.append("reloading")
+            website.network_engine.interrupt()
     try:
         if hasattr(socket, 'AF_UNIX'):
             if website.network_sockfam == socket.AF_UNIX:
@@ -68,13 +86,37 @@ def _main(argv):
         else:
             welcome = website.network_address
         aspen.log("Starting %s engine." % website.network_engine.name)
+        if website.network_engine.prefork and website.network_port is not None:
+            # Bind the socket ourselves, so that we can keep it open when we
+            # re-execute, and connections wait instead of being refused.
+            from aspen.prefork import hand_off, inherit, listen
+            listener = inherit(website) or listen(website)
+            website.network_engine.socket = listener
+            hand_off(listener)
         website.network_engine.bind()
+        website.startup.lap('bind')
+        aspen.log("Started up in %s." % website.startup)
         aspen.log_dammit("Greetings, program! Welcome to %s." % welcome)
         if website.changes_reload:
             aspen.log("Aspen will restart when configuration scripts or "
                       "Python modules change.")
-            execution.install(website)
-        website.start()
+        if website.max_requests or website.max_rss:
+            aspen.log("Aspen will restart when it has served max_requests "
+                      "requests or grown past max_rss megabytes.")
+        execution.execute = reload  # drain instead of execv-ing right away
+        def check_all():
+            execution.check_wear(website, recycling)
+            if website.changes_reload:
+                execution.check_all()
+        if website.changes_reload or website.max_requests or website.max_rss:
+            execution.install(website, check_all)  # one loop for both
+        try:
+            website.start()
+        except SystemExit:
+            if not recycling:
+                raise
+        if recycling:
+            website.network_engine.drain(website.workers_drain_timeout)
 
     except socket.error:
 
@@ -116,13 +158,54 @@ def _main(argv):
             if website.network_sockfam == socket.AF_UNIX:
                 if os.path.exists(website.network_address):
                     os.remove(website.network_address)
+        execution.execute = execv
         website.stop()
 
+    if recycling:
+        execution.execute()
+
+def check(website):
+    """Given a Website, try loading everything it might need. Return a status.
+
+    That's every renderer and every resource under www_root. A renderer whose
+    third-party library isn't installed is only a problem if it's the default.
+
+    """
+    import aspen
+    from aspen import resources
+
+    status = 0
+    factories = website.renderer_factories
+    aspen.log_dammit("Renderers (*ed are unavailable, CAPS is default):")
+    width = max(map(len, factories))
+    for name, factory in sorted(factories.items()):
+        star = " "
+        if isinstance(factory, ImportError):
+            star = "*"
+            error = "ImportError: " + factory.args[0]
+            if name == website.renderer_default:
+                status = 1
+        else:
+            error = ""
+        if name == website.renderer_default:
+            name = name.upper()
+        name = name.ljust(width + 2)
+        aspen.log_dammit(" %s%s%s" % (star, name, error))
+
+    failures = []
+    nloaded = resources.warm(website, failures)
+    for filepath, exc in failures:
+        aspen.log_dammit("Failed to load %s:\n%s" % (filepath, exc.args[0]))
+        status = 1
+    aspen.log_dammit("Loaded %d resources; %d failed."
+                     % (nloaded, len(failures)))
+    return status
+
 def main(argv=None):
     """http://aspen.io/cli/
     """
     try:
-        _main(argv)
+        return _main(argv)
     except SystemExit:
         pass
     except:
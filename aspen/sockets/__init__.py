@@ -12,6 +12,7 @@ from the inside out:
     Loop        an object responsible for repeatedly calling socket.tick
     Socket      a Socket.IO socket, maintains state
     Channel     an object that represents all connections to a single Resource
+    Backend     an object that shares channels and sockets between processes
     Transport   a Socket.IO transport mechanism, does HTTP work
     Resource    an HTTP resource, a file on your filesystem, application logic
     Response    an HTTP Response message
@@ -105,12 +106,16 @@ def get(request):
         if path in __channels__:
             channel = __channels__[path]
         else:
-            channel = Channel(path, request.website.network_engine.Buffer)
+            channel = Channel( path
+                             , request.website.network_engine.Buffer
+                             , request.website.socket_backend
+                              )
             __channels__[path] = channel
 
         socket = Socket(request, channel)
         assert socket.sid not in __sockets__ # sanity check
         __sockets__[socket.sid] = socket
+        request.website.socket_backend.claim(socket.sid)
         socket.loop.start()
 
         return socket.shake_hands() # a Response
@@ -127,9 +132,21 @@ def get(request):
         msg %= (",".join(TRANSPORTS), transport)
         raise Response(400, msg)
 
-    if sid not in __sockets__:
+    transport = get_transport(sid)
+    if transport is None:
+        # The socket may live in another process.
+        transport = request.website.socket_backend.locate(sid)
+    if transport is None:
         msg = "Expected %s in cache, didn't find it"
         raise Response(400, msg % sid)
+    return transport
+
+
+def get_transport(sid):
+    """Given a socket id, return a Transport object, or None.
+    """
+    if sid not in __sockets__:
+        return None
 
     if type(__sockets__[sid]) is Socket:
         # This is the first request after a handshake. It's not until this
@@ -137,5 +154,20 @@ def get(request):
         Transport = XHRPollingTransport # XXX derp
         __sockets__[sid] = Transport(__sockets__[sid])
 
-    transport = __sockets__[sid]
-    return transport
+    return __sockets__[sid]
+
+
+def metrics():
+    """Return a list of per-socket buffer statistics.
+
+    The list is sorted by outgoing buffer depth, deepest first, so the slowest
+    consumers are at the top.
+
+    """
+    out = []
+    for socket in __sockets__.values():
+        if not isinstance(socket, Socket):  # it's wrapped in a Transport
+            socket = socket.socket
+        out.append(socket.metrics())
+    out.sort(key=lambda m: m['outgoing']['depth'], reverse=True)
+    return out
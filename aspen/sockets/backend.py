@@ -0,0 +1,41 @@
+"""Share Socket.IO channels and sessions between processes.
+
+A Socket never leaves the process that shook hands with its client, because
+each one has a loop running its resource. What a backend shares is news about
+sockets: it carries channel broadcasts to every process with sockets on the
+channel, and it routes requests for a socket that lives in another process to
+the process that has it.
+
+The default, InProcessBackend, assumes there is only one process. See
+aspen.sockets.broker for a backend that works across processes on one host.
+Either way the website holds its backend at website.socket_backend, and you can
+set that to something else in configure-aspen.py.
+
+"""
+
+
+class InProcessBackend(object):
+    """Model a backend for a website served from a single process.
+    """
+
+    def publish(self, channel, method, args):
+        """Given a Channel, a Socket method name, and a list, broadcast.
+        """
+        channel.deliver(method, args)
+
+    def claim(self, sid):
+        """Given a socket id, note that this process has the socket.
+        """
+
+    def release(self, sid):
+        """Given a socket id, note that this process no longer has the socket.
+        """
+
+    def locate(self, sid):
+        """Given the id of a socket this process doesn't have, return None.
+
+        Subclasses return an object with a respond method (like a Transport)
+        if the socket lives in some other process.
+
+        """
+        return None
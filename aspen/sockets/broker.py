@@ -0,0 +1,481 @@
+"""Share Socket.IO channels and sessions between processes via a broker.
+
+The broker is a small pub/sub daemon listening on a Unix domain socket:
+
+    $ aspen-broker /tmp/aspen-broker.sock
+
+Point each of your Aspen processes at it:
+
+    $ aspen --socket_broker=/tmp/aspen-broker.sock
+
+Each process then holds one connection to the broker. Over it they publish
+channel broadcasts, which the broker relays to every other process, and they
+claim socket ids, so that when a polling request for a socket lands on a
+process that doesn't have the socket, the broker can relay it to the one that
+does.
+
+The wire format is a series of frames. Each frame is a decimal length, a
+newline, and that many bytes of JSON encoding an object with an "op" key:
+
+    publish     channel, method, args   a broadcast on a channel
+    claim       sid                     the sender has this socket
+    release     sid                     the sender no longer has this socket
+    locate      id, sid                 does another process have sid?
+    call        id, sid, method, body   respond to an HTTP request for sid
+    reply       id, code, body          the response to a locate or a call
+
+The broker forgets a process's claims when it loses the connection, so each
+process claims its sockets again whenever it reconnects.
+
+"""
+from __future__ import absolute_import, with_statement
+import itertools
+import os
+import socket
+import sys
+import threading
+import traceback
+from cStringIO import StringIO
+from functools import partial
+
+try:
+    import SocketServer
+except ImportError:
+    import socketserver as SocketServer
+
+import aspen
+from aspen import json, sockets, Response
+from aspen.http.request import Request
+from aspen.sockets import TIMEOUT
+from aspen.sockets.backend import InProcessBackend
+
+
+# Frames
+# ======
+
+def encode_frame(frame):
+    """Given a dictionary, return a frame, a bytestring.
+
+    This raises ValueError (or TypeError) for what JSON can't encode, like
+    bytestrings that aren't UTF-8.
+
+    """
+    data = json.dumps(frame)
+    return "%d\n%s" % (len(data), data)
+
+def write_frame(sock, frame):
+    """Given a socket and a dictionary, write a frame.
+    """
+    sock.sendall(encode_frame(frame))
+
+def read_frame(fp):
+    """Given a file-like object, return a dictionary, or None at EOF.
+    """
+    line = fp.readline()
+    if not line:
+        return None
+    nbytes = int(line)
+    data = fp.read(nbytes)
+    if len(data) < nbytes:
+        return None
+    return json.loads(data)
+
+def utf8(o):
+    """Given an object from a frame, return it with unicode made UTF-8.
+
+    JSON gives us unicode, but Socket.IO messages are bytestrings.
+
+    """
+    if isinstance(o, unicode):
+        o = o.encode('UTF-8')
+    return o
+
+
+# Client
+# ======
+
+class BrokerBackend(InProcessBackend):
+    """Model a backend that shares channels and sessions through a broker.
+    """
+
+    timeout = TIMEOUT * 2   # long enough to cover a long-poll in another
+                            # process
+
+    def __init__(self, path, engine=None):
+        """Takes the filesystem path of the broker's Unix socket, and maybe a
+        network engine, to reach our sockets through; see call_soon.
+        """
+        self.path = path
+        self.engine = engine
+        self.pid = None         # the process that owns self.sock [int]
+        self.sock = None
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.waiting = {}       # call id -> [threading.Event, reply]
+        self.claims = set()     # sids we have, to claim again on reconnect
+
+    def publish(self, channel, method, args):
+        """Extend to broadcast to other processes as well.
+        """
+        InProcessBackend.publish(self, channel, method, args)
+        self.send({ 'op': 'publish'
+                  , 'channel': channel.name
+                  , 'method': method
+                  , 'args': args
+                   })
+
+    def claim(self, sid):
+        self.claims.add(sid)
+        self.send({'op': 'claim', 'sid': sid})
+
+    def release(self, sid):
+        self.claims.discard(sid)
+        self.send({'op': 'release', 'sid': sid})
+
+    def locate(self, sid):
+        """Override to ask the broker whether another process has sid.
+        """
+        reply = self.ask({'op': 'locate', 'sid': sid})
+        if reply is None or reply['code'] != 200:
+            return None
+        return RemoteTransport(self, sid)
+
+    def call(self, sid, method, body):
+        """Given a socket id, an HTTP method, and a body, return (code, body).
+        """
+        frame = {'op': 'call', 'sid': sid, 'method': method, 'body': body}
+        reply = self.ask(frame)
+        if reply is None:
+            return (502, "The socket broker didn't answer for %s." % sid)
+        return (reply['code'], utf8(reply['body']))
+
+    def ask(self, frame):
+        """Given a dictionary, send it with a new id. Return the reply or None.
+        """
+        id = frame['id'] = self.ids.next()
+        waiter = self.waiting[id] = [threading.Event(), None]
+        if self.send(frame):
+            waiter[0].wait(self.timeout)
+        self.waiting.pop(id, None)
+        return waiter[1]
+
+
+    # Connection
+    # ==========
+    # We connect lazily, and again if we find ourselves in a new process,
+    # because a connection inherited across fork belongs to our parent.
+
+    def send(self, frame):
+        """Given a dictionary, write it to the broker. Return a boolean.
+        """
+        try:
+            data = encode_frame(frame)
+        except (TypeError, ValueError):
+            aspen.log_dammit("Couldn't encode a frame for the socket broker:")
+            aspen.log_dammit(traceback.format_exc())
+            return False
+        with self.lock:
+            try:
+                if self.pid != os.getpid():
+                    self.connect()
+                self.sock.sendall(data)
+            except socket.error:
+                aspen.log_dammit("Couldn't write to the socket broker at %s:"
+                                 % self.path)
+                aspen.log_dammit(traceback.format_exc())
+                self.pid = None
+                return False
+        return True
+
+    def connect(self):
+        """Connect to the broker, and claim our sockets (again).
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        for sid in list(self.claims):
+            write_frame(sock, {'op': 'claim', 'sid': sid})
+        reader = threading.Thread(target=self.read, args=(sock,))
+        reader.daemon = True
+        reader.start()
+        self.sock = sock
+        self.pid = os.getpid()
+
+    def call_soon(self, func, *a):
+        """Given a callable and arguments, call it where sockets are safe.
+
+        On an engine with an event loop that's on the loop, not in our thread.
+
+        """
+        callback = partial(func, *a)
+        if self.engine is None:
+            callback()
+        else:
+            self.engine.add_callback(callback)
+
+    def read(self, sock):
+        """Given a connected socket, handle frames from the broker until EOF.
+
+        This runs in its own thread. A frame we can't parse loses us our place
+        in the stream, so we drop the connection, and reconnect on next send.
+
+        """
+        fp = sock.makefile('rb')
+        while 1:
+            try:
+                frame = read_frame(fp)
+            except socket.error:
+                frame = None
+            except ValueError:
+                aspen.log_dammit("Bad frame from the socket broker at %s:"
+                                 % self.path)
+                aspen.log_dammit(traceback.format_exc())
+                frame = None
+            if frame is None:
+                break
+            op = frame['op']
+            if op == 'publish':
+                self.call_soon(self.deliver, frame)
+            elif op == 'call':
+                answer = threading.Thread(target=self.answer, args=(frame,))
+                answer.daemon = True
+                answer.start()
+            elif op == 'reply':
+                waiter = self.waiting.get(frame['id'])
+                if waiter is not None:
+                    waiter[1] = frame
+                    waiter[0].set()
+
+        aspen.log_dammit("Lost the socket broker at %s." % self.path)
+        if self.sock is sock:
+            self.pid = None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass    # already gone
+        sock.close()
+        for waiter in self.waiting.values():
+            waiter[0].set()
+
+    def deliver(self, frame):
+        """Given a publish frame, deliver it to our sockets on the channel.
+        """
+        channel = sockets.__channels__.get(frame['channel'])
+        if channel is not None:
+            args = [utf8(arg) for arg in frame['args']]
+            channel.deliver(frame['method'], args)
+
+    def answer(self, frame):
+        """Given a call frame, respond to it using a local socket.
+
+        This runs in its own thread, because the call is probably a long-poll,
+        which blocks on threaded engines. On engines with an event loop we
+        hand the work to the loop, and reply when the long-poll answers.
+
+        """
+        self.call_soon(self.respond, frame)
+
+    def respond(self, frame):
+        """Given a call frame, reply to it now, or when a long-poll answers.
+        """
+        code, body = 500, ''
+        try:
+            transport = sockets.get_transport(frame['sid'])
+            if transport is None:
+                code = 400
+                body = "Expected %s in cache, didn't find it" % frame['sid']
+            else:
+                socket_ = transport.socket
+                request = Request( utf8(frame['method'])
+                                 , socket_.endpoint.encode('UTF-8')
+                                 , body=StringIO(utf8(frame['body']))
+                                  )
+                request.website = socket_.website
+                try:
+                    response = transport.respond(request)
+                except Response, response:
+                    pass
+                code = response.code
+                body = response.body
+                if hasattr(body, 'answer'):     # see EventedLongPoll
+                    body.answer(partial(self.reply, frame, code))
+                    return
+                if not isinstance(body, basestring):
+                    body = ''.join(body)
+        except:
+            aspen.log_dammit(traceback.format_exc())
+        self.reply(frame, code, body)
+
+    def reply(self, frame, code, body):
+        """Given a call frame, a status code, and a body, reply to the call.
+        """
+        if not isinstance(body, basestring):
+            body = ''.join(body)
+        self.send({'op': 'reply', 'id': frame['id'], 'code': code, 'body': body})
+
+
+class RemoteTransport(object):
+    """Stand in for a Transport whose Socket lives in another process.
+    """
+
+    def __init__(self, backend, sid):
+        self.backend = backend
+        self.sid = sid
+
+    def respond(self, request):
+        """Given a Request, return or raise a Response from the remote socket.
+        """
+        code, body = self.backend.call( self.sid
+                                      , request.line.method.raw
+                                      , request.body.raw
+                                       )
+        response = Response(code, body)
+        if code >= 400:
+            raise response
+        return response
+
+
+# Server
+# ======
+
+class Connection(SocketServer.BaseRequestHandler):
+    """Model one Aspen process's connection to the broker.
+    """
+
+    def setup(self):
+        self.lock = threading.Lock()
+        self.server.add(self)
+
+    def handle(self):
+        fp = self.request.makefile('rb')
+        while 1:
+            try:
+                frame = read_frame(fp)
+            except (socket.error, ValueError):
+                frame = None
+            if frame is None:
+                break
+            self.server.route(self, frame)
+
+    def finish(self):
+        self.server.remove(self)
+
+    def send(self, frame):
+        with self.lock:
+            try:
+                write_frame(self.request, frame)
+            except socket.error:
+                pass # we'll find out in handle
+
+
+class Broker(SocketServer.ThreadingUnixStreamServer):
+    """Model a pub/sub broker for Aspen processes on one host.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        """Takes the filesystem path to listen on.
+        """
+        SocketServer.ThreadingUnixStreamServer.__init__(self, path, Connection)
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.connections = []
+        self.owners = {}        # sid -> Connection
+        self.pending = {}       # our call id -> (caller, caller's id, owner)
+
+    def add(self, connection):
+        with self.lock:
+            self.connections.append(connection)
+
+    def remove(self, connection):
+        """Forget a connection, and fail any calls waiting on it.
+        """
+        with self.lock:
+            self.connections.remove(connection)
+            for sid, owner in self.owners.items():
+                if owner is connection:
+                    del self.owners[sid]
+            failed = []
+            for id, (caller, caller_id, owner) in self.pending.items():
+                if owner is connection:
+                    failed.append((caller, caller_id))
+                    del self.pending[id]
+        for caller, caller_id in failed:
+            caller.send({ 'op': 'reply'
+                        , 'id': caller_id
+                        , 'code': 502
+                        , 'body': "The process with that socket went away."
+                         })
+
+    def route(self, sender, frame):
+        """Given the sending Connection and a dictionary, relay the frame.
+        """
+        op = frame.get('op')
+        with self.lock:
+            if op == 'publish':
+                recipients = [c for c in self.connections if c is not sender]
+            elif op == 'claim':
+                self.owners[frame['sid']] = sender
+                recipients = []
+            elif op == 'release':
+                if self.owners.get(frame['sid']) is sender:
+                    del self.owners[frame['sid']]
+                recipients = []
+            elif op == 'locate':
+                owner = self.owners.get(frame['sid'])
+                found = owner is not None and owner is not sender
+                frame = { 'op': 'reply'
+                        , 'id': frame['id']
+                        , 'code': found and 200 or 404
+                        , 'body': ''
+                         }
+                recipients = [sender]
+            elif op == 'call':
+                owner = self.owners.get(frame['sid'])
+                if owner is None:
+                    msg = "Expected %s in cache, didn't find it"
+                    frame = { 'op': 'reply'
+                            , 'id': frame['id']
+                            , 'code': 400
+                            , 'body': msg % frame['sid']
+                             }
+                    recipients = [sender]
+                else:
+                    id = self.ids.next()
+                    self.pending[id] = (sender, frame['id'], owner)
+                    frame['id'] = id
+                    recipients = [owner]
+            elif op == 'reply':
+                caller, caller_id, owner = \
+                                    self.pending.pop(frame['id'], (None,)*3)
+                frame['id'] = caller_id
+                recipients = [c for c in [caller] if c is not None]
+            else:
+                recipients = []
+        for recipient in recipients:
+            recipient.send(frame)
+
+
+def main(argv=None):
+    """Run a broker on the Unix socket path given as the only argument.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 1:
+        print >> sys.stderr, "usage: aspen-broker <path to Unix socket>"
+        raise SystemExit(2)
+    path = argv[0]
+    if os.path.exists(path):
+        aspen.log("Removing stale socket.")
+        os.remove(path)
+    broker = Broker(path)
+    aspen.log_dammit("Greetings, program! Brokering sockets at %s." % path)
+    try:
+        try:
+            broker.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        broker.server_close()
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,12 +1,24 @@
+from aspen.sockets.backend import InProcessBackend
+
+
 class Channel(list):
     """Model a pub/sub channel as a list of socket objects.
+
+    Messages from all of the channel's sockets are only collected if someone
+    subscribes to them with channel.subscribe. Otherwise channel.incoming is
+    None and messages only go to each socket's own incoming buffer.
+
     """
 
-    def __init__(self, name, Buffer):
-        """Takes a bytestring and Buffer class.
+    def __init__(self, name, Buffer, backend=None):
+        """Takes a bytestring, a Buffer class, and maybe a socket backend.
         """
         self.name = name
-        self.incoming = Buffer('incoming')
+        self.Buffer = Buffer
+        self.incoming = None
+        if backend is None:
+            backend = InProcessBackend()
+        self.backend = backend
 
     def add(self, socket):
         """Override to check for sanity.
@@ -15,25 +27,79 @@ class Channel(list):
         self.append(socket)
 
     def disconnect_all(self):
-        for i in range(len(self)):
-            self[i].disconnect()
+        for socket in self[:]:  # disconnect removes socket from self
+            socket.disconnect()
+
+
+    # Subscription
+    # ============
+    # One consumer at a time can process the messages coming in from all of a
+    # channel's sockets. The buffer is a ring: when the consumer falls behind
+    # we drop the oldest messages rather than grow without bound.
+
+    def subscribe(self, maxsize=1024):
+        """Start collecting incoming messages, and return the buffer.
+
+        Socket resources exec their second page once per socket, so it's safe
+        to call this more than once: subsequent calls return the same buffer.
+
+        """
+        if self.incoming is None:
+            self.incoming = self.Buffer( 'incoming'
+                                       , maxsize=maxsize
+                                       , policy='drop_oldest'
+                                        )
+        return self.incoming
+
+    def unsubscribe(self):
+        """Stop collecting incoming messages, and discard any we have.
+        """
+        self.incoming = None
+
+    def recv(self):
+        """Block until the next message is available, then return it.
+        """
+        return self._subscription().next()
+
+    def recv_batch(self, n=100):
+        """Block until a message is available, then return a list of up to n.
+        """
+        incoming = self._subscription()
+        batch = [incoming.next()]
+        while len(batch) < n and not incoming.empty():
+            batch.append(incoming.get())
+        return batch
+
+    def _subscription(self):
+        incoming = self.incoming
+        if incoming is None:
+            raise RuntimeError("Please call channel.subscribe() before "
+                               "reading from channel %s." % self.name)
+        return incoming
+
+
+    # Broadcast
+    # =========
+    # Broadcasts go through our backend, which calls deliver on us and on our
+    # namesakes in any other processes.
 
     def send(self, data):
-        for socket in self:
-            socket.send(data)
+        self.backend.publish(self, 'send', [data])
 
     def send_event(self, data):
-        for socket in self:
-            socket.send_event(data)
+        self.backend.publish(self, 'send_event', [data])
 
     def send_json(self, data):
-        for socket in self:
-            socket.send_json(data)
+        self.backend.publish(self, 'send_json', [data])
 
     def send_utf8(self, data):
-        for socket in self:
-            socket.send_utf8(data)
+        self.backend.publish(self, 'send_utf8', [data])
 
     def notify(self, name, *args):
-        for socket in self:
-            socket.notify(name, *args)
+        self.backend.publish(self, 'notify', [name] + list(args))
+
+    def deliver(self, method, args):
+        """Given a Socket method name and a list, call it on all our sockets.
+        """
+        for socket in self[:]:
+            getattr(socket, method)(*args)
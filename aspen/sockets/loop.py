@@ -37,7 +37,9 @@ class ThreadedLoop(threading.Thread):
 
         We signal to the thread loop to exit as soon as the next blocking
         operation is complete, and then we attempt to unblock one of those
-        possible blocking operations: reading the incoming buffer.
+        possible blocking operations: reading the incoming buffer. If we're
+        called from the loop thread itself (a buffer overflowed during tick)
+        then we can't wait for ourselves; the loop exits when tick returns.
 
         """
         # stop running tick as soon as possible
@@ -47,5 +49,6 @@ class ThreadedLoop(threading.Thread):
         self.socket.incoming.put(Die)
 
         # wait for magic to work
-        self.join()
+        if threading.currentThread() is not self:
+            self.join()
 
@@ -11,6 +11,8 @@ RESERVED_EVENTS = [ 'message'
                   , 'reconnect'
                    ]
 
+UNDECODED = object()
+
 
 class Message(object):
     """Model a Socket.IO message.
@@ -29,15 +31,19 @@ class Message(object):
             parts.append('') # data part is optional
         if len(parts) != 4: # "::".split(":", 3) == ['', '', '']
             raise SyntaxError("This message has too few colons: %s." % bytes)
-        return cls(*parts)
+        message = cls(*parts)
+        message._load()     # validate what comes off the wire right away
+        return message
 
     def __repr__(self):
         return "<Message %s>" % self
 
     def __str__(self):
-        data = self.data
-        if self.type in (4, 5):
-            data = json.dumps(data)
+        data = self.__raw
+        if data is None:
+            data = self.__data
+            if self.type in (4, 5):
+                data = json.dumps(data)
         return ":".join([ str(self.type)
                         , self.id
                         , self.endpoint
@@ -68,17 +74,46 @@ class Message(object):
 
     # data
     # ====
+    # For JSON and event messages we hang onto the raw bytestring, and a
+    # message serializes back to it for free. A message given its data as a
+    # bytestring (socket.send_json with a string, say) never decodes it unless
+    # someone asks for data. Messages off the wire are decoded as they're
+    # parsed, so that bad ones fail there. Once someone has data they may
+    # change it in place, so from then on we encode it afresh.
 
-    __data = ''
+    __raw = ''
+    __data = UNDECODED
 
     def _get_data(self):
+        self._load()
+        if self.type in (4, 5):
+            self.__raw = None
         return self.__data
 
     def _set_data(self, data):
+        if isinstance(data, basestring):
+            self.__raw = data
+            self.__data = UNDECODED
+        else:
+            self.__raw = None
+            self.__data = data
+
+    data = property(_get_data, _set_data)
+
+    def _load(self):
+        """Decode our raw bytestring, if we haven't yet.
+        """
+        if self.__data is UNDECODED:
+            self.__data = self._decode(self.__raw)
+
+    def _decode(self, raw):
+        """Given a bytestring, return the data it encodes for our type.
+        """
+        data = raw
         if self.type == 4:              # json
-            data = json.loads(data)
+            data = json.loads(raw)
         elif self.type == 5:            # event
-            data = json.loads(data)
+            data = json.loads(raw)
             if 'name' not in data:
                 raise ValueError("An event message must have a 'name' key.")
             if 'args' not in data:
@@ -86,7 +121,4 @@ class Message(object):
             if data['name'] in RESERVED_EVENTS:
                 msg = "That event name is reserved: %s." % data['name']
                 raise ValueError(msg)
-        self.__data = data
-
-    data = property(_get_data, _set_data)
-
+        return data
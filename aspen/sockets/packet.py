@@ -6,11 +6,19 @@ Socket.IO packets contain one or more frames of this format:
 
 Alternately, a packet can contain a single encoded-message, without framing.
 
+The length is the number of characters in the encoded message, not the number
+of bytes (the reference client is JavaScript, where strings are measured in
+characters). We trust the declared length rather than splitting on \ufffd, so
+a message is free to contain \ufffd itself.
+
 """
 from aspen.sockets import FFFD
 from aspen.sockets.message import Message
 
 
+UFFFD = FFFD.decode('utf-8')
+
+
 class Packet(object):
     """Model a Socket.IO packet. It takes bytes and yields Messages.
     """
@@ -21,23 +29,72 @@ class Packet(object):
     def __iter__(self):
         """Yield Message objects.
         """
-        if self.bytes[:3] != FFFD:
-            yield Message.from_bytes(self.bytes)
-        else:
-            frames = self.bytes.split(FFFD)
-            frames = frames[1:] # discard initial empty string
-            nframes = len(frames)
-            if nframes % 2 != 0:
-                msg = "There are an odd number of frames in this packet: "
-                msg += self.bytes
-                raise SyntaxError(msg)
-            while frames:
-                # frames == [nbytes, bytes, nbytes, bytes, ...]
-                # We only care about bytes.
-                yield Message.from_bytes(frames[1])
-                frames = frames[2:]
+        return decode(self.bytes)
+
+
+def decode(bytes):
+    """Given a packet bytestring, yield Message objects.
+
+    We walk the packet once, by declared length, and we only instantiate a
+    Message when our consumer asks for the next one.
+
+    """
+    if bytes[:3] != FFFD:
+        yield Message.from_bytes(bytes)
+        return
+
+    try:
+        chars = bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        raise SyntaxError("This packet isn't UTF-8: %r." % bytes)
+
+    pos = 0
+    end = len(chars)
+    while pos < end:
+        if chars[pos] != UFFFD:
+            msg = "Expected a frame at character %d of this packet: %s"
+            raise SyntaxError(msg % (pos, bytes))
+
+        sep = chars.find(UFFFD, pos + 1)
+        if sep == -1:
+            msg = "There are an odd number of frames in this packet: %s"
+            raise SyntaxError(msg % bytes)
+
+        length = chars[pos+1:sep]
+        if not length.isdigit():
+            msg = "This packet has a bad frame length at character %d: %s"
+            raise SyntaxError(msg % (pos, bytes))
+
+        start = sep + 1
+        pos = start + int(length)
+        if pos > end:
+            msg = "This packet is shorter than its frames claim: %s"
+            raise SyntaxError(msg % bytes)
+
+        yield Message.from_bytes(chars[start:pos].encode('utf-8'))
 
 
 def frame(bytes):
+    """Given a message (or a bytestring), return a framed bytestring.
+    """
     bytes = str(bytes)
-    return "%s%d%s%s" % (FFFD, len(bytes), FFFD, bytes)
+    length = len(bytes.decode('utf-8', 'replace'))
+    return "%s%d%s%s" % (FFFD, length, FFFD, bytes)
+
+
+def encode(messages, max_bytes=0):
+    """Given an iterable of messages and maybe a budget, return a packet.
+
+    This is the inverse of decode. With max_bytes we stop taking messages once
+    the packet is that long, but always take at least one; that's for
+    aspen.sockets.buffer.unload, which hands us a buffer's messages lazily.
+
+    """
+    frames = []
+    nbytes = 0
+    for message in messages:
+        frames.append(frame(message))
+        nbytes += len(frames[-1])
+        if max_bytes and nbytes >= max_bytes:
+            break   # before we take the next one off of messages
+    return ''.join(frames)
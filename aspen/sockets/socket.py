@@ -1,5 +1,3 @@
-import uuid
-
 from aspen import json, resources, Response
 from aspen.sockets import HEARTBEAT, TIMEOUT, TRANSPORTS
 from aspen.sockets.message import Message
@@ -23,6 +21,7 @@ class Socket(object):
     def __init__(self, request, channel):
         """Takes the handshake request and the socket's channel.
         """
+        import uuid     # slow to import, and only needed here
         self.sid = uuid.uuid4().hex
         self.endpoint = request.line.uri.path.decoded
         self.resource = resources.get(request)
@@ -59,6 +58,17 @@ class Socket(object):
         if len(self.resource.pages) > 3:
             exec self.resource.pages[3] in self.context
         self.channel.remove(self)
+        self.website.socket_backend.release(self.sid)
+
+
+    def metrics(self):
+        """Return a dictionary of statistics about this socket's buffers.
+        """
+        return { 'sid': self.sid
+               , 'endpoint': self.endpoint
+               , 'incoming': self.incoming.metrics()
+               , 'outgoing': self.outgoing.metrics()
+                }
 
 
     # Client Side
@@ -81,7 +91,7 @@ class Socket(object):
         """
         self.__send(3, data)
 
-    def send_utf8(self):
+    def send_utf8(self, data):
         """Buffer a UTF-8 message to be sent to the client.
         """
         self.__send(3, data.encode('utf8'))
@@ -163,6 +173,8 @@ class Socket(object):
                 pass
             elif message.type in (3, 4, 5): # data message
                 self.incoming.put(message.data)
-                self.channel.incoming.put(message.data)
+                channel_incoming = self.channel.incoming
+                if channel_incoming is not None:    # someone subscribed
+                    channel_incoming.put(message.data)
             elif message.type in (6, 7, 8): # blah, blah, blah
                 pass
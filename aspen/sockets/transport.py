@@ -1,5 +1,3 @@
-import time
-
 from aspen import Response
 from aspen.sockets import TIMEOUT
 
@@ -34,14 +32,8 @@ class XHRPollingTransport(Transport):
             response = Response(200)
 
         elif request.line.method == 'GET':  # The client is asking for data.
-            bytes_iter = iter([""])
-            timeout = time.time() + self.timeout
-            while time.time() < timeout:
-                _bytes_iter = self.socket._recv()
-                if _bytes_iter is not None:
-                    bytes_iter = _bytes_iter
-                    break
-                request.website.network_engine.sleep(0.010)
+            engine = self.socket.website.network_engine
+            bytes_iter = engine.long_poll(self.socket, self.timeout)
             response = Response(200, bytes_iter)
 
         return response
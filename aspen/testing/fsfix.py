@@ -92,6 +92,8 @@ def teardown():
         del sys.modules['foo']
     import aspen.execution
     aspen.execution.clear_changes()
+    import aspen.logging
+    aspen.logging.buffer(0)
 
 teardown() # start clean
 
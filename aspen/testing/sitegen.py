@@ -0,0 +1,246 @@
+"""Generate large synthetic websites, and URL workloads to go with them.
+
+mk in aspen.testing.fsfix is for the small fixtures in tests. This is for
+finding out how dispatch, the resource cache, and autoindex behave on sites
+with many thousands of files, deep nesting, and lots of %wildcards:
+
+    urls = generate(www_root, fanout=10, depth=4, files=10)   # 111,110 files
+    save_workload(sample(urls, 10000), 'workload.txt')
+
+The site is a tree of directories, depth levels deep, each with fanout
+subdirectories and files files. The parameters are:
+
+    fanout      subdirectories per directory
+    depth       levels of subdirectories below www_root
+    files       files per directory
+    dynamic     the fraction of files that are simplates rather than static
+    wildcards   the chance that a directory has a wildcard subdirectory
+                (%w<level>, in place of one of its fanout) and, separately, a
+                wildcard simplate (%id.html)
+    indices     the chance that a directory has an index.html
+    page_size   roughly how many bytes of template are on each simplate's
+                last page; static files are about this size too
+    seed        for the random number generator, so sites are repeatable
+
+generate returns every URL the site has, as a list of (path, expected) tuples,
+where expected is what the request should dispatch to: the path of a file
+under www_root (like /d00/f001.css), or of a directory, ending in a slash,
+where we expect an autoindex (or a 404 without list_directories), or None
+where we expect a 404. There's one URL per file (going through wildcard
+directories with made-up values), one per directory, one per wildcard
+simplate, and one that's missing per directory where that's unambiguous.
+
+Workloads are saved one URL per line, tab-separated from what we expect, so
+other tools can replay them. aspen-load takes one with --workload. From the
+command line:
+
+    $ python -m aspen.testing.sitegen --depth=4 --workload=urls.txt www_root
+
+"""
+import optparse
+import os
+import random
+import sys
+
+
+DEFAULTS = { 'fanout': 4
+           , 'depth': 3
+           , 'files': 10
+           , 'dynamic': 0.3
+           , 'wildcards': 0.2
+           , 'indices': 0.5
+           , 'page_size': 1024
+           , 'seed': 0
+            }
+
+FILLER = "Greetings, program! "
+STATIC_EXTENSIONS = ['css', 'js']   # misses are .txt, wildcard leafs .html
+
+
+# Site
+# ====
+
+def simplate(page_size):
+    """Given a number of bytes, return a simplate with a template that long.
+    """
+    nfiller = max(page_size // len(FILLER), 1)
+    return ( "import random\n"
+             "\x0c\n"
+             "program = random.choice(['program'])\n"
+             "\x0c\n"
+             "<h1>{{ program }}</h1>\n"
+           + "<p>%s</p>\n" % (FILLER * nfiller)
+            )
+
+def static(page_size):
+    """Given a number of bytes, return about that much static content.
+    """
+    return "/* %s */\n" % (FILLER * max(page_size // len(FILLER), 1))
+
+def generate(www_root, **params):
+    """Given a directory path and parameters, build a site and list its URLs.
+
+    The directory must not exist yet. See the module docstring for the
+    parameters, and DEFAULTS for their defaults.
+
+    """
+    for name in params:
+        if name not in DEFAULTS:
+            raise TypeError("Unknown parameter: %s." % name)
+    p = DEFAULTS.copy()
+    p.update(params)
+    rand = random.Random(p['seed'])
+    pages = {'html': simplate(p['page_size'])}
+    for ext in STATIC_EXTENSIONS:
+        pages[ext] = static(p['page_size'])
+
+    urls = []
+    os.mkdir(www_root)
+
+    def write(fs, content):
+        open(os.path.join(www_root, *fs.split('/')), 'w+').write(content)
+
+    def build(fs, url, level):
+        """Fill the directory at fs, which the URL path url dispatches to.
+
+        fs and url are relative, and end in a slash unless they're empty.
+
+        """
+
+        # Decide what goes in here.
+        # =========================
+
+        nsubdirs = level < p['depth'] and p['fanout'] or 0
+        subdirs = ['d%02d' % i for i in range(nsubdirs)]
+        has_wild_dir = subdirs and rand.random() < p['wildcards']
+        if has_wild_dir:
+            subdirs[-1] = '%%w%d' % level
+        has_wild_leaf = rand.random() < p['wildcards']
+        has_index = rand.random() < p['indices']
+
+
+        # Files
+        # =====
+
+        for i in range(p['files']):
+            if rand.random() < p['dynamic']:
+                ext = 'html'
+            else:
+                ext = rand.choice(STATIC_EXTENSIONS)
+            name = 'f%03d.%s' % (i, ext)
+            write(fs + name, pages[ext])
+            urls.append(('/' + url + name, '/' + fs + name))
+
+        if has_wild_leaf:
+            write(fs + '%id.html', pages['html'])
+            value = 'v%d.html' % rand.randint(0, 99999)
+            urls.append(('/' + url + value, '/' + fs + '%id.html'))
+
+        if has_index:
+            write(fs + 'index.html', pages['html'])
+            urls.append(('/' + url, '/' + fs + 'index.html'))
+        else:
+            urls.append(('/' + url, '/' + fs))  # autoindex
+
+        if not has_wild_dir:
+            # With a wildcard directory here, a miss would dispatch to it.
+            urls.append(('/' + url + 'missing.txt', None))
+
+
+        # Subdirectories
+        # ==============
+
+        for name in subdirs:
+            os.mkdir(os.path.join(www_root, *(fs + name).split('/')))
+            value = name
+            if name.startswith('%'):
+                value = 'v%d' % rand.randint(0, 99999)
+            build(fs + name + '/', url + value + '/', level + 1)
+
+    build('', '', 0)
+    return urls
+
+
+# Workloads
+# =========
+
+def sample(urls, n, seed=0):
+    """Given a list of URLs from generate and a number, return a workload.
+
+    The workload is n URLs picked at random, with repeats.
+
+    """
+    rand = random.Random(seed)
+    return [rand.choice(urls) for i in xrange(n)]
+
+def save_workload(workload, filepath):
+    """Given a list of URLs from generate or sample and a path, write them.
+    """
+    fp = open(filepath, 'w+')
+    try:
+        for path, expected in workload:
+            if expected is None:
+                expected = '-'
+            fp.write("%s\t%s\n" % (path, expected))
+    finally:
+        fp.close()
+
+def load_workload(filepath):
+    """Given a path to a saved workload, return a list of URLs.
+    """
+    workload = []
+    for line in open(filepath):
+        path, expected = line.rstrip('\n').split('\t')
+        if expected == '-':
+            expected = None
+        workload.append((path, expected))
+    return workload
+
+
+# Command line
+# ============
+
+def main(argv=None):
+    """Generate a site from the command line. See the module docstring.
+    """
+    parser = optparse.OptionParser(usage="python -m aspen.testing.sitegen "
+                                         "[options] www_root")
+    for name in ('fanout', 'depth', 'files', 'page_size', 'seed'):
+        parser.add_option( "--" + name, type="int", default=DEFAULTS[name]
+                         , help="[%s]" % DEFAULTS[name]
+                          )
+    for name in ('dynamic', 'wildcards', 'indices'):
+        parser.add_option( "--" + name, type="float", default=DEFAULTS[name]
+                         , help="[%s]" % DEFAULTS[name]
+                          )
+    parser.add_option( "--workload", metavar="FILE"
+                     , help="write a workload of URLs to FILE"
+                      )
+    parser.add_option( "--requests", type="int", default=0
+                     , help=("how many URLs to sample for the workload, or 0 "
+                             "for every URL once [0]")
+                      )
+    opts, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Expected one www_root.")
+    www_root = args[0]
+    if os.path.exists(www_root):
+        parser.error("%s already exists." % www_root)
+
+    params = dict([(name, getattr(opts, name)) for name in DEFAULTS])
+    urls = generate(www_root, **params)
+    nfiles = len([1 for path, expected in urls
+                  if expected and not expected.endswith('/')])
+    print "Wrote %s with %d URLs (%d of them files)." % (www_root, len(urls),
+                                                          nfiles)
+    if opts.workload:
+        workload = urls
+        if opts.requests:
+            workload = sample(urls, opts.requests, opts.seed)
+        save_workload(workload, opts.workload)
+        print "Wrote %d URLs to %s." % (len(workload), opts.workload)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,433 @@
+"""Trace requests, and export the spans to a local file or a UDP socket.
+
+Set trace_export and every request gets a trace: a tree of spans, each timing
+one step of handling it. We record spans for:
+
+    request             the whole of handle_safely
+    hooks.<section>     each section of hooks (inbound_early, etc.)
+    dispatch            finding the file to serve
+    resource.load       reading and compiling a resource (cache misses only)
+    page.exec           running page two of a simplate
+    render              rendering a simplate's content page
+    response.write      sending the body, until the server closes it
+
+Add spans of your own in a simplate, say around a database call, with
+request.trace.span, as a context manager or by calling finish yourself:
+
+    with request.trace.span('db.query', table='users'):
+        users = db.all("SELECT * FROM users")
+
+    span = request.trace.span('db.query')
+    ...
+    span.finish()
+
+When tracing is off request.trace is NULL_TRACE, which records nothing, so
+simplates needn't check.
+
+Trace ids follow W3C Trace Context. If a request carries a traceparent header
+we join that trace, with its span as our root's parent, and we honor its
+sampled flag; otherwise we start a new trace, and sample trace_sample percent
+of them. The response's traceresponse header names our root span, and to carry
+the trace on to another service, send request.trace.traceparent() as its
+traceparent header.
+
+Spans are exported in batches, off the request path, one JSON object per line:
+
+    {"name": "dispatch", "trace_id": "4bf9...", "span_id": "00f0...",
+     "parent_id": "a3ce...", "start": 1319412793.52, "ms": 0.215,
+     "pid": 4321, "attributes": {"fs": "/srv/www/index.html"}}
+
+trace_export is either a file path, which we append to (workers can share
+one; each batch is a single write), or udp:host:port, where we send datagrams
+of at most MAX_DATAGRAM bytes, each a batch of whole lines. If spans come in
+faster than we can export them, we drop the oldest past MAXSIZE, and count
+them in Tracer.ndropped.
+
+"""
+import collections
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+import aspen
+
+
+BATCH = 256             # spans to buffer before waking the exporter
+FLUSH_SECONDS = 1.0     # how long a span may sit in the buffer
+MAXSIZE = 10000         # spans to buffer before dropping the oldest
+MAX_DATAGRAM = 8192     # bytes
+
+TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-'
+                         r'([0-9a-f]{2})$')
+ZEROS = re.compile(r'^0+$')
+
+
+def parse_traceparent(header):
+    """Given a traceparent header, return (trace_id, parent_id, sampled).
+
+    Return None if the header isn't one we understand.
+
+    """
+    match = TRACEPARENT.match(header.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == 'ff' or ZEROS.match(trace_id) or ZEROS.match(parent_id):
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+# Spans
+# =====
+
+class Span(object):
+    """Time one step of handling a request.
+    """
+
+    def __init__(self, trace, name, span_id, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Given keyword arguments, add them to our attributes.
+        """
+        self.attributes.update(attributes)
+
+    def finish(self):
+        """Stop the clock. Only the first call counts.
+        """
+        if self.end is None:
+            self.end = time.time()
+            self.trace.finished(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        if type is not None:
+            if hasattr(value, 'code'):  # a raised Response is routine
+                self.attributes['code'] = value.code
+            else:
+                self.error = type.__name__
+        self.finish()
+        return False
+
+    def record(self):
+        """Return a dictionary for export.
+        """
+        record = { 'name': self.name
+                 , 'trace_id': self.trace.trace_id
+                 , 'span_id': self.span_id
+                 , 'parent_id': self.parent_id
+                 , 'start': self.start
+                 , 'ms': round((self.end - self.start) * 1000, 3)
+                 , 'pid': aspen.logging.PID
+                  }
+        if self.attributes:
+            record['attributes'] = self.attributes
+        if self.error is not None:
+            record['error'] = self.error
+        return record
+
+
+class NullSpan(object):
+    """A span that records nothing.
+    """
+
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+
+# Traces
+# ======
+
+class Trace(object):
+    """Hold the open spans for one request.
+
+    Spans nest: a new span's parent is the innermost one still open.
+
+    """
+
+    def __init__(self, tracer, trace_id, parent_id=None, sampled=True):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.parent_id = parent_id      # the caller's span, if any
+        self.sampled = sampled
+        self.stack = []
+        self.root = None
+
+    def span(self, name, **attributes):
+        """Given a name and keyword arguments, start and return a span.
+        """
+        if not self.sampled:
+            return NULL_SPAN
+        if self.stack:
+            parent_id = self.stack[-1].span_id
+        elif self.root is not None:
+            parent_id = self.root.span_id
+        else:
+            parent_id = self.parent_id
+        span = Span(self, name, self.tracer.new_id(8), parent_id, attributes)
+        self.stack.append(span)
+        return span
+
+    def finished(self, span):
+        """Given a span that's done, take it off the stack and export it.
+        """
+        if self.stack and self.stack[-1] is span:
+            self.stack.pop()
+        elif span in self.stack:        # finished out of order
+            self.stack.remove(span)
+        self.tracer.export(span)
+
+    def current_id(self):
+        """Return the span_id of the innermost open span, or the root's.
+        """
+        if self.stack:
+            return self.stack[-1].span_id
+        if self.root is not None:
+            return self.root.span_id
+        return self.parent_id
+
+    def traceparent(self):
+        """Return a traceparent header value for a call to another service.
+        """
+        span_id = self.current_id() or self.tracer.new_id(8)
+        return "00-%s-%s-%02x" % (self.trace_id, span_id, int(self.sampled))
+
+    def start(self, request):
+        """Given a Request, open the root span.
+        """
+        path = request.line.uri.path.raw.decode('UTF-8', 'replace')
+        self.root = self.span( 'request'
+                             , method=request.line.method.raw
+                             , path=path
+                              )
+        if self.root is NULL_SPAN:
+            self.root = None
+
+    def finish(self, response):
+        """Given a Response, close the root span and tell the client about it.
+        """
+        if self.root is not None:
+            self.root.attributes['code'] = response.code
+            self.root.finish()
+        response.headers['traceresponse'] = self.traceparent()
+
+
+class NullTrace(object):
+    """A trace that records nothing. This is request.trace by default.
+    """
+
+    trace_id = None
+    sampled = False
+
+    def span(self, name, **attributes):
+        return NULL_SPAN
+
+    def traceparent(self):
+        return None
+
+    def finish(self, response):
+        pass
+
+NULL_TRACE = NullTrace()
+
+
+# Exporting
+# =========
+
+class Tracer(object):
+    """Start traces, and export their spans in batches, on a thread of ours.
+    """
+
+    def __init__(self, target, sample=100):
+        """Takes a file path or udp:host:port, and a percentage.
+        """
+        self.target = target
+        self.sample = sample
+        self.spans = collections.deque()
+        self.lock = threading.Condition()
+        self.flushing = threading.Lock()    # keep batches in order
+        self.stopping = False
+        self.thread = None      # started with the first span; see begin
+        self.rand = None
+        self.sock = None
+        self.address = None
+        self.ndropped = 0
+        self.nexported = 0
+        self.nerrors = 0
+        if target.startswith('udp:'):
+            host, port = target[len('udp:'):].rsplit(':', 1)
+            self.address = (host, int(port))
+
+    def begin(self):
+        """Seed our ids and start our thread.
+
+        We wait for the first request to do this, so that each worker from
+        aspen.prefork gets its own thread, and ids that don't collide.
+
+        """
+        self.lock.acquire()
+        try:
+            if self.thread is None:
+                self.rand = random.Random()
+                self.thread = threading.Thread(target=self.run)
+                self.thread.setDaemon(True)
+                self.thread.start()
+        finally:
+            self.lock.release()
+
+    def new_id(self, nbytes):
+        """Given a number of bytes, return a random id in hex.
+        """
+        return '%0*x' % (nbytes * 2, self.rand.getrandbits(nbytes * 8))
+
+    def start(self, request):
+        """Given a Request, set request.trace to a new Trace.
+        """
+        if self.thread is None:
+            self.begin()
+        incoming = request.headers.get('traceparent')
+        if incoming is not None:
+            incoming = parse_traceparent(incoming)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = self.new_id(16), None
+            sampled = self.sample >= 100 or \
+                      self.rand.random() * 100 < self.sample
+        request.trace = Trace(self, trace_id, parent_id, sampled)
+        request.trace.start(request)
+
+    def export(self, span):
+        """Given a finished span, buffer it for export.
+        """
+        self.lock.acquire()
+        try:
+            if len(self.spans) >= MAXSIZE:
+                self.spans.popleft()
+                self.ndropped += 1
+            self.spans.append(span)
+            if len(self.spans) >= BATCH:
+                self.lock.notifyAll()
+        finally:
+            self.lock.release()
+
+    def run(self):
+        """Export batches of spans until stopped. This is our thread.
+        """
+        try:
+            while not self.stopping:
+                self.lock.acquire()
+                try:
+                    if len(self.spans) < BATCH:
+                        self.lock.wait(FLUSH_SECONDS)
+                finally:
+                    self.lock.release()
+                self.flush()
+        except:
+            if time is not None:    # at exit, module globals are set to None
+                raise
+
+    def flush(self):
+        """Export everything that's buffered, in one go.
+        """
+        self.flushing.acquire()
+        try:
+            self.lock.acquire()
+            try:
+                spans = list(self.spans)
+                self.spans.clear()
+            finally:
+                self.lock.release()
+            if not spans:
+                return
+            dumps = lambda span: aspen.json.dumps( span.record()
+                                                 , sort_keys=True
+                                                  )
+            lines = []
+            for span in spans:
+                try:
+                    lines.append(dumps(span))
+                except (TypeError, ValueError):     # an odd attribute
+                    span.attributes = {'unserializable': True}
+                    lines.append(dumps(span))
+            try:
+                if self.address is None:
+                    self.write(lines)
+                else:
+                    self.send(lines)
+            except EnvironmentError:
+                self.nerrors += 1
+                if self.nerrors == 1:   # don't flood the log
+                    aspen.log_dammit("Couldn't export spans to %s: %s"
+                                     % (self.target, sys.exc_info()[1]))
+            else:
+                self.nexported += len(lines)
+        finally:
+            self.flushing.release()
+
+    def write(self, lines):
+        """Given a list of JSON lines, append them to our file.
+        """
+        fd = os.open(self.target, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0644)
+        try:
+            os.write(fd, '\n'.join(lines) + '\n')
+        finally:
+            os.close(fd)
+
+    def send(self, lines):
+        """Given a list of JSON lines, send them as datagrams.
+        """
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        datagram = []
+        size = 0
+        for line in lines:
+            if datagram and size + len(line) + 1 > MAX_DATAGRAM:
+                self.sock.sendto('\n'.join(datagram) + '\n', self.address)
+                datagram = []
+                size = 0
+            datagram.append(line)
+            size += len(line) + 1
+        if datagram:
+            self.sock.sendto('\n'.join(datagram) + '\n', self.address)
+
+    def stop(self):
+        """Export what's buffered, and stop our thread.
+        """
+        self.lock.acquire()
+        try:
+            self.stopping = True
+            self.lock.notifyAll()
+        finally:
+            self.lock.release()
+        thread = self.thread
+        if thread is not None and thread is not threading.currentThread():
+            thread.join()
+        self.flush()
@@ -2,7 +2,7 @@ import math
 import codecs
 import datetime
 import re
-from email import utils as email_utils
+import threading
 import time
 
 # Register a 'repr' error strategy.
@@ -193,6 +193,7 @@ def to_rfc822(dt):
     honors the locale and could generated non-English names.
 
     """
+    from email import utils as email_utils  # slow to import
     return email_utils.formatdate(time.mktime(dt.timetuple())).decode('US-ASCII')
 
 
@@ -333,6 +334,140 @@ def Canonizer(expected):
     return canonize
 
 
+# Timing
+# ======
+
+class Stopwatch(object):
+    """Time a sequence of phases, such as starting up.
+
+        >>> watch = Stopwatch()
+        >>> watch.lap('foo')
+        >>> [name for name, seconds in watch.laps]
+        ['foo']
+
+    """
+
+    def __init__(self):
+        self.started = self.last = time.time()
+        self.laps = []  # (name, seconds)
+
+    def lap(self, name):
+        """Given a name, record the time since the last lap under it.
+        """
+        now = time.time()
+        self.laps.append((name, now - self.last))
+        self.last = now
+
+    def __str__(self):
+        total = (self.last - self.started) * 1000
+        laps = ["%s %.1f ms" % (name, seconds * 1000)
+                for name, seconds in self.laps]
+        return "%.1f ms (%s)" % (total, ', '.join(laps))
+
+
+# Caching
+# =======
+
+class LRU(object):
+    """Map keys to values, forgetting the least recently used past maxsize.
+
+        >>> cache = LRU(2)
+        >>> cache['foo'] = 1
+        >>> cache['bar'] = 2
+        >>> cache.get('foo')
+        1
+        >>> cache['baz'] = 3
+        >>> cache.get('bar') is None
+        True
+
+    A maxsize of 0 means we don't remember anything. This is safe to use from
+    several threads.
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.links = {}         # key -> [prev, next, key, value]
+        self.root = []          # the ends of a circular, doubly linked list
+        self.root[:] = [self.root, self.root, None, None]
+        self.nhits = 0          # since we started [int]
+        self.nmisses = 0        # since we started [int]
+
+    def __len__(self):
+        return len(self.links)
+
+    def __contains__(self, key):
+        return key in self.links
+
+    def get(self, key, default=None):
+        """Given a key, return its value and mark it used, or return default.
+        """
+        self.lock.acquire()
+        try:
+            link = self.links.get(key)
+            if link is None:
+                self.nmisses += 1
+                return default
+            self.nhits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def __setitem__(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.lock.acquire()
+        try:
+            link = self.links.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[3] = value
+            else:
+                link = [None, None, key, value]
+                self.links[key] = link
+                if len(self.links) > self.maxsize:
+                    oldest = self.root[1]
+                    self._unlink(oldest)
+                    del self.links[oldest[2]]
+            self._append(link)
+        finally:
+            self.lock.release()
+
+    def pop(self, key, default=None):
+        """Given a key, forget it and return its value, or return default.
+        """
+        self.lock.acquire()
+        try:
+            link = self.links.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            return link[3]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.links.clear()
+            self.root[:] = [self.root, self.root, None, None]
+        finally:
+            self.lock.release()
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
+
+    def _append(self, link):
+        last = self.root[0]
+        link[0], link[1] = last, self.root
+        last[1] = self.root[0] = link
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
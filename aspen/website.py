@@ -1,18 +1,22 @@
-import datetime
+from __future__ import with_statement # for Python 2.5
+
 import os
 import sys
+import time
 import traceback
 from os.path import join, isfile
 
 import aspen
 from aspen import dispatcher, resources, sockets
+from aspen.coroutines import Coroutine, Suspension, generate, is_coroutine
 from aspen.http.request import Request
 from aspen.http.response import Response
 from aspen.configuration import Configurable
-from aspen.utils import to_rfc822, utc
 
-# 2006-11-17 was the first release of aspen - v0.3
-THE_PAST = to_rfc822(datetime.datetime(2006, 11, 17, tzinfo=utc))
+# 2006-11-17 was the first release of aspen - v0.3. This is
+# to_rfc822(datetime.datetime(2006, 11, 17, tzinfo=utc)), spelled out to save
+# importing email.utils at startup.
+THE_PAST = u'Fri, 17 Nov 2006 00:00:00 -0000'
 
 
 class Website(Configurable):
@@ -24,16 +28,49 @@ class Website(Configurable):
 
     """
 
+    nrequests = 0   # served, for max_requests; see aspen.execution
+
     def __init__(self, argv=None):
         """Takes an argv list, without the initial executable name.
         """
+        self.found_files = {}   # filename -> filepath or None; see below
         self.configure(argv)
 
     def __call__(self, environ, start_response):
         """WSGI interface.
         """
+        self.nrequests += 1
         request = Request.from_wsgi(environ) # too big to fail :-/
-        response = self.handle_safely(request)
+        try:
+            leave = self.admission.enter(request)   # see aspen/admission.py
+        except Response, response:
+            response.request = request
+            self.log_access(request, response)
+            if self.metrics is not None:
+                self.metrics.observe(request, response)
+            return response(environ, start_response)
+        try:
+            response = self.handle_safely(request)
+        except:
+            leave()
+            raise
+
+        if isinstance(response, Suspension):
+            # An evented network engine suspended the request while page two
+            # of a coroutine simplate waits. It'll call resume when it's done.
+            suspension = response
+            def resume():
+                finish = lambda request: suspension.finish()
+                try:
+                    response = self.handle_safely(request, finish)
+                finally:
+                    leave()
+                response.request = request
+                return response(environ, start_response)
+            suspension.resume = resume
+            return suspension
+
+        leave()
         response.request = request # Stick this on here at the last minute
                                    # in order to support close hooks.
         return response(environ, start_response)
@@ -41,12 +78,16 @@ class Website(Configurable):
     def start(self):
         aspen.log_dammit("Starting up Aspen website.")
         self.hooks.startup.run(self)
+        for hook in self.hooks.values():    # see aspen.hooks
+            hook.compile()
         self.network_engine.start()
 
     def stop(self):
         aspen.log_dammit("Shutting down Aspen website.")
         self.hooks.shutdown.run(self)
         self.network_engine.stop()
+        if self.tracer is not None:
+            self.tracer.stop()
 
     def handler(self, request):
         """Given an Aspen request, return an Aspen response.
@@ -82,21 +123,46 @@ class Website(Configurable):
     def run_inbound(self, request):
         """Factored out to support testing.
         """
-        self.hooks.inbound_early.run(request)
+        trace = request.trace   # see aspen.tracing
+        with trace.span('hooks.inbound_early'):
+            self.hooks.inbound_early.run(request)
         self.check_auth(request)
-        dispatcher.dispatch(request)  # sets request.fs
+        with trace.span('dispatch') as span:
+            dispatcher.dispatch(request)  # sets request.fs
+            span.set(fs=request.fs)
         request.socket = sockets.get(request)
-        self.hooks.inbound_late.run(request)
+        with trace.span('hooks.inbound_late'):
+            self.hooks.inbound_late.run(request)
 
 
-    def handle_safely(self, request):
-        """Given an Aspen request, return an Aspen response.
+    def handle_safely(self, request, handler=None):
+        """Given an Aspen request and maybe a handler, return a response.
+
+        If the network engine suspends the request (see aspen.coroutines) we
+        return the Suspension, and we're called again with its finish method.
+
         """
+        if handler is None:
+            handler = self.handler
+            if self.request_budget_ms:  # see aspen.deadlines
+                self.overseer.stamp(request, self.request_budget_ms)
+            if self.slow_request_ms:
+                self.overseer.track(request)
+            if self.profiler is not None:   # see aspen.profiling
+                self.profiler.check(request)
+            if self.metrics is not None:    # see aspen.metrics
+                if request.line.uri.path.raw == self.metrics_path:
+                    handler = self.metrics.respond
+            if self.tracer is not None:     # see aspen.tracing
+                self.tracer.start(request)
         try:
             try:
                 #self.copy_configuration_to(request)
                 request.website = self
-                response = self.handler(request)
+                if request.profile is None:
+                    response = handler(request)
+                else:
+                    response = request.profile.runcall(handler, request)
             except:
                 response = self.handle_error_nicely(request)
         except Response, response:
@@ -104,31 +170,62 @@ class Website(Configurable):
             # case where it was returned, response is set in a try block above.
             pass
         else:
+            if isinstance(response, Suspension):
+                return response     # outbound hooks will run on resume
             # If the response object is coming from handle_error via except
             # Response, then it already has request on it and the early hooks
             # have already been run. If it fell off the edge un-exceptionally,
             # we need to take care of those two things.
             response.request = request
-            self.hooks.outbound_early.run(response)
+            with request.trace.span('hooks.outbound_early'):
+                self.hooks.outbound_early.run(response)
 
-        self.hooks.outbound_late.run(response)
-        self.dont_cache_authed(request, response)
-        self.log_access(request, response) # TODO is this at the right level?
+        try:
+            with request.trace.span('hooks.outbound_late'):
+                self.hooks.outbound_late.run(response)
+            self.dont_cache_authed(request, response)
+            if request.profile is not None:
+                self.profiler.finish(request, response)
+            request.trace.finish(response)
+            self.log_access(request, response) # TODO is this the right level?
+            if self.metrics is not None:
+                self.metrics.observe(request, response)
+        finally:
+            # Even if a hook blows up, or the overseer reports us forever.
+            if request.deadline is not None or self.slow_request_ms:
+                self.overseer.unwatch(request)
         return response
 
     def handle_error_nicely(self, request):
         """Try to provide some nice error handling.
+
+        Raised Responses are common (every 404, redirect, and 401), so they're
+        cheap: we only format a traceback for other exceptions, and for codes
+        in plain_errors we skip the error simplate and send a plain-text body.
+
         """
         try:                        # nice error messages
-            tb_1 = traceback.format_exc()
             response = sys.exc_info()[1]
             if not isinstance(response, Response):
+                tb_1 = traceback.format_exc()
                 aspen.log_dammit(tb_1)
-                response = Response(500, tb_1)
-            elif 200 <= response.code < 300:
-                return response
+                response = Response(500)
+                if self.show_tracebacks:
+                    response.body = tb_1
+                else:
+                    response.body = str(response)
+            else:
+                tb_1 = "%s raised" % response
+                if 200 <= response.code < 300:
+                    return response
             response.request = request
-            self.hooks.outbound_early.run(response)
+            with request.trace.span('hooks.outbound_early'):
+                self.hooks.outbound_early.run(response)
+            if response.code in self.plain_errors:
+                if not response.body:
+                    response.body = str(response)
+                    response.headers['Content-Type'] = 'text/plain'
+                return response
             fs = self.ours_or_theirs(str(response.code) + '.html')
             if fs is None:
                 fs = self.ours_or_theirs('error.html')
@@ -159,17 +256,28 @@ class Website(Configurable):
 
     def ours_or_theirs(self, filename):
         """Given a filename, return a filepath or None.
+
+        We remember the answer, unless changes_reload is set, so add a new
+        error page to project_root before starting up, or restart.
+
         """
+        if filename in self.found_files:
+            return self.found_files[filename]
+
+        fs = None
         if self.project_root is not None:
             theirs = join(self.project_root, filename)
             if isfile(theirs):
-                return theirs
+                fs = theirs
 
-        ours = self.find_ours(filename)
-        if isfile(ours):
-            return ours
+        if fs is None:
+            ours = self.find_ours(filename)
+            if isfile(ours):
+                fs = ours
 
-        return None
+        if not self.changes_reload:
+            self.found_files[filename] = fs
+        return fs
 
     def check_auth(self, request):
         """Raise 401 if there's no authenticated user.
@@ -191,11 +299,13 @@ class Website(Configurable):
             response.headers['Expires'] = THE_PAST  # don't cache
 
     def log_access(self, request, response):
-        """Log access. With our own format (not Apache's).
+        """Log access. With our own format (not Apache's), or as JSON.
         """
 
         if self.logging_threshold > 0: # short-circuit
             return
+        if aspen.logging.LOGGING_THRESHOLD > 0:
+            return
 
 
         # What was the URL path translated to?
@@ -208,27 +318,38 @@ class Website(Configurable):
                 fs = '.'+fs
         else:
             fs = '...' + fs[-21:]
-        msg = "%-24s %s" % (request.line.uri.path.raw, fs)
 
 
-        # Where was response raised from?
-        # ===============================
+        # How long did it take, and how big is it?
+        # ========================================
+        # We don't know the size of a streamed body until it's sent.
 
-        tb = sys.exc_info()[2]
-        if tb is not None:
-            while tb.tb_next is not None:
-                tb = tb.tb_next
-            frame = tb.tb_frame
-            filename = tb.tb_frame.f_code.co_filename.split(os.sep)[-1]
-            response = "%s (%s:%d)" % (response, filename, frame.f_lineno)
-        else:
-            response = str(response)
+        ms = (time.time() - request.started) * 1000
+        size = None
+        if isinstance(response.body, str):
+            size = len(response.body)
 
 
         # Log it.
         # =======
 
-        aspen.log("%-36s %s" % (response, msg))
+        if self.logging_access_format == 'json':
+            path = request.line.uri.path.raw.decode('UTF-8', 'replace')
+            line = aspen.json.dumps({ 'time': request.started
+                                    , 'pid': aspen.logging.PID
+                                    , 'method': request.line.method.raw
+                                    , 'path': path
+                                    , 'fs': fs.decode('UTF-8', 'replace')
+                                    , 'status': response.code
+                                    , 'bytes': size
+                                    , 'ms': round(ms, 3)
+                                     }, sort_keys=True)
+            aspen.logging.write([line])
+        else:
+            if size is None:
+                size = '-'
+            msg = "%-24s %s" % (request.line.uri.path.raw, fs)
+            aspen.log("%-24s %8s %8.1f ms  %s" % (response, size, ms, msg))
 
 
     # Conveniences for testing
@@ -265,5 +386,8 @@ class Website(Configurable):
         if response is None:
             response = Response(charset=self.charset_dynamic)
         context = resource.populate_context(request, response)
-        exec resource.pages[1] in context  # let's let exceptions raise
+        if is_coroutine(resource.pages[1]):
+            Coroutine(generate(resource.pages[1], context)).run()
+        else:
+            exec resource.pages[1] in context  # let's let exceptions raise
         return response, context
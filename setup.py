@@ -27,6 +27,9 @@ setup( author = 'Chad Whitacre'
      , description = ('Aspen is a Python web framework. '
                       'Simplates are the main attraction.')
      , entry_points = { 'console_scripts': [ 'aspen = aspen.server:main'
+                                           , 'aspen-broker = aspen.sockets.broker:main'
+                                           , 'aspen-bench = aspen.bench:main'
+                                           , 'aspen-load = aspen.bench.engines:main'
                                            , 'thrash = thrash:main'
                                            , 'swaddle = swaddle:main'
                                            , 'fcgi_aspen = fcgi_aspen:main'
@@ -0,0 +1,161 @@
+import threading
+import time
+
+from aspen import Response
+from aspen.admission import Admission
+from aspen.configuration import ConfigurationError
+from aspen.testing import assert_raises, StubRequest, StubWSGIRequest
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+from aspen.website import Website
+
+
+def Gate(*argv, **kw):
+    website = Website(list(argv))
+    return Admission(website, **kw)
+
+def shed(gate, path='/'):
+    try:
+        gate.enter(StubRequest(path))
+    except Response, response:
+        return response
+    raise AssertionError("request wasn't shed")
+
+
+# Configuration
+# =============
+
+def test_website_has_an_admission_gate():
+    website = Website([])
+    assert isinstance(website.admission, Admission)
+
+def test_admission_limit_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--admission_limit', '-1'])
+
+def test_admission_queue_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--admission_queue', '-1'])
+
+def test_admission_wait_ms_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--admission_wait_ms', '-1'])
+
+def test_evented_engines_cant_wait():
+    website = Website(['--network_engine', 'asyncore'])
+    assert not website.admission.can_wait
+
+
+# Admission
+# =========
+
+def test_no_limit_admits_everything():
+    gate = Gate()
+    leaves = [gate.enter(StubRequest()) for i in range(100)]
+    expected = 100
+    actual = gate.in_flight
+    assert actual == expected, actual
+    for leave in leaves:
+        leave()
+    expected = 0
+    actual = gate.in_flight
+    assert actual == expected, actual
+
+def test_full_gate_with_no_queue_sheds_with_503():
+    gate = Gate('--admission_limit', '1', '--admission_queue', '0')
+    gate.enter(StubRequest())
+    expected = 503
+    actual = shed(gate).code
+    assert actual == expected, actual
+
+def test_shed_response_has_retry_after():
+    gate = Gate( '--admission_limit', '1', '--admission_queue', '0'
+               , '--admission_wait_ms', '2500'
+                )
+    gate.enter(StubRequest())
+    expected = '3'
+    actual = shed(gate).headers['Retry-After']
+    assert actual == expected, actual
+
+def test_waiting_request_is_shed_when_its_time_is_up():
+    gate = Gate('--admission_limit', '1', '--admission_wait_ms', '50')
+    gate.enter(StubRequest())
+    start = time.time()
+    response = shed(gate)
+    elapsed = time.time() - start
+    assert response.code == 503, response.code
+    assert 0.05 <= elapsed < 1, elapsed
+
+def test_waiting_request_is_admitted_when_a_slot_frees_up():
+    gate = Gate('--admission_limit', '1', '--admission_wait_ms', '5000')
+    leave = gate.enter(StubRequest())
+    timer = threading.Timer(0.1, leave)
+    timer.start()
+    gate.enter(StubRequest())
+    timer.join()
+    expected = (1, 0, 2, 0)
+    actual = (gate.in_flight, gate.queued, gate.nadmitted, gate.nshed)
+    assert actual == expected, actual
+
+def test_evented_gate_sheds_instead_of_waiting():
+    gate = Gate('--admission_limit', '1', can_wait=False)
+    gate.enter(StubRequest())
+    start = time.time()
+    shed(gate)
+    elapsed = time.time() - start
+    assert elapsed < 0.5, elapsed
+
+def test_exempt_paths_skip_the_gate():
+    gate = Gate( '--admission_limit', '1', '--admission_queue', '0'
+               , '--admission_exempt', '/health,/static/'
+                )
+    gate.enter(StubRequest('/foo'))
+    gate.enter(StubRequest('/health'))
+    gate.enter(StubRequest('/static/app.js'))
+    expected = 1
+    actual = gate.in_flight
+    assert actual == expected, actual
+    shed(gate, '/static')
+
+def test_metrics_reports_gauges_and_counts():
+    gate = Gate('--admission_limit', '1', '--admission_queue', '0')
+    gate.enter(StubRequest())
+    shed(gate)
+    expected = { 'in_flight': 1
+               , 'queued': 0
+               , 'limit': 1
+               , 'admitted': 1
+               , 'shed': 1
+                }
+    actual = gate.metrics()
+    assert actual == expected, actual
+
+
+# Website
+# =======
+
+def call(website, path='/'):
+    started = []
+    start_response = lambda status, headers: started.append(status)
+    body = ''.join(website(StubWSGIRequest(path), start_response))
+    return started[0], body
+
+def test_website_sheds_requests_it_cant_admit():
+    mk(('index.html', "Greetings, program!"))
+    website = Website([ '--www_root', FSFIX, '--admission_limit', '1'
+                      , '--admission_queue', '0'
+                       ])
+    website.admission.enter(StubRequest())
+    expected = '503 Service Unavailable'
+    actual = call(website)[0]
+    assert actual == expected, actual
+
+def test_website_frees_the_slot_when_its_done():
+    mk(('index.html', "Greetings, program!"))
+    website = Website(['--www_root', FSFIX, '--admission_limit', '1'])
+    call(website)
+    expected = ('200 OK', 'Greetings, program!')
+    actual = call(website)
+    assert actual == expected, actual
+    expected = 0
+    actual = website.admission.in_flight
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
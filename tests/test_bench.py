@@ -0,0 +1,102 @@
+from StringIO import StringIO
+
+from aspen import bench
+from aspen.bench import engines
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown
+
+
+def test_measure_reports_throughput_and_percentiles():
+    result = bench.measure(lambda: None, 0.01)
+    expected = ['batch', 'ops', 'p50', 'p90', 'p99', 'samples']
+    actual = sorted(result)
+    assert actual == expected, actual
+    assert result['p50'] <= result['p90'] <= result['p99'], result
+
+def test_percentile_picks_the_nearest_rank():
+    samples = range(101)
+    expected = (0, 50, 99, 100)
+    actual = tuple([bench.percentile(samples, p) for p in (0, 50, 99, 100)])
+    assert actual == expected, actual
+
+def test_run_runs_benchmarks_by_name():
+    results = bench.run(['dispatch.deep.cached'], 0.01, StringIO())
+    expected = ['dispatch.deep.cached']
+    actual = results.keys()
+    assert actual == expected, actual
+
+def test_run_skips_benchmarks_that_cant_run_here():
+    def setup():
+        raise bench.Skip("no can do")
+    bench.BENCHMARKS.append(('test.skip', setup))
+    out = StringIO()
+    try:
+        results = bench.run(['test.skip'], 0.01, out)
+    finally:
+        bench.BENCHMARKS.pop()
+    assert results == {}, results
+    assert "skipped: no can do" in out.getvalue(), out.getvalue()
+
+def test_compare_flags_regressions_past_the_tolerance():
+    baseline = {'foo': {'ops': 1000.0}, 'bar': {'ops': 1000.0}}
+    results = {'foo': {'ops': 950.0}, 'bar': {'ops': 850.0}}
+    expected = ['bar']
+    actual = bench.compare(baseline, results, 10, StringIO())
+    assert actual == expected, actual
+
+def test_baselines_round_trip():
+    import os, tempfile
+    fd, filepath = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        bench.save({'foo': {'ops': 1000.0}}, filepath)
+        expected = {'foo': {'ops': 1000.0}}
+        actual = bench.load(filepath)
+    finally:
+        os.remove(filepath)
+    assert actual == expected, actual
+
+
+# Load
+# ====
+
+class Options(object):
+    concurrency = 2
+    seconds = 0.2
+    warmup = 0
+    no_keep_alive = False
+    sockets = 1
+    socket_interval = 0.05
+
+def test_parse_mix_repeats_paths_by_weight():
+    expected = ['/static.css', '/static.css', '/foo.html']
+    actual = engines.parse_mix('static:2,/foo.html')
+    assert actual == expected, actual
+
+def test_parse_mix_rejects_unknown_kinds():
+    assert_raises(ValueError, engines.parse_mix, 'static,blah:2')
+
+def test_drive_reports_on_an_engine():
+    www_root = engines.make_site()
+    try:
+        result = engines.drive('cheroot', www_root, ['/static.css'], Options())
+    finally:
+        import shutil
+        shutil.rmtree(www_root)
+    assert result['requests'] > 0, result
+    assert result['statuses'].keys() == [200], result
+    assert result['p50'] <= result['p99'], result
+    assert 'sockets' in result, result
+
+def test_drive_skips_engines_that_dont_start():
+    www_root = engines.make_site()
+    try:
+        assert_raises( engines.Failed, engines.drive, 'cheroot', www_root
+                     , ['/'], Options(), ['--max_rss', 'not a number']
+                      )
+    finally:
+        import shutil
+        shutil.rmtree(www_root)
+
+
+attach_teardown(globals())
@@ -1,5 +1,7 @@
 import os
 import socket
+import subprocess
+import sys
 
 import aspen
 from aspen.configuration import Configurable, ConfigurationError, parse
@@ -232,4 +234,87 @@ def test_parse_network_address_with_port_too_high():
     actual = assert_raises(ValueError, parse.network_address, u':65536').args[0]
     assert actual == "invalid port (out of range)", actual
 
+
+# Version
+# =======
+
+def test_version_is_looked_up_when_asked_for():
+    expected = aspen.get_version()
+    actual = aspen.__version__
+    assert actual == expected, actual
+
+def test_importing_aspen_doesnt_import_pkg_resources():
+    script = "import sys, aspen; print 'pkg_resources' in sys.modules"
+    process = subprocess.Popen( [sys.executable, '-c', script]
+                              , stdout=subprocess.PIPE
+                               )
+    expected = "False"
+    actual = process.communicate()[0].strip()
+    assert actual == expected, actual
+
+
+# Renderer factories
+# ==================
+
+def test_only_the_default_renderer_is_imported_up_front():
+    website = Configurable.from_argv([])
+    expected = [website.renderer_default]
+    actual = dict.keys(website.renderer_factories)
+    assert actual == expected, actual
+
+def test_renderer_is_imported_on_first_use():
+    website = Configurable.from_argv([])
+    website.renderer_factories['stdlib_format']
+    expected = sorted([website.renderer_default, 'stdlib_format'])
+    actual = sorted(dict.keys(website.renderer_factories))
+    assert actual == expected, actual
+
+def test_missing_default_renderer_fails_fast():
+    aspen_RENDERERS = aspen.RENDERERS
+    aspen.RENDERERS = list(aspen_RENDERERS) + ['nonexistent']
+    excepthook = sys.excepthook
+    sys.excepthook = lambda *a: None
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lambda *a: None
+    try:
+        assert_raises( ImportError
+                     , Configurable.from_argv, ['--renderer_default'
+                                               , 'nonexistent'
+                                                ]
+                      )
+    finally:
+        aspen.RENDERERS = aspen_RENDERERS
+        sys.excepthook = excepthook
+        aspen.log_dammit = log_dammit
+
+def test_missing_third_party_library_shows_up_as_an_import_error():
+    website = Configurable.from_argv([])
+    factories = website.renderer_factories
+    aspen_RENDERERS = aspen.RENDERERS
+    aspen.RENDERERS = list(aspen_RENDERERS) + ['nonexistent']
+    try:
+        actual = factories['nonexistent']
+    finally:
+        aspen.RENDERERS = aspen_RENDERERS
+    assert isinstance(actual, ImportError), actual
+
+def test_unknown_renderer_is_a_key_error():
+    website = Configurable.from_argv([])
+    assert_raises(KeyError, lambda: website.renderer_factories['floober'])
+    assert website.renderer_factories.get('floober') is None
+
+def test_keys_imports_all_renderers():
+    website = Configurable.from_argv([])
+    expected = sorted(aspen.RENDERERS)
+    actual = sorted(website.renderer_factories.keys())
+    assert actual == expected, actual
+
+def test_configure_times_startup():
+    website = Configurable.from_argv([])
+    expected = [ 'options', 'mimetypes', 'engine', 'settings'
+               , 'configuration scripts'
+                ]
+    actual = [name for name, seconds in website.startup.laps]
+    assert actual == expected, actual
+
 attach_teardown(globals())
@@ -0,0 +1,128 @@
+import sys
+import traceback
+
+from aspen.coroutines import Coroutine, Future, compile_page_two, generate
+from aspen.coroutines import is_coroutine, resolved
+from aspen.testing import assert_raises, handle
+from aspen.resources.socket_resource import SocketResource
+from aspen.testing.fsfix import attach_teardown, mk
+from aspen.website import Website
+
+
+# compile_page_two
+# ================
+
+def test_page_two_without_yield_is_not_a_coroutine():
+    code = compile_page_two("foo = 'bar'", 'foo.html')
+    expected = False
+    actual = is_coroutine(code)
+    assert actual == expected, actual
+
+def test_page_two_with_yield_is_a_coroutine():
+    code = compile_page_two("foo = yield None", 'foo.html')
+    expected = True
+    actual = is_coroutine(code)
+    assert actual == expected, actual
+
+def test_coroutine_page_two_binds_names_in_context():
+    code = compile_page_two( "import os.path\n"
+                             "foo = yield None\n"
+                             "for i in range(3): pass\n"
+                             "def bar(): baz = 1\n"
+                           , 'foo.html'
+                            )
+    context = {}
+    Coroutine(generate(code, context)).run()
+    expected = ['bar', 'foo', 'i', 'os']
+    actual = sorted(k for k in context if k != '__builtins__')
+    assert actual == expected, actual
+
+def test_coroutine_page_two_keeps_line_numbers():
+    code = compile_page_two("\n\nyield None\nraise heck", 'foo.html')
+    coroutine = Coroutine(generate(code, {}))
+    coroutine.start()
+    try:
+        coroutine.result()
+    except NameError:
+        tb = traceback.extract_tb(sys.exc_info()[2])
+    expected = ('foo.html', 4)
+    actual = tb[-1][:2]
+    assert actual == expected, actual
+
+
+# Coroutine
+# =========
+
+def test_coroutine_sends_results_of_yielded_futures():
+    def gen():
+        a = yield resolved(1)
+        b = yield resolved(2)
+        results.append(a + b)
+    results = []
+    Coroutine(gen()).run()
+    expected = [3]
+    actual = results
+    assert actual == expected, actual
+
+def test_coroutine_waits_for_futures_that_are_not_done():
+    future = Future()
+    def gen():
+        results.append((yield future))
+    results = []
+    coroutine = Coroutine(gen())
+    coroutine.start()
+    assert not coroutine.done
+    future.set_result('Greetings, program!')
+    expected = ['Greetings, program!']
+    actual = results
+    assert actual == expected, actual
+
+def test_coroutine_throws_exceptions_into_page_two():
+    def gen():
+        try:
+            yield None
+            yield 'foo'
+        except TypeError:
+            results.append(True)
+    results = []
+    Coroutine(gen()).run()
+    expected = [True]
+    actual = results
+    assert actual == expected, actual
+
+def test_coroutine_raises_what_page_two_raises():
+    def gen():
+        yield None
+        raise ZeroDivisionError
+    assert_raises(ZeroDivisionError, Coroutine(gen()).run)
+
+
+# Website
+# =======
+
+def test_threaded_engine_runs_coroutine_page_two_to_completion():
+    mk(('index.html', "engine = website.network_engine\n"
+                      "foo = yield engine.pause(0)\n"
+                      "bar = yield engine.defer(str, 'Greetings, program!')"
+                      "^L{{ bar }}"))
+    expected = 'Greetings, program!'
+    actual = handle().body
+    assert actual == expected, actual
+
+def test_responses_raised_from_coroutine_page_two_are_responses():
+    mk(('index.html', "from aspen import Response\n"
+                      "yield None\n"
+                      "raise Response(404)^L"
+                      "Greetings, program!"))
+    expected = 404
+    actual = handle().code
+    assert actual == expected, actual
+
+def test_socket_page_two_still_cannot_yield():
+    website = Website([])
+    assert_raises( SyntaxError
+                 , SocketResource, website, 'foo.sock', "yield None", None, 0
+                  )
+
+
+attach_teardown(globals())
@@ -0,0 +1,230 @@
+import time
+
+import aspen
+from aspen import Response
+from aspen.configuration import ConfigurationError
+from aspen.coroutines import Coroutine
+from aspen.deadlines import Overseer
+from aspen.http.request import Request
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+from aspen.website import Website
+
+
+def serve(path, *argv):
+    website = Website(['--www_root', FSFIX] + list(argv))
+    return website.serve_request(path)
+
+def logged(func):
+    """Given a callable, call it and return a list of what it logged.
+    """
+    lines = []
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lines.append
+    try:
+        func()
+    finally:
+        aspen.log_dammit = log_dammit
+    return lines
+
+
+# Budgets
+# =======
+
+def test_request_budget_ms_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--request_budget_ms', '-1'])
+
+def test_requests_have_no_deadline_by_default():
+    mk(('index.html', "^L^L{{ request.deadline }} {{ request.remaining() }}"))
+    expected = "None None"
+    actual = serve('/').body
+    assert actual == expected, actual
+
+def test_request_budget_ms_sets_a_deadline():
+    mk(('index.html', "^L^L{{ request.deadline - request.started }}"))
+    expected = "0.25"
+    actual = serve('/', '--request_budget_ms', '250').body
+    assert actual == expected, actual
+
+def test_page_one_can_set_a_budget():
+    mk(('index.html', "__budget_ms__ = 500^L^L"
+                      "{{ request.deadline - request.started }}"))
+    expected = "0.5"
+    actual = serve('/', '--request_budget_ms', '250').body
+    assert actual == expected, actual
+
+def test_page_one_can_turn_the_budget_off():
+    mk(('index.html', "__budget_ms__ = 0^L^L{{ request.deadline }}"))
+    expected = "None"
+    actual = serve('/', '--request_budget_ms', '250').body
+    assert actual == expected, actual
+
+def test_remaining_counts_down_to_zero():
+    request = Request()
+    request.deadline = time.time() + 10
+    assert 9 < request.remaining() <= 10, request.remaining()
+    request.deadline = time.time() - 10
+    expected = 0
+    actual = request.remaining()
+    assert actual == expected, actual
+
+def test_finished_requests_arent_watched():
+    mk(('index.html', "Greetings, program!"))
+    website = Website(['--www_root', FSFIX, '--request_budget_ms', '1000'])
+    website.serve_request('/')
+    expected = {}
+    actual = website.overseer.watched
+    assert actual == expected, actual
+
+def test_requests_arent_watched_after_an_outbound_hook_fails():
+    mk(('index.html', "Greetings, program!"))
+    website = Website(['--www_root', FSFIX, '--request_budget_ms', '1000'])
+    def fail(response):
+        raise ZeroDivisionError
+    website.hooks.outbound_late.register(fail)
+    assert_raises(ZeroDivisionError, website.serve_request, '/')
+    expected = {}
+    actual = website.overseer.watched
+    assert actual == expected, actual
+
+
+# Overruns
+# ========
+
+def test_overseer_reports_overruns_with_a_stack():
+    overseer = Overseer()
+    request = Request(uri='/slow.html')
+    overseer.stamp(request, 1)
+    request.deadline -= 1   # we're running late
+    lines = logged(overseer.check)
+    assert lines[0].startswith("GET /slow.html is "), lines
+    assert "in test_overseer_reports_overruns_with_a_stack" in lines[0], lines
+
+def test_overseer_reports_overruns_once():
+    overseer = Overseer()
+    request = Request()
+    overseer.stamp(request, 1)
+    request.deadline -= 1
+    logged(overseer.check)
+    logged(overseer.check)
+    expected = (1, {})
+    actual = (overseer.noverruns, overseer.watched)
+    assert actual == expected, actual
+
+def test_overseer_leaves_requests_on_time_alone():
+    overseer = Overseer()
+    request = Request()
+    overseer.stamp(request, 10000)
+    expected = []
+    actual = logged(overseer.check)
+    assert actual == expected, actual
+
+
+# Slow requests
+# =============
+
+def test_slow_request_ms_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--slow_request_ms', '-1'])
+
+def test_slow_request_sample_ms_must_be_at_least_one():
+    assert_raises( ConfigurationError
+                 , Website, ['--slow_request_sample_ms', '0']
+                  )
+
+def test_requests_arent_tracked_by_default():
+    mk(('index.html', "^L^L{{ len(website.overseer.watched) }}"))
+    expected = "0"
+    actual = serve('/').body
+    assert actual == expected, actual
+
+def test_slow_request_ms_tracks_requests_in_flight():
+    mk(('index.html', "^L^L{{ len(website.overseer.watched) }}"))
+    website = Website(['--www_root', FSFIX, '--slow_request_ms', '1000'])
+    expected = ("1", {})
+    actual = (website.serve_request('/').body, website.overseer.watched)
+    assert actual == expected, actual
+
+def test_overseer_samples_slow_requests():
+    overseer = Overseer(slow_ms=1)
+    request = Request(uri='/slow.html')
+    overseer.track(request)
+    request.started -= 1
+    lines = logged(overseer.check)
+    assert lines[0].startswith("GET /slow.html has been running for "), lines
+    assert "(sample 1)" in lines[0], lines
+    assert "in test_overseer_samples_slow_requests" in lines[0], lines
+
+def test_overseer_samples_slow_requests_at_intervals():
+    overseer = Overseer(slow_ms=1, sample_ms=60000)
+    request = Request()
+    overseer.track(request)
+    request.started -= 1
+    logged(overseer.check)
+    expected = []
+    actual = logged(overseer.check)   # too soon
+    assert actual == expected, actual
+    overseer.watched[id(request)].next_sample = 0
+    lines = logged(overseer.check)
+    assert "(sample 2)" in lines[0], lines
+
+def test_overseer_leaves_fast_requests_alone():
+    overseer = Overseer(slow_ms=10000)
+    overseer.track(Request())
+    expected = []
+    actual = logged(overseer.check)
+    assert actual == expected, actual
+
+def test_overseer_summarizes_slow_requests_when_they_finish():
+    overseer = Overseer(slow_ms=1)
+    request = Request(uri='/slow.html')
+    overseer.track(request)
+    request.started -= 1
+    logged(overseer.check)
+    lines = logged(lambda: overseer.unwatch(request))
+    assert lines[0].startswith("GET /slow.html finished after "), lines
+    assert "Innermost frames in 1 samples:" in lines[0], lines
+    assert "1 x " in lines[0], lines
+
+def test_overseer_doesnt_summarize_fast_requests():
+    overseer = Overseer(slow_ms=10000)
+    request = Request()
+    overseer.track(request)
+    expected = []
+    actual = logged(lambda: overseer.unwatch(request))
+    assert actual == expected, actual
+
+def test_overseer_keeps_sampling_overruns_when_tracking_slow_requests():
+    overseer = Overseer(slow_ms=1)
+    request = Request()
+    overseer.stamp(request, 1)
+    request.deadline -= 1
+    request.started -= 1
+    lines = logged(overseer.check)
+    expected = (2, 1, [id(request)])
+    actual = (len(lines), overseer.noverruns, overseer.watched.keys())
+    assert actual == expected, actual
+
+
+# Interrupting coroutines
+# =======================
+
+def test_coroutine_past_its_deadline_gets_a_503_at_the_next_yield():
+    def page_two():
+        yield None
+        yield None
+    coroutine = Coroutine(page_two(), time.time() - 1)
+    response = assert_raises(Response, coroutine.run)
+    expected = 503
+    actual = response.code
+    assert actual == expected, actual
+
+def test_coroutine_simplate_that_overruns_is_interrupted():
+    mk(('index.html', "__budget_ms__ = 50^L"
+                      "yield website.network_engine.pause(0.1)^L"
+                      "Made it!"))
+    expected = 503
+    actual = serve('/').code
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
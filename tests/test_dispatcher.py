@@ -1,9 +1,11 @@
 import os
+import time
 
 from aspen import dispatcher, Response
 from aspen.http.request import Request
 from aspen.testing import assert_raises, handle, NoException, StubRequest
-from aspen.testing import attach_teardown, fix, mk
+from aspen.testing import attach_teardown, fix, mk, FSFIX
+from aspen.website import Website
 
 # Convenience wrappers
 def assert_raises_404(func, *args):
@@ -510,4 +512,131 @@ def test_robots_txt_also_shouldnt_be_redirected():
     actual = err.code
     assert actual == 404, actual
 
+
+# Dispatch cache
+# ==============
+
+def age(seconds=3600):
+    """Backdate the directories under FSFIX, so the cache can vouch for them.
+    """
+    then = time.time() - seconds
+    for path, dirs, files in os.walk(FSFIX):
+        os.utime(path, (then, then))
+
+def Dispatcher(*argv):
+    """Return a function that dispatches URL paths through one Website.
+    """
+    age()
+    website = Website(['--www_root', FSFIX] + list(argv))
+    def dispatch(path):
+        request = StubRequest(path)
+        request.website = website
+        try:
+            dispatcher.dispatch(request)
+        except Response, response:
+            return response.code
+        return request
+    dispatch.website = website
+    return dispatch
+
+def touch_later(path):
+    """Make a file under FSFIX, after the mtime of its directory can change.
+    """
+    time.sleep(0.01)
+    open(fix(path), 'w+').write("Greetings, program!")
+
+def test_dispatch_cache_remembers_hits():
+    mk(('foo.html', "Greetings, program!"))
+    dispatch = Dispatcher()
+    dispatch('/foo.html')
+    expected = (fix('foo.html'), 1)
+    actual = (dispatch('/foo.html').fs, dispatch.website.dispatch_cache.nhits)
+    assert actual == expected, actual
+
+def test_dispatch_cache_remembers_misses_separately():
+    mk(('foo.html', "Greetings, program!"))
+    dispatch = Dispatcher('--dispatch_cache_misses', '1')
+    dispatch('/foo.html')
+    dispatch('/bar.html')
+    dispatch('/baz.html')
+    cache = dispatch.website.dispatch_cache
+    expected = (1, 1)
+    actual = (len(cache.found), len(cache.missing))
+    assert actual == expected, actual
+
+def test_dispatch_cache_replays_wildcards():
+    mk(('%name/index.html', "Greetings, program!"))
+    dispatch = Dispatcher()
+    dispatch('/chad/')
+    expected = {'name': [u'chad']}
+    actual = dispatch('/chad/').line.uri.path
+    assert actual == expected, actual
+
+def test_dispatch_cache_replays_redirects():
+    mk('foo')
+    dispatch = Dispatcher()
+    dispatch('/foo')
+    expected = 301
+    actual = dispatch('/foo')
+    assert actual == expected, actual
+
+def test_dispatch_cache_notices_new_files():
+    mk(('foo.html', "Greetings, program!"))
+    dispatch = Dispatcher()
+    assert dispatch('/bar.html') == 404
+    touch_later('bar.html')
+    expected = fix('bar.html')
+    actual = dispatch('/bar.html').fs
+    assert actual == expected, actual
+
+def test_dispatch_cache_notices_new_index_files():
+    mk('foo')
+    dispatch = Dispatcher()
+    assert dispatch('/foo/') == 404
+    touch_later('foo/index.html')
+    expected = fix('foo/index.html')
+    actual = dispatch('/foo/').fs
+    assert actual == expected, actual
+
+def test_dispatch_cache_notices_removed_files():
+    mk(('foo/bar.html', "Greetings, program!"))
+    dispatch = Dispatcher()
+    dispatch('/foo/bar.html')
+    time.sleep(0.01)
+    os.remove(fix('foo/bar.html'))
+    expected = 404
+    actual = dispatch('/foo/bar.html')
+    assert actual == expected, actual
+
+def test_dispatch_cache_rechecks_directories_that_just_changed():
+    mk(('foo.html', "Greetings, program!"))
+    dispatch = Dispatcher()
+    soon = int(time.time()) + 1  # not over yet, even if the clock ticks
+    os.utime(FSFIX, (soon, soon))
+    assert dispatch('/bar.html') == 404
+    open(fix('bar.html'), 'w+').write("Greetings, program!")
+    os.utime(FSFIX, (soon, soon))  # as if mtimes only kept the second
+    expected = fix('bar.html')
+    actual = dispatch('/bar.html').fs
+    assert actual == expected, actual
+
+def test_dispatch_cache_can_be_turned_off():
+    mk(('foo.html', "Greetings, program!"))
+    dispatch = Dispatcher('--dispatch_cache_size', '0')
+    dispatch('/foo.html')
+    dispatch('/foo.html')
+    expected = 0
+    actual = dispatch.website.dispatch_cache.nhits
+    assert actual == expected, actual
+
+def test_dispatch_cache_reports_its_hit_rate():
+    mk(('foo.html', "Greetings, program!"))
+    dispatch = Dispatcher()
+    for i in range(4):
+        dispatch('/foo.html')
+    expected = 0.75
+    actual = dispatch.website.dispatch_cache.metrics()['hit_rate']
+    assert actual == expected, actual
+
+
 attach_teardown(globals())
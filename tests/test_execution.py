@@ -1,5 +1,11 @@
+import fcntl
+import os
+
 from aspen import execution
+from aspen.configuration import ConfigurationError
+from aspen.testing import assert_raises
 from aspen.testing.fsfix import attach_teardown
+from aspen.website import Website
 
 class Foo:
     pass
@@ -16,5 +22,77 @@ def test_startup_basically_works():
     actual = execution.extras
     assert actual == expected, repr(actual) + " instead of " + repr(expected)
 
+def test_install_starts_one_loop_over_the_given_check():
+    website = Foo()
+    website.network_engine = Foo()
+    loops = []
+    website.network_engine.start_checking = loops.append
+    website.configuration_scripts = []
+    check = lambda: None
+    execution.install(website, check)
+    expected = [check]
+    actual = loops
+    assert actual == expected, actual
+
+def test_set_cloexec_leaves_inherited_fds_open():
+    keep, close = os.pipe()
+    try:
+        execution.inherit(keep)
+        execution._set_cloexec()
+        expected = [0, fcntl.FD_CLOEXEC]
+        actual = [fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC
+                  for fd in (keep, close)]
+    finally:
+        execution.inherited.discard(keep)
+        os.close(keep)
+        os.close(close)
+    assert actual == expected, actual
+
+
+# Recycling
+# =========
+
+def test_max_requests_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--max_requests', '-1'])
+
+def test_max_rss_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--max_rss', '-1'])
+
+def test_rss_is_some_bytes():
+    actual = execution.rss()
+    assert actual > execution.MB, actual
+
+def test_worn_out_is_None_without_limits():
+    website = Website([])
+    website.nrequests = 1000000
+    actual = execution.worn_out(website)
+    assert actual is None, actual
+
+def test_worn_out_after_max_requests():
+    website = Website(['--max_requests', '10'])
+    website.nrequests = 9
+    assert execution.worn_out(website) is None
+    website.nrequests = 10
+    expected = "served 10 requests"
+    actual = execution.worn_out(website)
+    assert actual == expected, actual
+
+def test_worn_out_past_max_rss():
+    website = Website(['--max_rss', '1'])
+    actual = execution.worn_out(website)
+    assert actual.startswith("using "), actual
+
+def test_check_wear_interrupts_the_engine_once():
+    website = Website(['--max_requests', '1'])
+    website.nrequests = 1
+    interrupts = []
+    website.network_engine.interrupt = lambda: interrupts.append(True)
+    reasons = []
+    execution.check_wear(website, reasons)
+    execution.check_wear(website, reasons)
+    expected = (["served 1 requests"], [True])
+    actual = (reasons, interrupts)
+    assert actual == expected, actual
+
 
 attach_teardown(globals())
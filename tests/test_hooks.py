@@ -1,4 +1,9 @@
-from aspen.hooks import Hooks
+import re
+
+from aspen.hooks import Hooks, TIMES
+from aspen.hooks.filters import by_regex
+from aspen.http.request import Request
+from aspen.http.response import Response
 from aspen.testing import assert_raises, attach_teardown
 
 
@@ -55,4 +60,128 @@ def test_hooks_can_be_mass_registered():
     assert myhooks.outbound_late in hooks.outbound_late
 
 
+
+# Paths
+# =====
+
+def Recorder(hooks, name):
+    def hook(thing):
+        hooks.ran.append(name)
+    return hook
+
+def Scoped(*registrations):
+    hooks = Hooks(['inbound_early', 'outbound_late', 'startup'])
+    hooks.ran = []
+    for name, path in registrations:
+        hooks.inbound_early.register(Recorder(hooks, name), path)
+    return hooks
+
+def ran(hooks, path):
+    hooks.ran = []
+    hooks.inbound_early.run(Request(uri=path))
+    return hooks.ran
+
+def test_scoped_hooks_run_for_their_prefix():
+    hooks = Scoped(('all', None), ('api', '/api/'), ('admin', '/admin/'))
+    expected = (['all', 'api'], ['all', 'admin'], ['all'])
+    actual = (ran(hooks, '/api/foo'), ran(hooks, '/admin/'), ran(hooks, '/'))
+    assert actual == expected, actual
+
+def test_scoped_hooks_run_in_the_order_they_were_registered():
+    hooks = Scoped( ('api', '/api/')
+                  , ('a', '/a')
+                  , ('all', None)
+                  , ('edit', re.compile('/[^/]+/edit'))
+                  , ('api2', '/api/')
+                   )
+    expected = ['api', 'a', 'all', 'edit', 'api2']
+    actual = ran(hooks, '/api/edit')
+    assert actual == expected, actual
+
+def test_scoped_hooks_match_patterns_at_the_start():
+    hooks = Scoped(('edit', re.compile('/[^/]+/edit')))
+    expected = (['edit'], [])
+    actual = (ran(hooks, '/foo/edit'), ran(hooks, '/foo/bar/edit'))
+    assert actual == expected, actual
+
+def test_scoped_hooks_see_the_request_of_a_response():
+    hooks = Scoped()
+    hooks.outbound_late.register(Recorder(hooks, 'api'), '/api/')
+    response = Response()
+    response.request = Request(uri='/api/foo')
+    hooks.outbound_late.run(response)
+    expected = ['api']
+    actual = hooks.ran
+    assert actual == expected, actual
+
+def test_scoped_hooks_dont_run_without_a_path():
+    hooks = Scoped()
+    hooks.startup.register(Recorder(hooks, 'all'))
+    hooks.startup.register(Recorder(hooks, 'api'), '/api/')
+    hooks.startup.run(object())
+    expected = ['all']
+    actual = hooks.ran
+    assert actual == expected, actual
+
+def test_registering_recompiles():
+    hooks = Scoped(('api', '/api/'))
+    ran(hooks, '/api/')
+    hooks.inbound_early.register(Recorder(hooks, 'more'), '/api/')
+    expected = ['api', 'more']
+    actual = ran(hooks, '/api/')
+    assert actual == expected, actual
+
+def test_path_must_be_a_prefix_or_a_pattern():
+    hooks = Hooks(['inbound_early'])
+    assert_raises(TypeError, hooks.inbound_early.register, random.random, 42)
+
+def count_timings(hook):
+    key = ('inbound_early', 'test_hooks.' + hook.__name__)
+    counts = [s[3] for s in TIMES.samples()
+              if s[0] == '_count' and s[2] == key]
+    return (counts or [0])[0]
+
+def run_twice(hook, timed):
+    hooks = Hooks(['inbound_early'], timed=timed)
+    hooks.inbound_early.register(hook)
+    hooks.inbound_early.run(Request(uri='/'))
+    hooks.inbound_early.run(Request(uri='/'))
+
+def test_hooks_are_timed():
+    def timed_hook(request):
+        pass
+    before = count_timings(timed_hook)
+    run_twice(timed_hook, True)
+    expected = before + 2
+    actual = count_timings(timed_hook)
+    assert actual == expected, actual
+
+def test_hooks_arent_timed_without_metrics():
+    def untimed_hook(request):
+        pass
+    run_twice(untimed_hook, False)
+    expected = 0
+    actual = count_timings(untimed_hook)
+    assert actual == expected, actual
+
+
+# Filters
+# =======
+
+def test_by_regex_filters():
+    hooks = Scoped()
+    hook = by_regex( Recorder(hooks, 'hook')
+                   , [('/api/', True), ('/admin/', False)]
+                   , default=False
+                    )
+    results = []
+    for path in ('/api/foo', '/admin/foo', '/'):
+        hooks.ran = []
+        request = Request(uri=path)
+        returned = hook(request)
+        results.append((hooks.ran, returned is request))
+    expected = [(['hook'], False), ([], True), ([], True)]
+    assert results == expected, results
+
+
 attach_teardown(globals())
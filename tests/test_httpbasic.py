@@ -2,7 +2,7 @@
 
 from aspen.http.response import Response
 from aspen.testing import assert_raises, StubRequest
-from aspen.auth.httpbasic import inbound_responder
+from aspen.auth.httpbasic import inbound_responder, CACHE
 
 import base64
 
@@ -57,3 +57,95 @@ def test_malformed_password():
     assert response.code == 400, response
 
 
+# cache
+
+class Verifier(object):
+    def __init__(self, password):
+        self.password = password
+        self.ncalls = 0
+    def __call__(self, user, password):
+        self.ncalls += 1
+        return user == "username" and password == self.password
+
+def _hook_and_verifier(**kw):
+    verifier = Verifier("password")
+    return inbound_responder(verifier, **kw), verifier
+
+def _call(hook, password):
+    request = StubRequest()
+    request.headers['Authorization'] = _auth_header("username", password)
+    try:
+        hook(request)
+    except Response, response:
+        return response.code
+    return 200
+
+def test_no_cache_by_default():
+    hook, verifier = _hook_and_verifier()
+    codes = [_call(hook, "password") for i in range(3)]
+    expected = ([200, 200, 200], 3, None)
+    actual = (codes, verifier.ncalls, hook.auth.cache)
+    assert actual == expected, actual
+
+def test_cache_skips_verify_password():
+    hits = CACHE.value(('hit',))
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    codes = [_call(hook, "password") for i in range(3)]
+    expected = ([200, 200, 200], 1, hits + 2)
+    actual = (codes, verifier.ncalls, CACHE.value(('hit',)))
+    assert actual == expected, actual
+
+def test_cache_doesnt_store_the_password():
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    _call(hook, "password")
+    expires, mac = hook.auth.cache.get("username")
+    assert "password" not in mac, mac
+
+def test_cache_still_checks_the_password():
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    codes = [_call(hook, "password"), _call(hook, "wrong password")]
+    expected = ([200, 401], 2)
+    actual = (codes, verifier.ncalls)
+    assert actual == expected, actual
+
+def test_cache_expires():
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    _call(hook, "password")
+    expires, mac = hook.auth.cache.get("username")
+    hook.auth.cache["username"] = (expires - 61, mac)
+    _call(hook, "password")
+    expected = 2
+    actual = verifier.ncalls
+    assert actual == expected, actual
+
+def test_cache_forgets_on_password_change():
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    _call(hook, "password")
+    verifier.password = "new password"
+    hook.auth.forget("username")
+    codes = [_call(hook, "password"), _call(hook, "new password")]
+    expected = ([401, 200], 3)
+    actual = (codes, verifier.ncalls)
+    assert actual == expected, actual
+
+def test_cache_doesnt_remember_a_check_that_raced_with_forget():
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    def verify_password(user, password):
+        ok = verifier(user, password)
+        verifier.password = "new password"  # meanwhile, in another thread
+        hook.auth.forget("username")
+        return ok
+    hook.auth.verify_password = verify_password
+    expected = (200, False)
+    actual = (_call(hook, "password"), "username" in hook.auth.cache)
+    assert actual == expected, actual
+
+def test_cache_forgets_on_logout():
+    hook, verifier = _hook_and_verifier(cache_ttl=60)
+    request = StubRequest()
+    request.headers['Authorization'] = _auth_header("username", "password")
+    hook(request)
+    request.auth.logout()
+    expected = (False, 401)
+    actual = ("username" in hook.auth.cache, _call(hook, "password"))
+    assert actual == expected, actual
@@ -2,7 +2,8 @@
 
 from aspen.http.response import Response
 from aspen.testing import assert_raises, StubRequest
-from aspen.auth.httpdigest import inbound_responder, digest
+from aspen.auth.httpdigest import inbound_responder, digest, NonceMemory, \
+                                   SignedNonces
 
 import base64
 
@@ -94,3 +95,72 @@ def test_wrong_auth():
     assert response.code == 400, response
 
 
+# nonces
+
+def _state(nonces, nonce, nc='00000001'):
+    return nonces.nonce_state({'nonce': nonce, 'nc': nc})
+
+def test_nonce_memory_forgets_expired_nonces():
+    nonces = NonceMemory()
+    old = nonces.get_new_nonce(-60)
+    new = nonces.get_new_nonce()
+    expected = (False, True, 1)
+    actual = (old in nonces, new in nonces, len(nonces))
+    assert actual == expected, actual
+
+def test_nonce_memory_is_bounded():
+    nonces = NonceMemory(3)
+    issued = [nonces.get_new_nonce() for i in range(5)]
+    expected = (3, 3)
+    actual = (len(nonces), len([n for n in issued if n in nonces]))
+    assert actual == expected, actual
+
+def test_nonce_memory_refreshes_forgotten_nonces_but_rejects_garbage():
+    nonces = NonceMemory(1)
+    forgotten = nonces.get_new_nonce()
+    remembered = nonces.get_new_nonce()
+    expected = [NonceMemory.NONCE_VALID, NonceMemory.NONCE_OLD,
+                NonceMemory.NONCE_INVALID, NonceMemory.NONCE_INVALID]
+    actual = [ _state(nonces, remembered)
+             , _state(nonces, forgotten)
+             , _state(nonces, '0' * 34)
+             , _state(nonces, 'Greetings, program!')
+              ]
+    assert actual == expected, actual
+
+def test_nonce_memory_retires_a_nonce_when_its_count_is_off():
+    nonces = NonceMemory()
+    nonce = nonces.get_new_nonce()
+    expected = [NonceMemory.NONCE_OLD, NonceMemory.NONCE_OLD]
+    actual = [_state(nonces, nonce, '00000009'), _state(nonces, nonce)]
+    assert actual == expected, actual
+
+def test_signed_nonces_check_out():
+    nonces = SignedNonces('s3cret')
+    nonce = nonces.get_new_nonce()
+    tampered = nonce[:15] + ('0' if nonce[15] != '0' else '1') + nonce[16:]
+    expected = [ SignedNonces.NONCE_VALID
+               , SignedNonces.NONCE_VALID
+               , SignedNonces.NONCE_INVALID
+               , SignedNonces.NONCE_INVALID
+               , SignedNonces.NONCE_OLD
+                ]
+    actual = [ _state(nonces, nonce)
+             , _state(SignedNonces('s3cret'), nonce)
+             , _state(SignedNonces('other'), nonce)
+             , _state(nonces, tampered)
+             , _state(nonces, nonces.get_new_nonce(-60))
+              ]
+    assert actual == expected, actual
+
+def test_signed_nonces_work_across_workers():
+    one = inbound_responder(_auth_func("username", "password"),
+                            realm="testrealm@host.com", nonce_secret='s3cret')
+    two = inbound_responder(_auth_func("username", "password"),
+                            realm="testrealm@host.com", nonce_secret='s3cret')
+    request = StubRequest()
+    response = assert_raises(Response, one, request)
+    auth_headers = _auth_headers(response)
+    request.headers['Authorization'] = _digest_auth_for(auth_headers, "username", "password")
+    two(request)
+    assert request.auth.username() == "username", request.auth.username()
@@ -1,9 +1,13 @@
 import re
 import sys
+import time
 from StringIO import StringIO
 
+import aspen
 import aspen.logging
-from aspen.logging import log, log_dammit
+from aspen.logging import log, log_dammit, Writer
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+from aspen.website import Website
 
 
 pat = re.compile("pid-\d* thread--?\d* \(MainThread\) (.*)")
@@ -49,3 +53,137 @@ def test_logging_unicode_works():
     actual = capture(u"oh \u2614 heck", level=4)
     assert actual == ["oh \xe2\x98\x94 heck"], actual
 
+
+
+# Buffering
+# =========
+
+def written(writer):
+    """Given a Writer, flush it and return the lines it wrote.
+    """
+    try:
+        sys.stdout = StringIO()
+        writer.flush()
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = sys.__stdout__
+    return output.splitlines()
+
+def test_writer_writes_lines_in_order():
+    writer = Writer(10, flush_seconds=60)
+    writer.put(['foo', 'bar'])
+    writer.put(['baz'])
+    expected = ['foo', 'bar', 'baz']
+    actual = written(writer)
+    assert actual == expected, actual
+
+def test_writer_drops_oldest_lines_when_full_and_says_so():
+    writer = Writer(2, flush_seconds=60)
+    writer.lock.acquire()   # keep the writer thread out of our way
+    try:
+        writer.put(['foo', 'bar', 'baz'])
+    finally:
+        writer.lock.release()
+    actual = written(writer)
+    assert actual[:2] == ['bar', 'baz'], actual
+    assert actual[2].endswith(" Dropped 1 log lines; the buffer was full."), \
+        actual
+
+def test_writer_metrics():
+    writer = Writer(2, flush_seconds=60)
+    writer.lock.acquire()
+    try:
+        writer.put(['foo', 'bar', 'baz'])
+    finally:
+        writer.lock.release()
+    written(writer)
+    expected = { 'depth': 0
+               , 'maxsize': 2
+               , 'high_water': 2
+               , 'dropped': 1
+               , 'written': 3
+                }
+    actual = writer.metrics()
+    assert actual == expected, actual
+
+def test_blocking_writer_waits_for_room():
+    writer = Writer(2, policy='block', flush_seconds=0.01)
+    try:
+        sys.stdout = StringIO()
+        writer.put(['foo', 'bar', 'baz', 'buz'])
+        writer.stop()
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = sys.__stdout__
+    expected = (['foo', 'bar', 'baz', 'buz'], 0)
+    actual = (output.splitlines(), writer.ndropped)
+    assert actual == expected, actual
+
+def test_writer_thread_writes_in_the_background():
+    writer = Writer(10, flush_seconds=0.01)
+    try:
+        sys.stdout = StringIO()
+        writer.put(['foo'])
+        time.sleep(0.2)
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = sys.__stdout__
+        writer.stop()
+    expected = ['foo']
+    actual = output.splitlines()
+    assert actual == expected, actual
+
+def test_buffered_log_goes_through_the_writer():
+    aspen.logging.buffer(10, flush_seconds=60)
+    actual = capture("oh heck", level=4)
+    assert actual == [], actual
+    actual = pat.findall('\n'.join(written(aspen.logging.WRITER)))
+    assert actual == ["oh heck"], actual
+
+def test_website_configures_the_buffer():
+    Website(['--logging_buffer', '50', '--logging_buffer_policy', 'block'])
+    expected = (50, 'block')
+    actual = (aspen.logging.WRITER.maxsize, aspen.logging.WRITER.policy)
+    assert actual == expected, actual
+    Website([])
+    assert aspen.logging.WRITER is None
+
+
+# Access log
+# ==========
+
+def access(*argv):
+    mk(('index.html', "Greetings, program!"))
+    website = Website(['--www_root', FSFIX] + list(argv))
+    response = website.serve_request('/')
+    try:
+        __threshold__ = aspen.logging.LOGGING_THRESHOLD
+        aspen.logging.LOGGING_THRESHOLD = 0
+        sys.stdout = StringIO()
+        website.log_access(response.request, response)
+        output = sys.stdout.getvalue()
+    finally:
+        aspen.logging.LOGGING_THRESHOLD = __threshold__
+        sys.stdout = sys.__stdout__
+    return output
+
+def test_access_log_is_text_by_default():
+    actual = pat.findall(access())[0].split()
+    assert actual[:3] == ['200', 'OK', '19'], actual
+    assert actual[4:] == ['ms', '/', './index.html'], actual
+
+def test_access_log_can_be_json():
+    actual = aspen.json.loads(access('--logging_access_format', 'json'))
+    assert actual.pop('ms') >= 0, actual
+    assert actual.pop('time') > 0, actual
+    expected = { 'pid': aspen.logging.PID
+               , 'method': 'GET'
+               , 'path': '/'
+               , 'fs': './index.html'
+               , 'status': 200
+               , 'bytes': 19
+                }
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
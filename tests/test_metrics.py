@@ -0,0 +1,179 @@
+import base64
+import threading
+
+from aspen import metrics
+from aspen.auth import ATTEMPTS, httpbasic
+from aspen.configuration import ConfigurationError
+from aspen.http.request import Request
+from aspen.metrics import Counter, Histogram, Registry
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+from aspen.website import Website
+
+
+def Site(*argv):
+    mk(('index.html', "Greetings, program!"))
+    return Website(['--www_root', FSFIX] + list(argv))
+
+def serve(website, uri='/', headers='Host: localhost'):
+    request = Request(uri=uri, headers=headers)
+    return website.handle_safely(request)
+
+def lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+# Metrics
+# =======
+
+def test_counter_counts():
+    counter = Counter('foo_total', "Foos.", ('code',))
+    counter.inc(('200',))
+    counter.inc(('200',), 2)
+    counter.inc(('404',))
+    expected = (3, 1, 0)
+    actual = (counter.value(('200',)), counter.value(('404',)),
+              counter.value(('500',)))
+    assert actual == expected, actual
+
+def test_counter_adds_up_shards_from_threads():
+    counter = Counter('foo_total', "Foos.")
+    def count():
+        for i in range(1000):
+            counter.inc()
+    threads = [threading.Thread(target=count) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc()
+    expected = 4001
+    actual = counter.value()
+    assert actual == expected, actual
+
+def test_counter_falls_back_to_a_shared_shard():
+    counter = Counter('foo_total', "Foos.")
+    for ident in range(metrics.MAX_SHARDS):
+        counter.shards[-ident] = {(): 1}
+    counter.inc()
+    expected = (metrics.MAX_SHARDS + 1, {(): 1})
+    actual = (counter.value(), counter.shared)
+    assert actual == expected, actual
+
+def test_counter_renders():
+    counter = Counter('foo_total', "Foos\nand bars.", ('path',))
+    counter.inc(('/"a"\\b',))
+    expected = [ '# HELP foo_total Foos\\nand bars.'
+               , '# TYPE foo_total counter'
+               , 'foo_total{path="/\\"a\\"\\\\b"} 1'
+                ]
+    actual = counter.render()
+    assert actual == expected, actual
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('foo_seconds', "Foo time.", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    expected = [ '# HELP foo_seconds Foo time.'
+               , '# TYPE foo_seconds histogram'
+               , 'foo_seconds_bucket{le="0.1"} 2'
+               , 'foo_seconds_bucket{le="1.0"} 3'
+               , 'foo_seconds_bucket{le="+Inf"} 4'
+               , 'foo_seconds_sum 2.65'
+               , 'foo_seconds_count 4'
+                ]
+    actual = histogram.render()
+    assert actual == expected, actual
+
+def test_callback_with_nothing_to_report_renders_nothing():
+    registry = Registry()
+    registry.callback('foo', 'gauge', "Foo.", lambda: None)
+    registry.callback('bar', 'gauge', "Bar.", lambda: {('a',): 1}, ('x',))
+    expected = '# HELP bar Bar.\n# TYPE bar gauge\nbar{x="a"} 1\n'
+    actual = registry.render()
+    assert actual == expected, actual
+
+def test_registry_rejects_duplicate_names():
+    registry = Registry()
+    registry.counter('foo_total', "Foos.")
+    assert_raises(ValueError, registry.counter, 'foo_total', "Foos.")
+
+
+# Website
+# =======
+
+def test_metrics_are_off_by_default():
+    website = Site()
+    response = serve(website, '/metrics')
+    expected = (None, 404)
+    actual = (website.metrics, response.code)
+    assert actual == expected, actual
+
+def test_metrics_path_must_start_with_a_slash():
+    mk()
+    assert_raises(ConfigurationError, Website, [ '--www_root', FSFIX
+                                               , '--metrics_path', 'metrics'
+                                                ])
+
+def test_metrics_path_serves_the_text_format():
+    website = Site('--metrics_path', '/_metrics')
+    response = serve(website, '/_metrics')
+    expected = (200, metrics.CONTENT_TYPE)
+    actual = (response.code, response.headers.get('Content-Type'))
+    assert actual == expected, actual
+    assert '# TYPE aspen_admission_in_flight gauge' in response.body
+
+def test_metrics_path_turns_on_hook_timing():
+    website = Site('--metrics_path', '/_metrics')
+    assert website.hooks.inbound_early.timed
+
+def test_hooks_arent_timed_without_metrics_path():
+    website = Site()
+    assert not website.hooks.inbound_early.timed
+
+def test_requests_are_counted_by_code_and_timed_by_resource():
+    website = Site('--metrics_path', '/_metrics')
+    serve(website, '/')
+    serve(website, '/')
+    serve(website, '/nope.html')
+    body = serve(website, '/_metrics').body
+    expected = [ 'aspen_requests_total{code="200"} 2'
+               , 'aspen_requests_total{code="404"} 1'
+               , 'aspen_request_duration_seconds_count{resource=""} 1'
+               , 'aspen_request_duration_seconds_count'
+                 '{resource="/index.html"} 2'
+                ]
+    actual = lines(body, 'aspen_requests_total') \
+           + lines(body, 'aspen_request_duration_seconds_count')
+    assert actual == expected, actual
+
+def test_metrics_include_the_resource_cache():
+    website = Site('--metrics_path', '/_metrics')
+    before = metrics.REGISTRY.render()
+    serve(website, '/')
+    serve(website, '/')
+    after = metrics.REGISTRY.render()
+    hits = lambda text: lines(text, 'aspen_resource_cache_hits_total ')
+    count = lambda text: hits(text) and int(hits(text)[0].split()[1]) or 0
+    expected = 1
+    actual = count(after) - count(before)
+    assert actual == expected, actual
+    body = serve(website, '/_metrics').body
+    assert 'aspen_resource_cache_hits_total' in body, body
+
+def test_metrics_include_auth_attempts():
+    key = ('basic', 'denied')
+    ndenied = ATTEMPTS.value(key)
+    website = Site('--metrics_path', '/_metrics')
+    website.hooks.inbound_early.register(
+        httpbasic.inbound_responder(lambda user, password: False))
+    header = 'Basic ' + base64.b64encode('foo:bar')
+    response = serve( website, '/'
+                    , 'Host: localhost\r\nAuthorization: ' + header
+                     )
+    expected = (401, ndenied + 1)
+    actual = (response.code, ATTEMPTS.value(key))
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
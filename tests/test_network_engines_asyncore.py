@@ -0,0 +1,162 @@
+from __future__ import with_statement # for Python 2.5
+import socket
+import threading
+import time
+
+from aspen.network_engines.asyncore_ import AsyncoreBuffer, event_loop, \
+                                            MAX_BODY
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+from aspen.website import Website
+
+
+PORT = 8397
+
+
+class RunningEngine(object):
+
+    def __enter__(self):
+        self.website = Website([ '--www_root', FSFIX
+                               , '--network_engine', 'asyncore'
+                               , '--network_address', '127.0.0.1:%d' % PORT
+                                ])
+        self.website.network_engine.bind()
+        engine = self.website.network_engine
+        self.thread = threading.Thread(target=engine.start)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.website
+
+    def __exit__(self, *a):
+        self.website.network_engine.stop()
+        self.thread.join()
+        for dispatcher in event_loop.map.values():
+            dispatcher.close()
+
+
+def talk(bytes, nresponses=1):
+    """Given bytes to send, return what comes back once nresponses are in.
+    """
+    sock = socket.create_connection(('127.0.0.1', PORT))
+    sock.settimeout(5)
+    sock.sendall(bytes)
+    received = ''
+    while received.count('HTTP/1.1 ') < nresponses or \
+          not received.endswith('!'):
+        data = sock.recv(4096)
+        if not data:
+            break
+        received += data
+    sock.close()
+    return received
+
+def bodies(received):
+    return [response.split('\r\n\r\n', 1)[1]
+            for response in received.split('HTTP/1.1 ')[1:]]
+
+
+GET = "GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def test_engine_serves_a_request():
+    mk(('index.html', "Greetings, program!"))
+    with RunningEngine():
+        received = talk(GET)
+    expected = ['Greetings, program!']
+    actual = bodies(received)
+    assert actual == expected, received
+
+def test_engine_sends_content_length():
+    mk(('index.html', "Greetings, program!"))
+    with RunningEngine():
+        received = talk(GET)
+    expected = True
+    actual = 'Content-Length: 19\r\n' in received
+    assert actual == expected, received
+
+def test_engine_answers_pipelined_requests_in_order():
+    mk( ('index.html', "Greetings, program!")
+      , ('slow.html', "yield website.network_engine.pause(0.1)^LSlow!")
+       )
+    with RunningEngine():
+        received = talk(GET.replace('/', '/slow.html', 1) + GET, 2)
+    expected = ['Slow!', 'Greetings, program!']
+    actual = bodies(received)
+    assert actual == expected, received
+
+def test_engine_closes_connection_for_HTTP_1_0():
+    mk(('index.html', "Greetings, program!"))
+    with RunningEngine():
+        received = talk("GET / HTTP/1.0\r\nHost: localhost\r\n\r\n")
+    expected = True
+    actual = 'Connection: close\r\n' in received
+    assert actual == expected, received
+
+def test_engine_reads_request_bodies():
+    mk(('index.html', "body = request.body.raw^L{{ body }}!"))
+    with RunningEngine():
+        received = talk( "POST / HTTP/1.1\r\nHost: localhost\r\n"
+                         "Content-Type: text/plain\r\n"
+                         "Content-Length: 19\r\n\r\nGreetings, program?"
+                        )
+    expected = ['Greetings, program?!']
+    actual = bodies(received)
+    assert actual == expected, received
+
+def test_engine_refuses_request_bodies_that_are_too_long():
+    mk(('index.html', "Greetings, program!"))
+    with RunningEngine():
+        received = talk( "POST / HTTP/1.1\r\nHost: localhost\r\n"
+                         "Content-Length: %d\r\n\r\n" % (MAX_BODY + 1)
+                        )
+    expected = True
+    actual = received.startswith('HTTP/1.1 413 ')
+    assert actual == expected, received
+
+def test_engine_suspends_coroutines_without_blocking():
+    mk(('index.html', "yield website.network_engine.pause(0.3)"
+                      "^LGreetings, program!"))
+    with RunningEngine():
+        results = []
+        def get():
+            results.append(talk(GET))
+        threads = [threading.Thread(target=get) for i in range(5)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    expected = ['Greetings, program!'] * 5
+    actual = [bodies(received)[0] for received in results]
+    assert actual == expected, results
+    assert elapsed < 1.0, elapsed
+
+def test_engine_resolves_deferred_calls_on_the_event_loop():
+    mk(('index.html', "import threading\n"
+                      "engine = website.network_engine\n"
+                      "here = threading.currentThread()\n"
+                      "there = yield engine.defer(threading.currentThread)\n"
+                      "back = threading.currentThread()\n"
+                      "msg = 'yes' if here is back is not there else 'no'"
+                      "^L{{ msg }}!"))
+    with RunningEngine():
+        received = talk(GET)
+    expected = ['yes!']
+    actual = bodies(received)
+    assert actual == expected, received
+
+
+def test_buffer_calls_waiters_back_on_the_event_loop():
+    buffer = AsyncoreBuffer('incoming')
+    called = []
+    buffer.wait(lambda: called.append(True))
+    buffer.put('foo')
+    expected = ([], [True])
+    before = list(called)
+    while event_loop.callbacks:
+        event_loop.callbacks.popleft()()
+    actual = (before, called)
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
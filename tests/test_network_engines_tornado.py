@@ -0,0 +1,162 @@
+import time
+
+import tornado.httpserver
+import tornado.ioloop
+from aspen.http.request import Request
+from aspen.sockets import FFFD
+from aspen.sockets.channel import Channel
+from aspen.sockets.socket import Socket
+from aspen.network_engines.tornado_ import AspenContainer, Engine, LongPoll, \
+                                           TornadoBuffer
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown, fix, mk
+from aspen.website import Website
+
+
+def make_socket(content='socket.send(socket.recv())'):
+    mk(('echo.sock', content))
+    request = Request(uri='/echo.sock')
+    request.website = Website(['--network_engine', 'tornado'])
+    request.fs = fix('echo.sock')
+    channel = Channel('/echo.sock', TornadoBuffer)
+    return Socket(request, channel)
+
+def spin(seconds=0.05):
+    ioloop = tornado.ioloop.IOLoop.instance()
+    ioloop.add_timeout(time.time() + seconds, ioloop.stop)
+    ioloop.start()
+
+
+def test_buffer_calls_waiters_back_after_put():
+    buffer = TornadoBuffer('incoming')
+    called = []
+    buffer.wait(lambda: called.append(True))
+    buffer.put('foo')
+    spin()
+    expected = [True]
+    actual = called
+    assert actual == expected, actual
+
+def test_buffer_recv_on_empty_raises_RuntimeError():
+    buffer = TornadoBuffer('incoming')
+    assert_raises(RuntimeError, buffer.next)
+
+def test_buffer_can_drop_oldest():
+    buffer = TornadoBuffer('incoming', maxsize=2, policy='drop_oldest')
+    for i in range(3):
+        buffer.put(i)
+    expected = [1, 2]
+    actual = [buffer.next(), buffer.next()]
+    assert actual == expected, actual
+
+def test_buffer_reports_high_water_and_drops():
+    buffer = TornadoBuffer('incoming', maxsize=2, policy='drop_oldest')
+    for i in range(3):
+        buffer.put(i)
+    buffer.next()
+    expected = {'depth': 1, 'maxsize': 2, 'high_water': 2, 'dropped': 1}
+    actual = buffer.metrics()
+    assert actual == expected, actual
+
+def test_buffer_takes_its_bounds_and_budget_from_the_website():
+    socket = make_socket()
+    expected = (1024, 'drop_oldest', 65536, 0.007)
+    actual = ( socket.outgoing.maxsize
+             , socket.outgoing.policy
+             , socket.outgoing.flush_bytes
+             , socket.outgoing.flush_seconds
+              )
+    assert actual == expected, actual
+
+def test_loop_ticks_once_per_incoming_message():
+    socket = make_socket()
+    socket.loop.start()
+    try:
+        socket._send('3::/echo.sock:Greetings, program!')
+        spin()
+        expected = FFFD+'33'+FFFD+'3::/echo.sock:Greetings, program!'
+        actual = socket._recv().next()
+        assert actual == expected, actual
+    finally:
+        socket.disconnect()
+
+def test_long_poll_answers_when_socket_sends():
+    socket = make_socket()
+    answers = []
+    LongPoll(socket, 5).answer(lambda chunks: answers.append(list(chunks)))
+    tornado.ioloop.IOLoop.instance().add_callback(lambda: socket.send('Hi!'))
+    spin()
+    expected = [[FFFD+'17'+FFFD+'3::/echo.sock:Hi!']]
+    actual = answers
+    assert actual == expected, actual
+
+def test_long_poll_times_out():
+    socket = make_socket()
+    answers = []
+    LongPoll(socket, 0.01).answer(answers.append)
+    spin()
+    expected = [[""]]
+    actual = answers
+    assert actual == expected, actual
+
+
+
+# AspenContainer
+# ==============
+
+class Connection(object):
+    xheaders = False
+    stream = None
+    def __init__(self):
+        self.written = []
+    def write(self, chunk):
+        self.written.append(chunk)
+    def finish(self):
+        pass
+
+class Body(object):
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+    def __iter__(self):
+        return iter(self.body)
+    def close(self):
+        self.closed = True
+
+def serve_long_poll(socket, timeout):
+    body = Body(LongPoll(socket, timeout))
+    def app(environ, start_response):
+        start_response('200 OK', [])
+        return body
+    container = AspenContainer(app)
+    connection = Connection()
+    request = tornado.httpserver.HTTPRequest( 'GET', '/'
+                                            , remote_ip='127.0.0.1'
+                                            , connection=connection
+                                             )
+    container(request)
+    return container, body, connection
+
+def test_long_poll_closes_the_body_once_answered():
+    socket = make_socket()
+    container, body, connection = serve_long_poll(socket, 0.01)
+    before = (container.in_flight, body.closed)
+    spin()
+    expected = ((1, False), (0, True))
+    actual = (before, (container.in_flight, body.closed))
+    assert actual == expected, actual
+    assert connection.written, connection.written
+
+def test_drain_waits_for_long_polls():
+    socket = make_socket()
+    engine = Engine('tornado', socket.website)
+    engine.container, body, connection = serve_long_poll(socket, 0.1)
+    start = time.time()
+    engine.drain(5)
+    expected = (0, True)
+    actual = (engine.container.in_flight, body.closed)
+    assert actual == expected, actual
+    assert time.time() - start < 1, time.time() - start
+
+
+attach_teardown(globals())
@@ -0,0 +1,213 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib2
+
+from aspen import resources
+from aspen.configuration import ConfigurationError
+from aspen.prefork import SO_REUSEPORT, listen
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+from aspen.website import Website
+
+
+PORT = 8398
+
+
+# Configuration
+# =============
+
+def test_workers_must_be_at_least_one():
+    assert_raises(ConfigurationError, Website, ['--workers', '0'])
+
+def test_workers_need_an_inet_address():
+    argv = ['--workers', '2', '--network_address', '/tmp/aspen.sock']
+    assert_raises(ConfigurationError, Website, argv)
+
+def test_workers_need_an_engine_that_can_prefork():
+    argv = ['--workers', '2', '--network_engine', 'tornado']
+    assert_raises(ConfigurationError, Website, argv)
+
+def test_workers_are_fine_with_cheroot():
+    website = Website(['--workers', '2'])
+    expected = 2
+    actual = website.workers
+    assert actual == expected, actual
+
+
+# Warming
+# =======
+
+def test_warm_loads_resources_into_the_cache():
+    mk( ('index.html', "Greetings, program!")
+      , ('foo/bar.html', "bar = 1^L{{ bar }}")
+      , ('.aspen/baz.py', "")
+       )
+    website = Website(['--www_root', FSFIX])
+    expected = 2
+    actual = resources.warm(website)
+    assert actual == expected, actual
+    expected = [os.path.join(FSFIX, 'foo', 'bar.html'),
+                os.path.join(FSFIX, 'index.html')]
+    actual = sorted(resources.__cache__)
+    assert actual == expected, actual
+
+def test_warm_skips_resources_that_fail_to_load():
+    mk(("index.html", "raise heck^L^L"))
+    website = Website(['--www_root', FSFIX])
+    expected = 0
+    actual = resources.warm(website)
+    assert actual == expected, actual
+
+
+# Listening
+# =========
+
+def test_listen_with_reuse_port_lets_sockets_share_a_port():
+    if SO_REUSEPORT is None:
+        return
+    website = Website(['--network_address', '127.0.0.1:%d' % PORT])
+    first = listen(website, reuse_port=True)
+    second = listen(website, reuse_port=True)
+    expected = first.getsockname()
+    actual = second.getsockname()
+    first.close()
+    second.close()
+    assert actual == expected, actual
+
+
+# Master
+# ======
+
+RUN = ('run.py', "from aspen.server import main; main()")
+
+def start_master(*argv):
+    """Start a master with two workers in a subprocess, and return it.
+
+    Call mk with RUN first. We need a script, because we re-execute sys.argv.
+
+    """
+    return start_aspen(*(('--workers', '2') + argv))
+
+def start_aspen(*argv):
+    """Start aspen in a subprocess, and return it.
+    """
+    return subprocess.Popen( [ sys.executable, os.path.join(FSFIX, 'run.py')
+                             , '--www_root', os.path.join(FSFIX, 'www')
+                             , '--network_address', '127.0.0.1:%d' % PORT
+                             , '--logging_threshold', '2'
+                              ] + list(argv)
+                           , cwd=FSFIX
+                           , stdout=open(os.devnull, 'w')
+                            )
+
+def get(path='/'):
+    return int(urllib2.urlopen('http://127.0.0.1:%d%s' % (PORT, path)).read())
+
+def collect_pids(n, excluding=()):
+    """Return a set of n worker pids, not counting excluded ones.
+    """
+    pids = set()
+    end = time.time() + 10
+    while len(pids) < n and time.time() < end:
+        try:
+            pid = get()
+        except (urllib2.URLError, socket.error):
+            time.sleep(0.1)
+        else:
+            if pid not in excluding:
+                pids.add(pid)
+    return pids
+
+def stop_master(master):
+    os.kill(master.pid, signal.SIGTERM)
+    master.wait()
+
+
+def test_master_forks_workers_that_share_the_port():
+    mk(RUN, ('www/index.html', "import os^L{{ os.getpid() }}"))
+    master = start_master()
+    try:
+        pids = collect_pids(2)
+    finally:
+        stop_master(master)
+
+    expected = 2
+    actual = len(pids)
+    assert actual == expected, pids
+    assert master.pid not in pids, pids
+
+def test_master_reloads_without_dropping_requests():
+    mk( RUN
+      , ('www/index.html', "import os^L{{ os.getpid() }}")
+      , ('www/slow.html', "import os, time^Ltime.sleep(1)^L{{ os.getpid() }}")
+       )
+    master = start_master()
+    try:
+        old = collect_pids(2)
+        slow = []
+        thread = threading.Thread(target=lambda: slow.append(get('/slow.html')))
+        thread.start()
+        time.sleep(0.3)
+        os.kill(master.pid, signal.SIGHUP)
+        new = set()
+        end = time.time() + 10
+        while not new and time.time() < end:
+            pid = get()     # raises if we drop a connection
+            if pid not in old:
+                new.add(pid)
+        thread.join()
+        still_running = master.poll() is None
+    finally:
+        stop_master(master)
+
+    assert still_running
+    assert new, old
+    assert slow and slow[0] in old, (slow, old)
+
+def test_single_process_reloads_without_dropping_requests():
+    mk( RUN
+      , ('www/index.html', "import os^L{{ os.getpid() }}")
+      , ('www/slow.html', "import os, time^Ltime.sleep(1)^L{{ os.getpid() }}")
+       )
+    aspen = start_aspen()
+    try:
+        pid = collect_pids(1).pop()
+        slow = []
+        fetch = lambda: slow.append(get('/slow.html'))
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        time.sleep(0.3)
+        os.kill(aspen.pid, signal.SIGHUP)
+        thread.join()
+        after = get()   # raises if we drop a connection
+        still_running = aspen.poll() is None
+    finally:
+        stop_master(aspen)
+
+    assert still_running
+    expected = ([pid], pid)     # execv keeps the pid
+    actual = (slow, after)
+    assert actual == expected, actual
+
+def test_master_replaces_workers_that_reach_max_requests():
+    mk(RUN, ('www/index.html', "import os^L{{ os.getpid() }}"))
+    master = start_master('--max_requests', '3')
+    try:
+        pids = collect_pids(2)
+        end = time.time() + 10
+        while len(pids) < 4 and time.time() < end:
+            pids.add(get())     # raises if we drop a connection
+        still_running = master.poll() is None
+    finally:
+        stop_master(master)
+
+    assert still_running
+    assert len(pids) >= 4, pids
+
+
+attach_teardown(globals())
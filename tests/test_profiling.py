@@ -0,0 +1,234 @@
+import os
+import tempfile
+
+import aspen
+from aspen import profiling
+from aspen.configuration import ConfigurationError
+from aspen.http.request import Request
+from aspen.profiling import constant_time_compare, slugify
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown, fix, FSFIX, mk
+from aspen.website import Website
+
+
+def Site(*argv):
+    mk(('index.html', "Greetings, program!"))
+    return Website([ '--www_root', FSFIX
+                   , '--profile_dir', fix('.profiles')
+                    ] + list(argv))
+
+def serve(website, uri='/', header=None):
+    headers = 'Host: localhost'
+    if header is not None:
+        headers += '\r\nX-Aspen-Profile: ' + header
+    request = Request(uri=uri, headers=headers)
+    return website.handle_safely(request)
+
+def profiles():
+    if not os.path.isdir(fix('.profiles')):
+        return []
+    return sorted(os.listdir(fix('.profiles')))
+
+
+# Profiling
+# =========
+
+def test_profiling_is_off_by_default():
+    website = Site()
+    response = serve(website, header='s3cret')
+    expected = (None, None, [])
+    actual = ( website.profiler
+             , response.headers.get('X-Aspen-Profile')
+             , profiles()
+              )
+    assert actual == expected, actual
+
+def test_request_with_the_secret_is_profiled():
+    website = Site('--profile_secret', 's3cret')
+    response = serve(website, header='s3cret')
+    header = response.headers.get('X-Aspen-Profile')
+    name = header.split(';')[0]
+    assert name.endswith('.pstats'), header
+    assert " calls in " in header, header
+    expected = [name, name[:-len('.pstats')] + '.txt']
+    actual = profiles()
+    assert actual == expected, actual
+
+def test_profile_summary_lists_functions():
+    website = Site('--profile_secret', 's3cret')
+    serve(website, header='s3cret')
+    summary = open(fix('.profiles/' + profiles()[1])).read()
+    assert "handler" in summary, summary
+
+def test_request_with_the_secret_in_the_querystring_is_profiled():
+    website = Site('--profile_secret', 's3cret')
+    response = serve(website, uri='/?aspen_profile=s3cret')
+    assert response.headers.get('X-Aspen-Profile') is not None
+
+def test_request_with_the_wrong_secret_isnt_profiled():
+    website = Site('--profile_secret', 's3cret')
+    response = serve(website, header='s3cres')
+    expected = (None, [])
+    actual = (response.headers.get('X-Aspen-Profile'), profiles())
+    assert actual == expected, actual
+
+def test_request_without_the_secret_isnt_profiled():
+    website = Site('--profile_secret', 's3cret')
+    response = serve(website)
+    expected = (None, [])
+    actual = (response.headers.get('X-Aspen-Profile'), profiles())
+    assert actual == expected, actual
+
+def test_profiled_errors_are_profiled_too():
+    website = Site('--profile_secret', 's3cret')
+    response = serve(website, uri='/missing.html', header='s3cret')
+    assert response.code == 404, response.code
+    assert response.headers.get('X-Aspen-Profile') is not None
+
+
+# Sampling
+# ========
+
+def test_sample_merges_the_next_requests_for_the_path():
+    website = Site('--profile_secret', 's3cret')
+    headers = [ serve(website, header='s3cret:3')
+              , serve(website, uri='/elsewhere.html')
+              , serve(website)
+              , serve(website)
+              , serve(website)
+               ]
+    headers = [r.headers.get('X-Aspen-Profile') for r in headers]
+    expected = ["sampled 1 of 3", None, "sampled 2 of 3", True, None]
+    actual = headers[:3] + [headers[3].split(';')[0].endswith('-x3.pstats'),
+                            headers[4]]
+    assert actual == expected, headers
+    expected = 2    # one merged profile, and its summary
+    actual = len(profiles())
+    assert actual == expected, actual
+
+def test_sample_needs_the_secret():
+    website = Site('--profile_secret', 's3cret')
+    serve(website, header='nope:3')
+    expected = {}
+    actual = website.profiler.samples
+    assert actual == expected, actual
+
+def test_sample_size_is_capped():
+    website = Site('--profile_secret', 's3cret')
+    response = serve(website, header='s3cret:1000000')
+    expected = "sampled 1 of %d" % profiling.MAX_SAMPLE
+    actual = response.headers.get('X-Aspen-Profile')
+    assert actual == expected, actual
+
+def test_stale_sample_is_dropped():
+    website = Site('--profile_secret', 's3cret')
+    serve(website, header='s3cret:3')
+    website.profiler.samples['/'].touched -= profiling.SAMPLE_TIMEOUT + 1
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lambda *a: None
+    try:
+        response = serve(website)
+    finally:
+        aspen.log_dammit = log_dammit
+    expected = (None, {})
+    actual = ( response.headers.get('X-Aspen-Profile')
+             , website.profiler.samples
+              )
+    assert actual == expected, actual
+
+def test_stale_sample_gives_way_to_a_new_one():
+    website = Site('--profile_secret', 's3cret')
+    serve(website, header='s3cret:3')
+    website.profiler.samples['/'].touched -= profiling.SAMPLE_TIMEOUT + 1
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lambda *a: None
+    try:
+        response = serve(website, header='s3cret:5')
+    finally:
+        aspen.log_dammit = log_dammit
+    expected = "sampled 1 of 5"
+    actual = response.headers.get('X-Aspen-Profile')
+    assert actual == expected, actual
+
+
+# Configuration
+# =============
+
+def test_profile_secret_cant_be_empty():
+    mk()
+    assert_raises( ConfigurationError, Website
+                 , ['--www_root', FSFIX, '--profile_secret', '']
+                  )
+
+def DefaultSite():
+    """Return a profiling Website with profile_dir under FSFIX/tmp.
+    """
+    tempfile.tempdir = fix('tmp')
+    try:
+        return Website([ '--www_root', FSFIX
+                       , '--profile_secret', 's3cret'
+                        ])
+    finally:
+        tempfile.tempdir = None
+
+def test_default_profile_dir_is_private():
+    mk('tmp')
+    website = DefaultSite()
+    expected = (fix('tmp/aspen-profiles'), 0700)
+    actual = ( website.profile_dir
+             , os.stat(website.profile_dir).st_mode & 0777
+              )
+    assert actual == expected, actual
+
+def test_default_profile_dir_is_made_private_if_it_exists():
+    mk('tmp', 'tmp/aspen-profiles')
+    os.chmod(fix('tmp/aspen-profiles'), 0777)
+    website = DefaultSite()
+    expected = 0700
+    actual = os.stat(website.profile_dir).st_mode & 0777
+    assert actual == expected, oct(actual)
+
+def test_default_profile_dir_cant_be_a_symlink():
+    mk('tmp', 'elsewhere')
+    os.symlink(fix('elsewhere'), fix('tmp/aspen-profiles'))
+    assert_raises(ConfigurationError, DefaultSite)
+
+def test_default_profile_dir_cant_belong_to_someone_else():
+    mk('tmp', 'tmp/aspen-profiles')
+    getuid = os.getuid
+    os.getuid = lambda: getuid() + 1
+    try:
+        assert_raises(ConfigurationError, DefaultSite)
+    finally:
+        os.getuid = getuid
+
+def test_profile_secret_isnt_logged():
+    lines = []
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lines.append
+    try:
+        Site('--profile_secret', 's3cret')
+    finally:
+        aspen.log_dammit = log_dammit
+    assert lines, lines
+    assert "s3cret" not in '\n'.join(lines), lines
+
+
+# Helpers
+# =======
+
+def test_constant_time_compare_compares():
+    expected = (True, False, False)
+    actual = ( constant_time_compare('s3cret', 's3cret')
+             , constant_time_compare('s3cret', 's3cres')
+             , constant_time_compare('s3cret', 's3cre')
+              )
+    assert actual == expected, actual
+
+def test_slugify_makes_paths_safe_for_filenames():
+    expected = ('index', 'foo_bar.html', 'a_b')
+    actual = (slugify('/'), slugify('/foo/bar.html'), slugify('/a b'))
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
@@ -0,0 +1,40 @@
+import aspen
+from aspen.server import main
+from aspen.testing.fsfix import attach_teardown, FSFIX, mk
+
+
+def check():
+    """Run aspen --check against FSFIX, and return its status and output.
+    """
+    lines = []
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lines.append
+    try:
+        status = main(['--check', '--www_root', FSFIX])
+    finally:
+        aspen.log_dammit = log_dammit
+    return status, lines
+
+
+def test_check_passes_a_good_site():
+    mk(('index.html', "Greetings, program!"), ('foo.txt', "^L^LBar."))
+    status, lines = check()
+    expected = (0, "Loaded 2 resources; 0 failed.")
+    actual = (status, lines[-1])
+    assert actual == expected, actual
+
+def test_check_fails_a_bad_simplate():
+    mk(('index.html', "Greetings, program!"), ('foo.txt', "^L^L^L^LBar."))
+    status, lines = check()
+    expected = (1, "Loaded 1 resources; 1 failed.")
+    actual = (status, lines[-1])
+    assert actual == expected, actual
+
+def test_check_lists_renderers():
+    mk()
+    status, lines = check()
+    assert "Renderers (*ed are unavailable, CAPS is default):" in lines, lines
+    assert "  TORNADO" in '\n'.join(lines), lines
+
+
+attach_teardown(globals())
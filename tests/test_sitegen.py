@@ -0,0 +1,112 @@
+import os
+import shutil
+
+from aspen import dispatcher, Response
+from aspen.testing import assert_raises, StubWSGIRequest
+from aspen.testing.fsfix import attach_teardown, FSFIX
+from aspen.testing.sitegen import generate, load_workload, sample
+from aspen.testing.sitegen import save_workload
+from aspen.http.request import Request
+from aspen.website import Website
+
+
+def check(urls, *argv):
+    """Given URLs from generate, dispatch each and return the mismatches.
+    """
+    website = Website(['--www_root', FSFIX] + list(argv))
+    wrong = []
+    for path, expected in urls:
+        request = Request.from_wsgi(StubWSGIRequest(path))
+        request.website = website
+        try:
+            dispatcher.dispatch(request)
+        except Response, response:
+            actual = response.code
+            if actual == 404:
+                actual = None
+        else:
+            actual = request.fs[len(FSFIX):].replace(os.sep, '/')
+            autoindex = request.headers.get('X-Aspen-AutoIndexDir')
+            if autoindex is not None:
+                actual = autoindex[len(FSFIX):].replace(os.sep, '/')
+        if actual != expected:
+            wrong.append((path, expected, actual))
+    return wrong
+
+
+# Sites
+# =====
+
+def test_generate_makes_a_tree_of_the_requested_shape():
+    generate(FSFIX, fanout=2, depth=2, files=3, wildcards=0)
+    walked = list(os.walk(FSFIX))
+    expected = (7, 21)  # 1 + 2 + 4 directories with 3 files each
+    actual = ( len(walked)
+             , len([n for d, s, f in walked for n in f if n.startswith('f')])
+              )
+    assert actual == expected, actual
+
+def test_generate_is_repeatable():
+    a = generate(FSFIX, fanout=2, seed=42)
+    shutil.rmtree(FSFIX)
+    b = generate(FSFIX, fanout=2, seed=42)
+    assert a == b
+
+def test_generate_rejects_unknown_parameters():
+    assert_raises(TypeError, generate, FSFIX, fanin=3)
+
+
+# Scaling
+# =======
+# Every URL on a generated site dispatches to what the generator expects.
+
+def test_wide_site_dispatches_as_expected():
+    urls = generate(FSFIX, fanout=1, depth=0, files=200, wildcards=1)
+    expected = []
+    actual = check(urls, '--list_directories', 'yes')
+    assert actual == expected, actual[:10]
+
+def test_deep_site_dispatches_as_expected():
+    urls = generate(FSFIX, fanout=1, depth=10, files=3, wildcards=0.5)
+    expected = []
+    actual = check(urls, '--list_directories', 'yes')
+    assert actual == expected, actual[:10]
+
+def test_wildcard_heavy_site_dispatches_as_expected():
+    urls = generate(FSFIX, fanout=4, depth=3, files=4, wildcards=0.9)
+    expected = []
+    actual = check(urls, '--list_directories', 'yes')
+    assert actual == expected, actual[:10]
+
+def test_wildcard_heavy_site_dispatches_as_expected_when_cached():
+    urls = generate(FSFIX, fanout=4, depth=3, files=4, wildcards=0.9)
+    expected = []
+    actual = check( sample(urls, 1000)
+                  , '--list_directories', 'yes'
+                  , '--dispatch_cache_size', '64'
+                   )
+    assert actual == expected, actual[:10]
+
+
+# Workloads
+# =========
+
+def test_workloads_round_trip():
+    urls = generate(FSFIX, fanout=2, depth=2, files=2)
+    workload = sample(urls, 50)
+    filepath = FSFIX + '.workload'
+    try:
+        save_workload(workload, filepath)
+        actual = load_workload(filepath)
+    finally:
+        os.remove(filepath)
+    assert actual == workload, actual
+
+def test_sample_has_the_requested_size():
+    urls = generate(FSFIX, fanout=2, depth=1, files=2)
+    expected = 100
+    actual = len(sample(urls, 100))
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
@@ -43,5 +43,18 @@ def test_channel_survives_transportation():
         assert actual is expected, actual
     finally:
         transport.socket.disconnect()
+def test_metrics_lists_sockets_deepest_outgoing_first():
+    mk(('echo.sock', ''))
+    request = make_request()
+    request.socket = '1/'
+    sids = [sockets.get(request).body.split(':')[0] for i in range(2)]
+    try:
+        sockets.__sockets__[sids[1]].send('Greetings, program!')
+        expected = [sids[1], sids[0]]
+        actual = [m['sid'] for m in sockets.metrics()]
+        assert actual == expected, actual
+    finally:
+        sockets.__channels__['/echo.sock'].disconnect_all()
+
 
 attach_teardown(globals())
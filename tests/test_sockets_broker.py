@@ -0,0 +1,190 @@
+from __future__ import with_statement # for Python 2.5
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from socket import SHUT_RDWR, socketpair
+
+import aspen
+from aspen import sockets
+from aspen.sockets.broker import Broker, BrokerBackend, RemoteTransport, \
+                                 write_frame
+from aspen.sockets.buffer import ThreadedBuffer
+from aspen.sockets.channel import Channel
+from aspen.sockets.message import Message
+from aspen.testing.sockets import make_socket
+from aspen.testing.fsfix import attach_teardown, mk
+
+
+PATH = os.path.join(tempfile.gettempdir(), 'aspen-test-broker.sock')
+
+
+class RunningBroker(object):
+
+    def __enter__(self):
+        if os.path.exists(PATH):
+            os.remove(PATH)
+        self.broker = Broker(PATH)
+        thread = threading.Thread(target=self.broker.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.broker
+
+    def __exit__(self, *a):
+        self.broker.shutdown()
+        self.broker.server_close()
+        os.remove(PATH)
+
+
+def wait_for(predicate, timeout=1.0):
+    end = time.time() + timeout
+    while not predicate() and time.time() < end:
+        time.sleep(0.01)
+
+
+def test_broker_relays_publish_to_other_processes():
+    mk(('echo.sock', ''))
+    with RunningBroker() as broker:
+        here = BrokerBackend(PATH)
+        there = BrokerBackend(PATH)
+
+        # "there" has a socket on /echo.sock, and it's listening.
+        socket = make_socket()
+        sockets.__channels__['/echo.sock'] = socket.channel
+        there.claim(socket.sid)
+        wait_for(lambda: len(broker.connections) == 2)
+
+        # "here" has a channel by the same name, but no sockets on it.
+        channel = Channel('/echo.sock', ThreadedBuffer, here)
+        channel.send('Greetings, program!')
+        wait_for(lambda: socket.outgoing.queue)
+
+        expected = deque([Message.from_bytes('3::/echo.sock:Greetings, program!')])
+        actual = socket.outgoing.queue
+        assert actual == expected, actual
+
+def test_broker_routes_calls_to_the_process_with_the_socket():
+    mk(('echo.sock', ''))
+    with RunningBroker() as broker:
+        here = BrokerBackend(PATH)
+        there = BrokerBackend(PATH)
+
+        socket = make_socket()
+        sockets.__sockets__[socket.sid] = socket
+        there.claim(socket.sid)
+        wait_for(lambda: socket.sid in broker.owners)
+
+        expected = [(200, '1:::'), (200, '')]
+        actual = [ here.call(socket.sid, 'GET', '')
+                 , here.call(socket.sid, 'POST', '3::/echo.sock:Greetings!')
+                  ]
+        assert actual == expected, actual
+
+        expected = deque(['Greetings!'])
+        actual = socket.incoming.queue
+        assert actual == expected, actual
+
+def test_broker_answers_400_for_unknown_sid():
+    with RunningBroker() as broker:
+        here = BrokerBackend(PATH)
+        expected = (400, "Expected deadbeef in cache, didn't find it")
+        actual = here.call('deadbeef', 'GET', '')
+        assert actual == expected, actual
+
+def test_locate_finds_sockets_in_other_processes():
+    with RunningBroker() as broker:
+        here = BrokerBackend(PATH)
+        there = BrokerBackend(PATH)
+        there.claim('deadbeef')
+        wait_for(lambda: 'deadbeef' in broker.owners)
+        actual = here.locate('deadbeef')
+        assert isinstance(actual, RemoteTransport), actual
+
+def test_locate_is_None_for_unknown_sid():
+    with RunningBroker() as broker:
+        here = BrokerBackend(PATH)
+        actual = here.locate('deadbeef')
+        assert actual is None, actual
+
+def test_claims_are_made_again_after_reconnecting():
+    with RunningBroker() as broker:
+        there = BrokerBackend(PATH)
+        there.claim('deadbeef')
+        wait_for(lambda: 'deadbeef' in broker.owners)
+        there.sock.shutdown(SHUT_RDWR)     # the broker drops us
+        wait_for(lambda: 'deadbeef' not in broker.owners)
+        wait_for(lambda: there.pid is None)
+        there.claim('cafebabe')
+        wait_for(lambda: len(broker.owners) == 2)
+        expected = ['cafebabe', 'deadbeef']
+        actual = sorted(broker.owners)
+        assert actual == expected, actual
+
+def test_publish_delivers_locally_even_if_it_cant_encode():
+    class Channel:
+        name = '/echo.sock'
+        def deliver(self, method, args):
+            delivered.append((method, args))
+    delivered = []
+    here = BrokerBackend(PATH)
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lambda *a: None
+    try:
+        here.publish(Channel(), 'send', ['\xff'])
+    finally:
+        aspen.log_dammit = log_dammit
+    expected = [('send', ['\xff'])]
+    actual = delivered
+    assert actual == expected, actual
+
+def test_bad_frame_drops_the_connection_and_fails_waiters():
+    here = BrokerBackend(PATH)
+    ours, theirs = socketpair()
+    here.sock, here.pid = ours, os.getpid()
+    waiter = here.waiting[0] = [threading.Event(), None]
+    theirs.sendall("Greetings, program!\n")
+    lines = []
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lines.append
+    try:
+        here.read(ours)
+    finally:
+        aspen.log_dammit = log_dammit
+        theirs.close()
+    expected = (True, None, "Bad frame from the socket broker at %s:" % PATH)
+    actual = (waiter[0].isSet(), here.pid, lines[0])
+    assert actual == expected, actual
+
+def test_publish_is_delivered_through_the_engine():
+    class Engine:
+        def add_callback(self, callback):
+            callbacks.append(callback)
+    callbacks = []
+    delivered = []
+    class Channel:
+        def deliver(self, method, args):
+            delivered.append((method, args))
+    sockets.__channels__['/echo.sock'] = Channel()
+    here = BrokerBackend(PATH, Engine())
+    ours, theirs = socketpair()
+    write_frame(theirs, { 'op': 'publish', 'channel': '/echo.sock'
+                        , 'method': 'send', 'args': [u'Greetings!']
+                         })
+    theirs.close()
+    log_dammit = aspen.log_dammit
+    aspen.log_dammit = lambda *a: None
+    try:
+        here.read(ours)
+        before = list(delivered)
+        for callback in callbacks:
+            callback()
+    finally:
+        aspen.log_dammit = log_dammit
+        del sockets.__channels__['/echo.sock']
+    expected = ([], [('send', ['Greetings!'])])
+    actual = (before, delivered)
+    assert actual == expected, actual
+
+
+attach_teardown(globals())
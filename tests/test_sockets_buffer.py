@@ -1,24 +1,145 @@
+from aspen.configuration import ConfigurationError
 from aspen.sockets import FFFD
 from aspen.sockets.buffer import ThreadedBuffer as Buffer
 from aspen.sockets.message import Message
+from aspen.testing import assert_raises
 from aspen.testing.sockets import make_socket
 from aspen.testing.fsfix import mk, attach_teardown
+from aspen.website import Website
 
 
 def test_buffer_is_instantiable():
     mk(('echo.sock', 'socket.send(socket.recv())'))
     expected = Buffer
-    actual = Buffer(make_socket(), 'foo').__class__
+    actual = Buffer('foo', make_socket()).__class__
     assert actual is expected, actual
 
 def test_can_put_onto_buffer():
     mk(('echo.sock', 'socket.send(socket.recv())'))
-    buffer = Buffer(make_socket(), 'foo')
+    buffer = Buffer('foo', make_socket())
     expected = [FFFD+'4'+FFFD+'1:::']
     buffer.put(Message.from_bytes('1:::'))
     actual = list(buffer.flush())
     assert actual == expected, actual
 
+def make_buffer(**config):
+    mk(('echo.sock', 'socket.send(socket.recv())'))
+    socket = make_socket()
+    for name, value in config.items():
+        setattr(socket.website, 'socket_' + name, value)
+    return Buffer('foo', socket)
+
+def test_buffer_takes_size_from_website():
+    buffer = make_buffer(buffer_size=2)
+    expected = 2
+    actual = buffer.maxsize
+    assert actual == expected, actual
+
+def test_channel_buffer_is_unbounded():
+    expected = 0
+    actual = Buffer('incoming').maxsize
+    assert actual == expected, actual
+
+def test_drop_oldest_policy_drops_oldest():
+    buffer = make_buffer(buffer_size=2, buffer_policy='drop_oldest')
+    for i in range(4):
+        buffer.put(i)
+    expected = ([2, 3], 2)
+    actual = (list(buffer.queue), buffer.ndropped)
+    assert actual == expected, actual
+
+def test_disconnect_policy_disconnects():
+    buffer = make_buffer(buffer_size=2, buffer_policy='disconnect')
+    buffer._socket.loop.start()
+    for i in range(3):
+        buffer.put(i)
+    expected = (True, [0, 1], 1)
+    actual = ( buffer._socket.loop.please_stop.is_set()
+             , list(buffer.queue)
+             , buffer.ndropped
+              )
+    assert actual == expected, actual
+
+def test_block_policy_gives_up_when_socket_stops():
+    buffer = make_buffer(buffer_size=1, buffer_policy='block')
+    buffer.put(0)
+    buffer._socket.loop.please_stop.set()
+    buffer.put(1)
+    expected = ([0], 1)
+    actual = (list(buffer.queue), buffer.ndropped)
+    assert actual == expected, actual
+
+def test_block_policy_still_puts_when_socket_stops_with_room():
+    buffer = make_buffer(buffer_size=2, buffer_policy='block')
+    buffer._socket.loop.please_stop.set()
+    buffer.put(0)
+    expected = ([0], 0)
+    actual = (list(buffer.queue), buffer.ndropped)
+    assert actual == expected, actual
+
+def test_default_policy_drops_oldest():
+    buffer = make_buffer(buffer_size=1)
+    buffer.put(0)
+    buffer.put(1)
+    expected = ([1], 1)
+    actual = (list(buffer.queue), buffer.ndropped)
+    assert actual == expected, actual
+
+def test_block_policy_waits_only_so_long():
+    from aspen.sockets import buffer as module
+    buffer = make_buffer(buffer_size=1, buffer_policy='block')
+    buffer.put(0)
+    seconds, module.BLOCK_SECONDS = module.BLOCK_SECONDS, 0.01
+    try:
+        buffer.put(1)
+    finally:
+        module.BLOCK_SECONDS = seconds
+    expected = ([1], 1)
+    actual = (list(buffer.queue), buffer.ndropped)
+    assert actual == expected, actual
+
+def test_socket_buffer_size_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--socket_buffer_size', '-1'])
+
+def test_socket_flush_bytes_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--socket_flush_bytes', '-1'])
+
+def test_socket_flush_ms_must_be_at_least_zero():
+    assert_raises(ConfigurationError, Website, ['--socket_flush_ms', '-1'])
+
+def test_die_always_fits():
+    from aspen.sockets.loop import Die
+    buffer = make_buffer(buffer_size=1)
+    buffer.put(0)
+    buffer.put(Die)
+    expected = [0, Die]
+    actual = list(buffer.queue)
+    assert actual == expected, actual
+
+def test_flush_respects_byte_budget():
+    buffer = make_buffer(flush_bytes=20)
+    for i in range(3):
+        buffer.put(Message.from_bytes('1:::'))
+    expected = [FFFD+'4'+FFFD+'1:::'+FFFD+'4'+FFFD+'1:::']
+    actual = list(buffer.flush())
+    assert actual == expected, actual
+
+def test_flush_always_sends_one_message():
+    buffer = make_buffer(flush_bytes=1)
+    buffer.put(Message.from_bytes('1:::'))
+    expected = [FFFD+'4'+FFFD+'1:::']
+    actual = list(buffer.flush())
+    assert actual == expected, actual
+
+def test_metrics_report_depth_and_high_water():
+    buffer = make_buffer()
+    for i in range(3):
+        buffer.put(Message.from_bytes('1:::'))
+    buffer.get()
+    expected = {'depth': 2, 'maxsize': 1024, 'high_water': 3, 'dropped': 0}
+    actual = buffer.metrics()
+    assert actual == expected, actual
+
 def test_buffer_flush_performance():
 
     return # This test makes my lap hot.
@@ -51,5 +51,55 @@ def test_channel_passes_send_on_to_four_sockets():
         expected = deque([Message.from_bytes('3::/echo.sock:foo')])
         actual = socket.outgoing.queue
         assert actual == expected, actual
+def test_channel_incoming_is_off_by_default():
+    mk(('echo.sock', ''))
+    channel = Channel('foo', ThreadedBuffer)
+    socket = make_socket(channel=channel)
+    socket._send('3::/echo.sock:foo')
+
+    expected = None
+    actual = channel.incoming
+    assert actual is expected, actual
+
+def test_channel_collects_incoming_once_subscribed():
+    mk(('echo.sock', ''))
+    channel = Channel('foo', ThreadedBuffer)
+    socket = make_socket(channel=channel)
+    channel.subscribe()
+    socket._send('3::/echo.sock:foo')
+
+    expected = deque(['foo'])
+    actual = channel.incoming.queue
+    assert actual == expected, actual
+
+def test_channel_subscribe_is_idempotent():
+    channel = Channel('foo', ThreadedBuffer)
+    expected = channel.subscribe()
+    actual = channel.subscribe()
+    assert actual is expected, actual
+
+def test_channel_incoming_is_a_ring():
+    channel = Channel('foo', ThreadedBuffer)
+    incoming = channel.subscribe(maxsize=2)
+    for i in range(3):
+        incoming.put(i)
+
+    expected = deque([1, 2])
+    actual = incoming.queue
+    assert actual == expected, actual
+
+def test_channel_recv_batch_drains_available_messages():
+    channel = Channel('foo', ThreadedBuffer)
+    incoming = channel.subscribe()
+    for i in range(5):
+        incoming.put(i)
+
+    expected = ([0, 1, 2], [3, 4])
+    actual = (channel.recv_batch(3), channel.recv_batch(3))
+    assert actual == expected, actual
+
+def test_channel_recv_without_subscription_raises_RuntimeError():
+    channel = Channel('foo', ThreadedBuffer)
+    assert_raises(RuntimeError, channel.recv)
 
 attach_teardown(globals())
@@ -119,5 +119,31 @@ def test_event_data_with_reserved_name_raises_ValueError():
     actual = exc.args[0]
     assert actual == expected, actual
 
+def test_json_data_from_the_wire_is_decoded_right_away():
+    assert_raises(ValueError, Message.from_bytes, '4:::{not json')
+
+def test_json_data_set_as_bytes_is_not_decoded_until_accessed():
+    message = Message(4, '', '', '{not json')
+    assert_raises(ValueError, lambda: message.data)
+
+def test_json_data_changed_in_place_is_encoded_afresh():
+    message = Message.from_bytes('4::/cheese.sock:{"foo":"bar"}')
+    message.data['foo'] = 'baz'
+    expected = '4::/cheese.sock:{"foo": "baz"}'
+    actual = str(message)
+    assert actual == expected, actual
+
+def test_json_data_set_as_object_is_encoded():
+    message = Message(4, '', '/cheese.sock', {"foo": "bar"})
+    expected = '4::/cheese.sock:{"foo": "bar"}'
+    actual = str(message)
+    assert actual == expected, actual
+
+def test_json_data_set_as_bytes_passes_through_untouched():
+    message = Message(4, '', '/cheese.sock', '{"foo":"bar"}')
+    expected = '4::/cheese.sock:{"foo":"bar"}'
+    actual = str(message)
+    assert actual == expected, actual
+
 
 attach_teardown(globals())
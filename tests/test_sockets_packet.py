@@ -1,5 +1,5 @@
 from aspen.sockets import FFFD
-from aspen.sockets.packet import Packet
+from aspen.sockets.packet import Packet, encode
 from aspen.sockets.message import Message
 from aspen.testing import assert_raises, attach_teardown
 
@@ -31,5 +31,52 @@ def test_packet_with_odd_frames_tells_you_that():
     actual = exc.args[0]
     assert actual == expected, actual
 
+def test_packet_respects_declared_length_when_data_contains_FFFD():
+    bytes = '3:::' + FFFD
+    expected = [Message.from_bytes(bytes)]
+    actual = list(Packet(FFFD+'5'+FFFD+bytes))
+    assert actual == expected, repr(actual)
+
+def test_packet_length_is_in_characters_not_bytes():
+    bytes = u'3:::\u00e9'.encode('utf-8')
+    expected = [Message.from_bytes(bytes), Message.from_bytes('1:::')]
+    actual = list(Packet(FFFD+'5'+FFFD+bytes+FFFD+'4'+FFFD+'1:::'))
+    assert actual == expected, repr(actual)
+
+def test_packet_shorter_than_declared_length_raises_SyntaxError():
+    Packet_ = lambda s: list(Packet(s))
+    exc = assert_raises(SyntaxError, Packet_, FFFD+'40'+FFFD+'0:::')
+    expected = "This packet is shorter than its frames claim: %s"
+    expected %= FFFD+'40'+FFFD+'0:::'
+    actual = exc.args[0]
+    assert actual == expected, actual
+
+def test_packet_with_non_numeric_length_raises_SyntaxError():
+    Packet_ = lambda s: list(Packet(s))
+    assert_raises(SyntaxError, Packet_, FFFD+'four'+FFFD+'0:::')
+
+def test_packet_with_garbage_between_frames_raises_SyntaxError():
+    Packet_ = lambda s: list(Packet(s))
+    assert_raises(SyntaxError, Packet_, FFFD+'4'+FFFD+'0:::'+'1:::')
+
+def test_packet_yields_messages_lazily():
+    packet = iter(Packet(FFFD+'4'+FFFD+'0:::'+FFFD+'40'+FFFD+'1:::'))
+    expected = Message.from_bytes('0:::')
+    actual = packet.next()
+    assert actual == expected, actual
+
+def test_encode_roundtrips():
+    messages = [Message.from_bytes(x) for x in ('0:::', u'3:::\ufffd'.encode('utf-8'))]
+    expected = messages
+    actual = list(Packet(encode(messages)))
+    assert actual == expected, repr(actual)
+
+def test_encode_leaves_messages_past_max_bytes():
+    messages = iter([Message.from_bytes('1:::') for i in range(3)])
+    encoded = encode(messages, 20)
+    expected = (2, 1)
+    actual = (len(list(Packet(encoded))), len(list(messages)))
+    assert actual == expected, actual
+
 
 attach_teardown(globals())
@@ -0,0 +1,177 @@
+from __future__ import with_statement
+
+import socket
+
+import aspen
+from aspen.configuration import ConfigurationError
+from aspen.http.request import Request
+from aspen.testing import assert_raises
+from aspen.testing.fsfix import attach_teardown, fix, FSFIX, mk
+from aspen.tracing import NULL_TRACE, parse_traceparent
+from aspen.website import Website
+
+
+TRACEPARENT = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+
+SIMPLATE = """\
+with request.trace.span('db.query', table='users'):
+    users = ['chad']
+^L
+{{ users[0] }}""".replace('^L', '\x0c')
+
+
+def Site(*argv):
+    mk( ('index.html', "Greetings, program!")
+      , ('users.html', SIMPLATE)
+       )
+    return Website([ '--www_root', FSFIX
+                   , '--trace_export', fix('spans.jsonl')
+                    ] + list(argv))
+
+def serve(website, uri='/', traceparent=None):
+    headers = 'Host: localhost'
+    if traceparent is not None:
+        headers += '\r\ntraceparent: ' + traceparent
+    request = Request(uri=uri, headers=headers)
+    response = website.handle_safely(request)
+    return request, response
+
+def spans(website):
+    website.tracer.flush()
+    try:
+        fp = open(fix('spans.jsonl'))
+    except IOError:
+        return []
+    return [aspen.json.loads(line) for line in fp]
+
+
+# traceparent
+# ===========
+
+def test_parse_traceparent_parses():
+    expected = ( '4bf92f3577b34da6a3ce929d0e0e4736'
+               , '00f067aa0ba902b7'
+               , True
+                )
+    actual = parse_traceparent(TRACEPARENT)
+    assert actual == expected, actual
+
+def test_parse_traceparent_rejects_garbage():
+    expected = [None, None, None]
+    actual = [ parse_traceparent('Greetings, program!')
+             , parse_traceparent('00-' + '0' * 32 + '-00f067aa0ba902b7-01')
+             , parse_traceparent('ff' + TRACEPARENT[2:])
+              ]
+    assert actual == expected, actual
+
+
+# Tracing
+# =======
+
+def test_tracing_is_off_by_default():
+    mk(('index.html', "Greetings, program!"))
+    website = Website(['--www_root', FSFIX])
+    request, response = serve(website)
+    expected = (None, NULL_TRACE, None)
+    actual = ( website.tracer
+             , request.trace
+             , response.headers.get('traceresponse')
+              )
+    assert actual == expected, actual
+
+def test_null_trace_takes_spans_too():
+    with NULL_TRACE.span('foo', bar='baz') as span:
+        span.set(buz='bloo')
+    assert NULL_TRACE.traceparent() is None
+
+def test_request_gets_a_tree_of_spans():
+    website = Site()
+    request, response = serve(website, '/users.html')
+    records = spans(website)
+    root = [s for s in records if s['name'] == 'request'][0]
+    expected = ( [ 'db.query', 'dispatch', 'hooks.inbound_early'
+                 , 'hooks.inbound_late', 'hooks.outbound_early'
+                 , 'hooks.outbound_late', 'page.exec', 'render', 'request'
+                 , 'resource.load'
+                  ]
+               , None
+               , 200
+                )
+    actual = ( sorted([s['name'] for s in records])
+             , root['parent_id']
+             , root['attributes']['code']
+              )
+    assert actual == expected, actual
+    for span in records:
+        assert span['trace_id'] == request.trace.trace_id, span
+        if span['name'] not in ('request', 'db.query'):
+            assert span['parent_id'] == root['span_id'], span
+
+def test_simplates_can_add_spans():
+    website = Site()
+    serve(website, '/users.html')
+    serve(website, '/users.html')
+    records = spans(website)
+    queries = [s for s in records if s['name'] == 'db.query']
+    execs = [s['span_id'] for s in records if s['name'] == 'page.exec']
+    expected = [({'table': 'users'}, True)] * 2
+    actual = [(s['attributes'], s['parent_id'] in execs) for s in queries]
+    assert actual == expected, actual
+
+def test_incoming_traceparent_is_joined():
+    website = Site()
+    request, response = serve(website, traceparent=TRACEPARENT)
+    root = [s for s in spans(website) if s['name'] == 'request'][0]
+    expected = ( '4bf92f3577b34da6a3ce929d0e0e4736'
+               , '00f067aa0ba902b7'
+               , '00-4bf92f3577b34da6a3ce929d0e0e4736-%s-01' % root['span_id']
+                )
+    actual = ( root['trace_id']
+             , root['parent_id']
+             , response.headers.get('traceresponse')
+              )
+    assert actual == expected, actual
+
+def test_unsampled_incoming_traceparent_is_passed_along_but_not_recorded():
+    website = Site()
+    request, response = serve(website, traceparent=TRACEPARENT[:-2] + '00')
+    expected = ([], TRACEPARENT[:-2] + '00')
+    actual = (spans(website), response.headers.get('traceresponse'))
+    assert actual == expected, actual
+
+def test_trace_sample_zero_records_nothing():
+    website = Site('--trace_sample', '0')
+    serve(website)
+    expected = []
+    actual = spans(website)
+    assert actual == expected, actual
+
+def test_spans_can_go_to_udp():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(5)
+    port = receiver.getsockname()[1]
+    try:
+        website = Site('--trace_export', 'udp:127.0.0.1:%d' % port)
+        serve(website)
+        website.tracer.flush()
+        datagram = receiver.recv(65536)
+    finally:
+        receiver.close()
+    names = [aspen.json.loads(line)['name'] for line in datagram.splitlines()]
+    assert 'request' in names, names
+
+def test_trace_export_must_make_sense():
+    mk()
+    assert_raises(ConfigurationError, Website, [ '--www_root', FSFIX
+                                               , '--trace_export', 'udp:foo'
+                                                ])
+
+def test_trace_sample_must_be_a_percentage():
+    mk()
+    assert_raises(ConfigurationError, Website, [ '--www_root', FSFIX
+                                               , '--trace_sample', '101'
+                                                ])
+
+
+attach_teardown(globals())
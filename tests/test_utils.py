@@ -1,6 +1,7 @@
 import aspen.utils # this happens to install the 'repr' error strategy
 from aspen.testing import assert_raises, attach_teardown
 from aspen.utils import ascii_dammit, unicode_dammit, to_age, utcnow
+from aspen.utils import LRU, Stopwatch
 from datetime import datetime
 
 GARBAGE = "\xef\xf9"
@@ -46,4 +47,31 @@ def test_to_age_formatting_works():
     actual = to_age(utcnow(), fmt_past="Cheese, for %(age)s!")
     assert actual == "Cheese, for just a moment!", actual
 
+def test_stopwatch_reports_total_and_laps():
+    watch = Stopwatch()
+    watch.started = 0.0
+    watch.last = 0.0
+    watch.laps = [('foo', 0.0125), ('bar', 0.5)]
+    watch.last = 0.5125
+    expected = "512.5 ms (foo 12.5 ms, bar 500.0 ms)"
+    actual = str(watch)
+    assert actual == expected, actual
+
+def test_lru_forgets_the_least_recently_used():
+    cache = LRU(2)
+    cache['foo'] = 1
+    cache['bar'] = 2
+    cache.get('foo')
+    cache['baz'] = 3
+    expected = (['baz', 'foo'], 1, 0)
+    actual = (sorted(cache.links), cache.nhits, cache.nmisses)
+    assert actual == expected, actual
+
+def test_lru_of_size_zero_remembers_nothing():
+    cache = LRU(0)
+    cache['foo'] = 1
+    expected = None
+    actual = cache.get('foo')
+    assert actual == expected, actual
+
 attach_teardown(globals())
@@ -1,6 +1,7 @@
 import os
 
-from aspen.testing import handle, StubRequest
+from aspen.configuration import ConfigurationError
+from aspen.testing import assert_raises, handle, StubRequest
 from aspen.testing.fsfix import attach_teardown, FSFIX, mk
 from aspen.website import Website
 
@@ -90,4 +91,64 @@ def bar(response):
     assert actual == expected, actual
 
 
+# Error pages
+# ===========
+
+def test_plain_errors_skip_the_error_page():
+    mk(('index.html', "from aspen import Responseraise Response(404)"))
+    response = handle('/', '--plain_errors', '404,405')
+    expected = (404, '404 Not Found', 'text/plain')
+    actual = (response.code, response.body, response.headers['Content-Type'])
+    assert actual == expected, actual
+
+def test_plain_errors_keep_a_body_if_there_is_one():
+    mk(('index.html', "from aspen import Response"
+                      "raise Response(404, 'Nope.')"))
+    expected = 'Nope.'
+    actual = handle('/', '--plain_errors', '404').body
+    assert actual == expected, actual
+
+def test_plain_errors_dont_leak_tracebacks():
+    mk(('index.html', "raise heck"))
+    response = handle( '/', '--plain_errors', '500'
+                     , '--show_tracebacks', '0'
+                      )
+    expected = (500, '500 Internal Server Error')
+    actual = (response.code, response.body)
+    assert actual == expected, actual
+
+def test_plain_errors_show_tracebacks_if_asked():
+    mk(('index.html', "raise heck"))
+    response = handle( '/', '--plain_errors', '500'
+                     , '--show_tracebacks', '1'
+                      )
+    assert response.body.startswith('Traceback'), response.body
+
+def test_other_codes_still_get_the_error_page():
+    mk(('index.html', "from aspen import Responseraise Response(404)"))
+    response = handle('/', '--plain_errors', '500')
+    assert '<html>' in response.body.lower(), response.body
+
+def test_plain_errors_must_be_status_codes():
+    assert_raises(ConfigurationError, Website, ['--plain_errors', 'foo'])
+
+def test_error_pages_are_looked_up_once():
+    website = Website([])
+    website.ours_or_theirs('404.html')
+    website.ours_or_theirs('error.html')
+    website.ours_or_theirs('error.html')
+    expected = { '404.html': None
+               , 'error.html': website.find_ours('error.html')
+                }
+    actual = website.found_files
+    assert actual == expected, actual
+
+def test_error_pages_are_looked_up_every_time_with_changes_reload():
+    website = Website(['--changes_reload', 'yes'])
+    website.ours_or_theirs('error.html')
+    expected = {}
+    actual = website.found_files
+    assert actual == expected, actual
+
+
 attach_teardown(globals())